@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+
+# Copyright 2016 The Jackson Laboratory
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Time the pipeline parse and submission hot paths on synthetic pipelines.
+
+For every requested pipeline shape (see synthetic.py) and stage, the
+pipeline is generated in a scratch directory and processed in a new Python
+process, since the pipeline_parse singleton can only parse one pipeline.
+The stages are:
+
+  parse:         Pipeline.parse_XML
+  task_list:     Pipeline.create_task_list (managed mode)
+  write_scripts: Pipeline.submit with submit_jobs=False, which writes the
+                 batch scripts but fakes the job IDs
+  submit:        Pipeline.submit against the in-process Torque emulator
+                 (lib/torque_emulator), with jobs left queued
+  insert_tasks:  managed_batch.prepare.insert_tasks into a new task file
+
+Results are written as JSON, one entry per shape and stage with the
+individual and summary timings in seconds.  Run it before and after a
+change (using --label to tell the runs apart) and compare the medians.
+"""
+
+from __future__ import print_function
+
+import argparse
+import datetime
+import inspect
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+cmd_folder = os.path.realpath(os.path.abspath(os.path.split(inspect.getfile(
+    inspect.currentframe()))[0]))
+lib_folder = os.path.join(cmd_folder, '../lib')
+emulator_folder = os.path.join(lib_folder, 'torque_emulator')
+if lib_folder not in sys.path:
+    sys.path.insert(0, lib_folder)
+
+import synthetic
+
+
+STAGES = ['parse', 'task_list', 'write_scripts', 'submit', 'insert_tasks']
+
+
+def run_stage(stage, pipeline, result_file, job_arrays, fuse_chains):
+    """
+    Run a single stage in this process and write its timings to result_file.
+    """
+    # never talk to a real pbs_server, even if pbs_python is installed
+    sys.path.insert(0, emulator_folder)
+    import emulator
+    emulator.configure(run_jobs=False)
+
+    import pipeline_parse as PL
+    from exec_modes import ToolExecModes
+
+    result = {}
+    start = time.time()
+    PL._parse_XML(pipeline, [], skip_validation=True,
+                  submit_jobs=(stage == 'submit'), completion_mail=False,
+                  error_email=False, job_arrays=job_arrays,
+                  fuse_chains=fuse_chains)
+    result['parse_seconds'] = time.time() - start
+
+    if stage == 'parse':
+        result['seconds'] = result['parse_seconds']
+    elif stage == 'task_list':
+        PL.execution_mode = ToolExecModes.BATCH_MANAGED
+        start = time.time()
+        tasks = PL.create_task_list()
+        result['seconds'] = time.time() - start
+        result['jobs'] = len(tasks)
+    elif stage in ('write_scripts', 'submit'):
+        start = time.time()
+        submitted = PL.submit(silent=True)
+        result['seconds'] = time.time() - start
+        result['jobs'] = len(submitted['job_ids'])
+    elif stage == 'insert_tasks':
+        from managed_batch.prepare import initialize_task_file, insert_tasks
+        task_file = os.path.join(os.path.dirname(pipeline), "tasks.db")
+        initialize_task_file(task_file)
+        start = time.time()
+        result['jobs'] = insert_tasks(PL, task_file)
+        result['seconds'] = time.time() - start
+
+    with open(result_file, 'w') as f:
+        json.dump(result, f)
+
+
+def time_stage(stage, shape, shape_args, work_dir, args):
+    """
+    Generate the pipeline and run one stage in a child process.
+    :return: the stage's result dictionary
+    :raises RuntimeError: if the stage failed
+    """
+    pipeline = synthetic.generate(shape, work_dir, **shape_args)
+    result_file = os.path.join(work_dir, "result.json")
+    cmd = [sys.executable, os.path.abspath(__file__), '--run-stage', stage,
+           '--pipeline', pipeline, '--result-file', result_file]
+    if args.job_arrays:
+        cmd.append('--job-arrays')
+    if args.fuse_chains:
+        cmd.append('--fuse-chains')
+
+    with open(os.devnull, 'w') as devnull:
+        child = subprocess.Popen(cmd, cwd=work_dir, stdout=devnull,
+                                 stderr=subprocess.PIPE)
+        _, err = child.communicate()
+    if child.returncode != 0 or not os.path.exists(result_file):
+        lines = err.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else
+                           "exit status {0}".format(child.returncode))
+    with open(result_file) as f:
+        return json.load(f)
+
+
+def summarize(times):
+    ordered = sorted(times)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        median = ordered[middle]
+    else:
+        median = (ordered[middle - 1] + ordered[middle]) / 2.0
+    return {
+        'min': ordered[0],
+        'max': ordered[-1],
+        'mean': sum(ordered) / len(ordered),
+        'median': median
+    }
+
+
+def shape_parameters(shape, args):
+    if shape == 'wide':
+        return {'width': args.width}
+    if shape == 'deep':
+        return {'depth': args.depth}
+    return {'files': args.files, 'related': args.related, 'tools': args.tools}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark pipeline parsing and submission on synthetic "
+                    "pipelines")
+    parser.add_argument('--shape', action='append', choices=synthetic.SHAPES,
+                        help="pipeline shape to benchmark, can be repeated "
+                             "[default = all shapes]")
+    parser.add_argument('--stage', action='append', choices=STAGES,
+                        help="stage to time, can be repeated "
+                             "[default = all stages]")
+    parser.add_argument('--width', type=int, default=200,
+                        help="tools in the step of the 'wide' shape "
+                             "[%(default)s]")
+    parser.add_argument('--depth', type=int, default=200,
+                        help="steps in the 'deep' shape [%(default)s]")
+    parser.add_argument('--files', type=int, default=100,
+                        help="input files for the 'foreach' shape "
+                             "[%(default)s]")
+    parser.add_argument('--related', type=int, default=3,
+                        help="related files per input file for the 'foreach' "
+                             "shape [%(default)s]")
+    parser.add_argument('--tools', type=int, default=3,
+                        help="tools per input file for the 'foreach' shape "
+                             "[%(default)s]")
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help="number of times to run each stage "
+                             "[%(default)s]")
+    parser.add_argument('--job-arrays', action='store_true',
+                        help="submit foreach steps as job arrays")
+    parser.add_argument('--fuse-chains', action='store_true',
+                        help="fuse linear chains of jobs")
+    parser.add_argument('--label', default=None,
+                        help="label recorded in the results, e.g. the change "
+                             "being measured")
+    parser.add_argument('--work-dir', default=None,
+                        help="scratch directory, kept after the run "
+                             "[default = a temporary directory]")
+    parser.add_argument('-o', '--output', default=None,
+                        help="write the JSON results to this file "
+                             "[default = stdout]")
+    parser.add_argument('--run-stage', choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument('--pipeline', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        run_stage(args.run_stage, args.pipeline, args.result_file,
+                  args.job_arrays, args.fuse_chains)
+        return 0
+
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="civet_benchmark.")
+    shapes = args.shape or synthetic.SHAPES
+    stages = args.stage or STAGES
+
+    import version
+    report = {
+        'label': args.label,
+        'civet_version': version.version_from_git(),
+        'python': platform.python_version(),
+        'host': socket.gethostname(),
+        'date': datetime.datetime.now().isoformat(),
+        'job_arrays': args.job_arrays,
+        'fuse_chains': args.fuse_chains,
+        'results': []
+    }
+
+    failed = False
+    for shape in shapes:
+        shape_args = shape_parameters(shape, args)
+        for stage in stages:
+            entry = {'shape': shape, 'parameters': shape_args, 'stage': stage}
+            times = []
+            try:
+                for i in range(args.repeat):
+                    run_dir = os.path.join(work_dir, "{0}-{1}-{2}".format(
+                        shape, stage, i))
+                    result = time_stage(stage, shape, shape_args, run_dir,
+                                        args)
+                    times.append(result['seconds'])
+                    if 'jobs' in result:
+                        entry['jobs'] = result['jobs']
+            except RuntimeError as e:
+                entry['error'] = str(e)
+                failed = True
+            else:
+                entry['times'] = times
+                entry.update(summarize(times))
+            print("{0} {1}: {2}".format(
+                shape, stage, entry.get('error') or
+                "median {0:.3f}s".format(entry['median'])), file=sys.stderr)
+            report['results'].append(entry)
+
+    if not args.work_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
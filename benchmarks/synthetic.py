@@ -0,0 +1,148 @@
+# Copyright 2016 The Jackson Laboratory
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Generate synthetic pipeline and tool XML for benchmarking.
+
+Each shape is written to its own directory, containing the pipeline XML, the
+tool XML it uses, and the input files the pipeline expects:
+
+  wide:    a single step of `width` independent tools that all read the
+           same input file
+  deep:    a chain of `depth` steps, each tool reads the output of the
+           tool in the previous step
+  foreach: a foreach over `files` input files, each with `related` related
+           files, and a step of `tools` tools.  The first tool reads the
+           input file, tool k writes related file k % related and tool k+1
+           reads it, so with related >= tools the tools form a chain.  A final
+           step merges the last related file of every input.
+"""
+
+import os
+from xml.sax.saxutils import quoteattr
+
+
+SHAPES = ['wide', 'deep', 'foreach']
+
+TOOL_XML = """<tool name="bench" threads="1" walltime="00:10:00" mem="1">
+    <description>synthetic benchmark tool</description>
+    <command program="cat">{in_1} > {out_1}</command>
+</tool>
+"""
+
+MERGE_TOOL_XML = """<tool name="bench_merge" threads="1" walltime="00:10:00" mem="1">
+    <description>synthetic benchmark merge tool</description>
+    <command program="cat">{in_1} > {out_1}</command>
+</tool>
+"""
+
+
+def _tool(name, inputs, outputs, description="bench_tool.xml"):
+    return '<tool name={0} input={1} output={2} description={3} />'.format(
+        quoteattr(name), quoteattr(','.join(inputs)),
+        quoteattr(','.join(outputs)), quoteattr(description))
+
+
+def _wide(lines, input_dir, width):
+    lines.append('    <file id="in" filespec={0} input="true" />'.format(
+        quoteattr(os.path.join(input_dir, "in.txt"))))
+    for i in range(width):
+        lines.append('    <file id="w{0}" filespec="w{0}.txt" />'.format(i))
+    lines.append('    <step name="wide">')
+    for i in range(width):
+        lines.append('        ' + _tool("w{0}".format(i), ["in"],
+                                        ["w{0}".format(i)]))
+    lines.append('    </step>')
+
+
+def _deep(lines, input_dir, depth):
+    lines.append('    <file id="d0" filespec={0} input="true" />'.format(
+        quoteattr(os.path.join(input_dir, "in.txt"))))
+    for i in range(1, depth + 1):
+        lines.append('    <file id="d{0}" filespec="d{0}.txt" />'.format(i))
+    for i in range(1, depth + 1):
+        lines.append('    <step name="deep{0}">'.format(i))
+        lines.append('        ' + _tool("d{0}".format(i),
+                                        ["d{0}".format(i - 1)],
+                                        ["d{0}".format(i)]))
+        lines.append('    </step>')
+
+
+def _foreach(lines, input_dir, related, tools):
+    lines.append('    <dir id="indir" filespec={0} input="true" />'.format(
+        quoteattr(input_dir)))
+    lines.append('    <foreach id="fe" dir="indir">')
+    lines.append('        <file id="in" pattern=".*\\.txt$" />')
+    for i in range(related):
+        lines.append('        <related id="r{0}" input="false" '
+                     'pattern="\\.txt$" replace=".r{0}" />'.format(i))
+    lines.append('        <step name="fe_step">')
+    previous = "in"
+    for k in range(tools):
+        output = "r{0}".format(k % related)
+        lines.append('            ' + _tool("t{0}".format(k), [previous],
+                                            [output]))
+        previous = output
+    lines.append('        </step>')
+    lines.append('    </foreach>')
+    lines.append('    <filelist id="merge_in" in_dir="out" '
+                 'pattern=".*\\.r{0}$" foreach_id="fe" />'.format(
+                     (tools - 1) % related))
+    lines.append('    <file id="merged" filespec="merged.txt" />')
+    lines.append('    <step name="merge">')
+    lines.append('        ' + _tool("merge", ["merge_in"], ["merged"],
+                                    "bench_merge_tool.xml"))
+    lines.append('    </step>')
+
+
+def generate(shape, directory, width=100, depth=100, files=100, related=3,
+             tools=3):
+    """
+    Write a synthetic pipeline to directory.
+
+    :param shape: one of SHAPES
+    :param directory: directory to write to, created if necessary
+    :return: path to the pipeline XML
+    """
+    if shape not in SHAPES:
+        raise ValueError("Unknown pipeline shape: '{0}'".format(shape))
+
+    directory = os.path.abspath(directory)
+    input_dir = os.path.join(directory, "input")
+    if not os.path.exists(input_dir):
+        os.makedirs(input_dir)
+
+    input_files = files if shape == 'foreach' else 1
+    for i in range(input_files):
+        name = "in.txt" if shape != 'foreach' else "f{0:06d}.txt".format(i)
+        open(os.path.join(input_dir, name), 'w').close()
+
+    lines = ['<pipeline name="bench_{0}">'.format(shape),
+             '    <dir id="out" filespec={0} default_output="true" />'.format(
+                 quoteattr(os.path.join(directory, "out")))]
+    if shape == 'wide':
+        _wide(lines, input_dir, width)
+    elif shape == 'deep':
+        _deep(lines, input_dir, depth)
+    else:
+        _foreach(lines, input_dir, related, tools)
+    lines.append('</pipeline>')
+
+    with open(os.path.join(directory, "bench_tool.xml"), 'w') as f:
+        f.write(TOOL_XML)
+    with open(os.path.join(directory, "bench_merge_tool.xml"), 'w') as f:
+        f.write(MERGE_TOOL_XML)
+    pipeline = os.path.join(directory, "bench_{0}.xml".format(shape))
+    with open(pipeline, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    return pipeline
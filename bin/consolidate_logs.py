@@ -168,6 +168,15 @@ def main():
     process_file_list(dir, errs, 'concatenated_stderr.txt')
     process_file_list(dir, versions, 'concatenated_versions.txt')
 
+    # the jobs' version logs refer to the output of the version commands,
+    # which is shared by the jobs running the same command
+    versions_dir = os.path.join(dir, 'versions')
+    if os.path.isdir(versions_dir):
+        with open(os.path.join(dir, 'concatenated_versions.txt'), 'a') as of:
+            for fn in sorted(os.listdir(versions_dir)):
+                output_file(os.path.join('versions', fn), dir, of)
+        os.rmdir(versions_dir)
+
     handle_batch_errs(dir, batch_stderr)
 
 
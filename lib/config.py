@@ -35,7 +35,24 @@ __valid_params = [
     'io_sync_sleep',
     'civet_python',
     'purge_user_modulefiles',
-    'default_modules'
+    'default_modules',
+    'submit_threads',
+    'job_array_slot_limit',
+    'max_job_dependencies',
+    'critical_path_priority',
+    'batch_system',
+    'local_max_cores',
+    'local_max_mem',
+    'release_wave_size',
+    'release_wave_interval',
+    'release_max_queued',
+    'release_in_background',
+    'resource_history_file',
+    'autosize_percentile',
+    'autosize_margin',
+    'autosize_min_samples',
+    'local_temp',
+    'module_snapshots'
 ]
 
 for param in __config.keys():
@@ -64,3 +81,71 @@ else:
 
 default_modules = __config.get('default_modules', [])
 
+submit_threads = __config.get('submit_threads', 4)
+if not isinstance(submit_threads, int) or submit_threads < 1:
+    raise ValueError("submit_threads must be an integer >= 1")
+
+job_array_slot_limit = __config.get('job_array_slot_limit', 0)
+if not isinstance(job_array_slot_limit, int) or job_array_slot_limit < 0:
+    raise ValueError("job_array_slot_limit must be an integer >= 0")
+
+max_job_dependencies = __config.get('max_job_dependencies', 100)
+if not isinstance(max_job_dependencies, int) or max_job_dependencies < 0 or max_job_dependencies == 1:
+    raise ValueError("max_job_dependencies must be 0 or an integer >= 2")
+
+critical_path_priority = __config.get('critical_path_priority', True)
+if not isinstance(critical_path_priority, bool):
+    raise ValueError("critical_path_priority must be a boolean")
+
+batch_system = __config.get('batch_system', 'torque')
+if batch_system not in ['torque', 'slurm', 'local']:
+    raise ValueError("batch_system must be \"torque\", \"slurm\" or \"local\"")
+
+local_max_cores = __config.get('local_max_cores', 0)
+if not isinstance(local_max_cores, int) or local_max_cores < 0:
+    raise ValueError("local_max_cores must be an integer >= 0")
+
+local_max_mem = __config.get('local_max_mem', 0)
+if not isinstance(local_max_mem, int) or local_max_mem < 0:
+    raise ValueError("local_max_mem must be an integer >= 0")
+
+release_wave_size = __config.get('release_wave_size', 0)
+if not isinstance(release_wave_size, int) or release_wave_size < 0:
+    raise ValueError("release_wave_size must be an integer >= 0")
+
+release_wave_interval = __config.get('release_wave_interval', 0)
+if not isinstance(release_wave_interval, int) or release_wave_interval < 0:
+    raise ValueError("release_wave_interval must be an integer >= 0")
+
+release_max_queued = __config.get('release_max_queued', 0)
+if not isinstance(release_max_queued, int) or release_max_queued < 0:
+    raise ValueError("release_max_queued must be an integer >= 0")
+
+release_in_background = __config.get('release_in_background', True)
+if not isinstance(release_in_background, bool):
+    raise ValueError("release_in_background must be a boolean")
+
+resource_history_file = __config.get('resource_history_file',
+                                     '~/.civet/resource_history.json')
+if not isinstance(resource_history_file, utilities.string_types):
+    raise ValueError("resource_history_file must be a string")
+
+autosize_percentile = __config.get('autosize_percentile', 95)
+if not isinstance(autosize_percentile, int) or not 50 <= autosize_percentile <= 100:
+    raise ValueError("autosize_percentile must be an integer from 50 to 100")
+
+autosize_margin = __config.get('autosize_margin', 20)
+if not isinstance(autosize_margin, int) or autosize_margin < 0:
+    raise ValueError("autosize_margin must be an integer >= 0")
+
+autosize_min_samples = __config.get('autosize_min_samples', 5)
+if not isinstance(autosize_min_samples, int) or autosize_min_samples < 1:
+    raise ValueError("autosize_min_samples must be an integer >= 1")
+
+local_temp = __config.get('local_temp', False)
+if not isinstance(local_temp, bool):
+    raise ValueError("local_temp must be a boolean")
+
+module_snapshots = __config.get('module_snapshots', False)
+if not isinstance(module_snapshots, bool):
+    raise ValueError("module_snapshots must be a boolean")
@@ -21,11 +21,13 @@ class ToolExecModes(object):
     BATCH_STANDARD = 1
     BATCH_MANAGED = 2
     CLOUD_GCP = 3
+    LOCAL = 4
 
     _strings = {
         BATCH_STANDARD: "Standard Batch",
         BATCH_MANAGED: "Managed Batch",
-        CLOUD_GCP: "Google Cloud Platform"
+        CLOUD_GCP: "Google Cloud Platform",
+        LOCAL: "Local"
     }
 
     def __init__(self):
@@ -44,6 +46,9 @@ class ToolExecModes(object):
         elif os.path.exists(os.path.join(log_dir,
                                          job_runner.common.GCP_MODE_FLAG)):
             return ToolExecModes.CLOUD_GCP
+        elif os.path.exists(os.path.join(log_dir,
+                                         job_runner.common.LOCAL_MODE_FLAG)):
+            return ToolExecModes.LOCAL
         elif os.path.exists(os.path.join(log_dir,
                                          job_runner.common.NO_SUB_FLAG)):
             return ToolExecModes.NO_SUB
@@ -17,7 +17,7 @@ import xml.etree.ElementTree as ET
 # Pipeline components
 from step import *
 from pipeline_file import *
-from job_runner.torque import *
+from job_runner.batch_job import *
 from civet_exceptions import *
 from exec_modes import ToolExecModes
 
@@ -38,7 +38,8 @@ class ForEach(object):
     # to prevent a user from flooding the system we impose a limit on the
     # maximum number of jobs that can be created by one foreach instance
     # when we are executing in the standard batch mode. Does not currently apply
-    # for managed or cloud run-times
+    # for managed or cloud run-times, or when the iterations are submitted as
+    # job arrays
     MAX_JOBS = 500
 
     def __init__(self, e, pipeline_files):
@@ -178,7 +179,12 @@ class ForEach(object):
                     total_jobs += 1
         total_jobs *= len(matched_files)
 
-        if total_jobs > ForEach.MAX_JOBS:
+        # when the iterations are submitted as job arrays, each tool is a
+        # single submission no matter how many files we match.  The limit
+        # then applies to the jobs that can't share an array, which are only
+        # known once every iteration has been queued
+        use_arrays = PL.job_runner.uses_job_arrays()
+        if total_jobs > ForEach.MAX_JOBS and not use_arrays:
             PL.abort_submit("error submitting foreach: {} jobs exceed limit "
                             "(max = {})\n".format(total_jobs, ForEach.MAX_JOBS))
 
@@ -186,7 +192,6 @@ class ForEach(object):
             iteration += 1
             cleanups = []
             files_to_delete = []
-            iteration_ids = []
 
             if fn.startswith('/'):
                 in_dir = None
@@ -222,6 +227,10 @@ class ForEach(object):
                     files_to_delete.append(rel.id)
             PipelineFile.finalize_file_paths(self.pipelineFiles)
 
+            # the jobs of each iteration are an element of the job arrays for
+            # this foreach (if the job runner uses job arrays)
+            PL.job_runner.begin_array_element(name_prefix, iteration)
+
             step_iteration = 0
             for s in self.steps:
                 step_iteration += 1
@@ -229,31 +238,30 @@ class ForEach(object):
                 prefix = "{}-{}_S{}".format(name_prefix, iteration, step_iteration)
                 for jid in step.submit(prefix):
                     job_ids.append(jid)
-                    iteration_ids.append(jid)
-
-            #submit a job that deletes all of the temporary files
-            tmps = []
-            for id in files_to_delete:
-                tmps.append(self.pipelineFiles[id].path)
-
-            if len(tmps):
-                cmd = 'rm -f ' + ' '.join(tmps)
-                cleanup_job = BatchJob(cmd, workdir=PipelineFile.get_output_dir(),
-                               depends_on=iteration_ids,
-                               name="{}-{}_temp_file_cleanup".format(name_prefix, iteration),
-                               walltime="00:30:00",
-                               email_list=PL.error_email_address)
 
-                try:
-                    cleanup_job_id = PL.job_runner.queue_job(cleanup_job)
-                except Exception as e:
-                    PL.abort_submit(e, PL.BATCH_ERROR)
+            # submit jobs that delete the temporary files as soon as the
+            # jobs that use them are done
+            if not PL.keep_temp:
+                deletions = PL.temp_file_deletions(self.pipelineFiles,
+                                                   files_to_delete)
+                for n, (paths, jobs) in enumerate(deletions, 1):
+                    name = "{}-{}_temp_file_cleanup{}".format(name_prefix,
+                                                              iteration, n)
+                    PL.all_batch_jobs.append(
+                        PL.submit_temp_file_cleanup(name, paths, jobs))
 
-                PL.all_batch_jobs.append(cleanup_job_id)
+            PL.job_runner.end_array_element()
 
             for jid in cleanups:
                 del self.pipelineFiles[jid]
 
+        if use_arrays:
+            single_jobs = PL.job_runner.single_array_jobs(name_prefix)
+            if single_jobs > ForEach.MAX_JOBS:
+                PL.abort_submit("error submitting foreach: {} jobs that can't "
+                                "be submitted as job arrays exceed limit "
+                                "(max = {})\n".format(single_jobs,
+                                                       ForEach.MAX_JOBS))
 
 
         #enqueue "barrier" job here
@@ -292,7 +300,6 @@ class ForEach(object):
             iteration += 1
             cleanups = []
             files_to_delete = []
-            iteration_tasks = []
 
             if fn.startswith('/'):
                 in_dir = None
@@ -317,54 +324,20 @@ class ForEach(object):
                 prefix = "{}-{}_S{}".format(name_prefix, iteration, step_iteration)
                 for task in step.create_tasks(prefix, execution_mode):
                     tasks.append(task)
-                    iteration_tasks.append(task['name'])
-
-            #create a task that deletes all of the temporary files
-            tmps = []
-            for fid in files_to_delete:
-                tmps.append(self.pipelineFiles[fid].path)
 
-            if tmps:
-                task = {}
-                cmd = 'rm -f ' + ' '.join(tmps)
-
-                task['name'] = "{}-{}_temp_file_cleanup".format(name_prefix, iteration)
-                task['command'] = cmd
-                task['mem'] = "1"
-                task['walltime'] = "00:30:00"
-                task['threads'] = 1
-
-                if execution_mode == ToolExecModes.CLOUD_GCP:
+            # create tasks that delete the temporary files as soon as the
+            # tasks that use them are done
+            if not PL.keep_temp:
+                deletions = PL.temp_file_deletions(self.pipelineFiles,
+                                                   files_to_delete)
+                if deletions and execution_mode == ToolExecModes.CLOUD_GCP:
                     # TODO
                     raise Exception("TODO Finish foreach for cloud")
-
-                elif execution_mode == ToolExecModes.BATCH_MANAGED:
-
-                    task['dependencies'] = iteration_tasks
-
-                    # need to make a BatchJob object so we can generate a job
-                    # script for this
-                    batch_job = BatchJob(cmd,
-                                     workdir=PipelineFile.get_output_dir(),
-                                     ppn=task['threads'], walltime=task["walltime"],
-                                     name=task["name"],
-                                     mem=task["mem"],
-                                     email_list=PL.error_email_address,
-                                     stdout_path = os.path.join(PL.log_dir, task["name"] + ".o"),
-                                     stderr_path = os.path.join(PL.log_dir, task["name"] + ".e"))
-
-                    task['script_path'] = PL.job_runner.write_script(batch_job)
-                    task['stdout_path'] = batch_job.stdout_path
-                    task['stderr_path'] = batch_job.stderr_path
-                    task['epilogue_path'] = PL.job_runner.epilogue_filename
-                    task['batch_env'] = PL.job_runner.generate_env(PipelineFile.get_output_dir())
-                    task['email_list'] = PL.error_email_address
-                    task['mail_options'] = batch_job.mail_option
-                    task['module_files'] = []
-                    task['log_dir'] = PL.job_runner.execution_log_dir
-                    task['queue'] = PL.job_runner.queue
-
-                tasks.append(task)
+                for n, (paths, dependencies) in enumerate(deletions, 1):
+                    name = "{}-{}_temp_file_cleanup{}".format(name_prefix,
+                                                              iteration, n)
+                    tasks.append(PL.create_temp_file_cleanup_task(
+                        name, paths, dependencies))
 
             # need to get rid of all the Files created for this foreach iteration
             for fid in cleanups:
@@ -43,6 +43,9 @@ class BatchJob(object):
     mem     : batch job mem attribute (in GB)
     date_time: datetime job will be eligible at this time (for delayed job)
     info: extra information recorded as comment in generated batch script
+    priority: job priority passed to the resource manager (-1024 to 1023)
+    local_temp: create a node-local scratch directory, $CIVET_SCRATCH, for
+                the command's temp files
     """
 
     DEFAULT_WALLTIME = "01:00:00"
@@ -53,7 +56,7 @@ class BatchJob(object):
                  files_to_validate=None, version_cmds=None, error_strings=None,
                  mail_option="n", email_list=None, files_to_test=[],
                  file_test_logic="AND", mem=None, date_time=None, info=None,
-                 tool_path=None):
+                 tool_path=None, priority=None, local_temp=False):
 
         self._name = None
         self._workdir = None
@@ -82,6 +85,8 @@ class BatchJob(object):
         self.date_time = date_time
         self.info = info
         self.tool_path = tool_path
+        self.priority = priority
+        self.local_temp = local_temp
 
 
     @property
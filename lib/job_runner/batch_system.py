@@ -0,0 +1,1495 @@
+# Copyright 2016 The Jackson Laboratory
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+job_runner/batch_system.py
+
+the interface implemented by each batch system backend, and the code that is
+shared between them.
+
+A backend is a module in the job_runner package that provides:
+
+    JobRunner: a BatchJobRunner subclass that submits the jobs of a pipeline
+    JobManager: a BatchJobManager subclass that queries, deletes and releases
+        submitted jobs
+
+BatchJobRunner generates the job scripts, records deferred jobs in a
+SubmissionPlan and builds job arrays, fused chains and barrier jobs.  A
+backend only has to turn a BatchJob into a submission request for its batch
+system.
+
+get_backend() returns the backend module selected by the batch_system config
+file parameter.
+
+ReleasePolicy controls how the user hold is released from the root jobs of a
+submitted pipeline, optionally in waves so that a large pipeline doesn't make
+hundreds of jobs eligible to run at once.
+"""
+
+from __future__ import print_function
+
+import copy
+import errno
+import hashlib
+import importlib
+import os
+import pipes
+import stat
+import string
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+from batch_job import *
+import common
+import retry
+import submission
+import utilities
+import version
+import config
+
+
+# modules in the job_runner package implementing each supported batch system
+BACKENDS = {
+    'torque': 'job_runner.torque',
+    'slurm': 'job_runner.slurm',
+    'local': 'job_runner.local'
+}
+
+_SHELL_SCRIPT_DIR = "submitted_shell_scripts"
+
+# seconds between checks of the batch system queue while waiting to release
+# the next wave of jobs
+_QUEUE_POLL_INTERVAL = 15
+
+# directory in the log directory holding the module environment snapshots
+_MODULE_SNAPSHOT_DIR = "module_snapshots"
+
+# version of the job library (civet_job.sh) that our job scripts are generated
+# for, must match CIVET_JOB_LIB_VERSION in civet_job.sh
+_JOB_LIB_VERSION = 6
+
+
+def get_backend(name=None):
+    """
+        return the module implementing a batch system backend
+        :param name: backend name, one of the keys of BACKENDS.  Defaults to
+            the batch_system config file parameter
+        :return: backend module, with JobRunner and JobManager classes
+    """
+    if name is None:
+        name = config.batch_system
+    if name not in BACKENDS:
+        raise ValueError("Unknown batch system: '{}'".format(name))
+    return importlib.import_module(BACKENDS[name])
+
+
+class BatchJobManager(object):
+    """
+        The interface for monitoring and controlling submitted batch jobs.
+
+        Return codes are 0 on success.  E_UNKNOWN (the job is not known to the
+        batch system) and E_STATE (the job is in a state that doesn't allow
+        the request, e.g. it has completed) are expected when a job finishes
+        while we are working on it, callers generally ignore them.
+    """
+
+    E_UNKNOWN = None
+    E_STATE = None
+
+    # exit status recorded for a job that was deleted while running, and for
+    # a job that hit its walltime limit
+    CANCELED_EXIT_STATUS = None
+    WALLTIME_LIMIT_EXIT_STATUS = None
+
+    def query_job(self, job_id):
+        """
+            :param job_id: job id of job to query
+            :return: job status object, None if the job is unknown
+        """
+        raise NotImplementedError
+
+    def query_jobs(self, job_ids):
+        """
+            query the status of several jobs.  Backends that can query many
+            jobs with a single request override this.
+            :param job_ids: list of job ids
+            :return: dictionary of job id -> job status object (None if the
+                job is unknown) with an entry for every job in job_ids
+        """
+        return dict((job_id, self.query_job(job_id)) for job_id in job_ids)
+
+    def delete_job(self, job_id):
+        """
+            :param job_id: job id to delete
+            :return: 0 on success, otherwise a backend error code
+        """
+        raise NotImplementedError
+
+    def delete_jobs(self, job_ids):
+        """
+            delete several jobs.  Backends that can delete many jobs with a
+            single request override this.
+            :param job_ids: list of job ids
+            :return: dictionary of job id -> error code for the jobs that
+                could not be deleted, other than because they are unknown or
+                already complete.  Empty if all were deleted.
+        """
+        errors = {}
+        for job_id in job_ids:
+            rval = self.delete_job(job_id)
+            if rval and rval not in (self.E_UNKNOWN, self.E_STATE):
+                errors[job_id] = rval
+        return errors
+
+    def delete_all_jobs(self, ids):
+        """
+            delete all jobs in a list of jobs
+            :param ids: list of all jobs
+            :return: zero on success, otherwise the error code of a failed
+                deletion
+        """
+        errors = self.delete_jobs(ids)
+        for job_id in ids:
+            if job_id in errors:
+                return errors[job_id]
+        return 0
+
+    def release_job(self, job_id):
+        """
+            Release a user hold on a job
+            :param job_id: job to release
+            :return: 0 on success, otherwise a backend error code
+        """
+        raise NotImplementedError
+
+    def release_jobs(self, job_ids):
+        """
+            release the user hold on several jobs.  Backends that can release
+            many jobs with a single request override this.
+            :param job_ids: list of job ids
+            :return: dictionary of job id -> error code for the jobs that
+                could not be released
+        """
+        errors = {}
+        for job_id in job_ids:
+            rval = self.release_job(job_id)
+            if rval:
+                errors[job_id] = rval
+        return errors
+
+    def queued_job_count(self):
+        """
+            :return: number of jobs (from all users) queued and eligible to
+                run, or None if the backend can't tell
+        """
+        return None
+
+    def close(self):
+        """
+            Release any resources (e.g. server connections) held by the job
+            manager.
+        """
+        pass
+
+
+class ReleasePolicy(object):
+    """
+        ReleasePolicy releases held jobs in waves of wave_size jobs, waiting
+        wave_interval seconds between waves.  If max_queued is set, each wave
+        also waits until fewer than max_queued jobs are queued on the batch
+        system (when the backend can report it).  A wave_size of 0 releases
+        all of the jobs at once.  With delay_first, the first wave also waits
+        wave_interval seconds, for when a wave was just released elsewhere.
+    """
+
+    def __init__(self, wave_size=0, wave_interval=0, max_queued=0,
+                 poll_interval=_QUEUE_POLL_INTERVAL):
+        self.wave_size = wave_size
+        self.wave_interval = wave_interval
+        self.max_queued = max_queued
+        self.poll_interval = poll_interval
+
+    @classmethod
+    def from_config(cls):
+        """
+            :return: ReleasePolicy set by the config file
+        """
+        return cls(config.release_wave_size, config.release_wave_interval,
+                   config.release_max_queued)
+
+    def wait_for_queue(self, job_manager):
+        """
+            wait until fewer than max_queued jobs are queued
+        """
+        if not self.max_queued:
+            return
+        while True:
+            queued = job_manager.queued_job_count()
+            if queued is None or queued < self.max_queued:
+                return
+            time.sleep(self.poll_interval)
+
+    def waves(self, job_manager, job_ids, delay_first=False):
+        """
+            generator yielding the lists of jobs to release, waiting as
+            required by the policy before yielding each wave
+            :param job_manager: BatchJobManager used to check the queue
+            :param job_ids: list of job ids to release
+            :param delay_first: wait wave_interval before the first wave too
+        """
+        job_ids = list(job_ids)
+        size = self.wave_size if self.wave_size else len(job_ids)
+        for i in range(0, len(job_ids), size or 1):
+            if i or delay_first:
+                time.sleep(self.wave_interval)
+            self.wait_for_queue(job_manager)
+            yield job_ids[i:i + size]
+
+    def release(self, job_manager, job_ids, delay_first=False):
+        """
+            release the user hold on job_ids, following the policy
+            :param delay_first: wait wave_interval before the first wave too
+            :return: dictionary of job id -> error code for the jobs that
+                could not be released
+        """
+        errors = {}
+        for wave in self.waves(job_manager, job_ids, delay_first):
+            errors.update(job_manager.release_jobs(wave))
+        return errors
+
+
+class CompiledTemplate(object):
+    """
+        A string.Template that has been split into literal text and the names
+        of its placeholders once, so that it can be filled in repeatedly
+        without re-parsing the template.
+
+        Placeholders whose values are known when the template is compiled
+        (static tokens) are substituted immediately and folded into the
+        surrounding literal text, leaving only the per-job fields to be filled
+        in by substitute().
+    """
+
+    def __init__(self, template, static_tokens=None):
+        static_tokens = static_tokens or {}
+        self._literals = []
+        self._fields = []
+
+        literal = []
+        pos = 0
+        for match in string.Template.pattern.finditer(template):
+            literal.append(template[pos:match.start()])
+            pos = match.end()
+            if match.group('escaped') is not None:
+                literal.append(string.Template.delimiter)
+                continue
+            name = match.group('named') or match.group('braced')
+            if name is None:
+                raise ValueError("Invalid placeholder in template at "
+                                 "position {0}".format(match.start()))
+            if name in static_tokens:
+                literal.append('%s' % (static_tokens[name],))
+            else:
+                self._literals.append(''.join(literal))
+                self._fields.append(name)
+                literal = []
+        literal.append(template[pos:])
+        self._literals.append(''.join(literal))
+
+    @property
+    def fields(self):
+        """ names of the placeholders that must be passed to substitute() """
+        return list(self._fields)
+
+    def substitute(self, tokens):
+        """
+            fill in the dynamic fields of the template
+
+            :param tokens: dictionary of field name -> value. Raises KeyError
+                if a field is missing, like string.Template.substitute()
+            :return: the filled in template as a string
+        """
+        parts = [self._literals[0]]
+        for field, literal in zip(self._fields, self._literals[1:]):
+            parts.append('%s' % (tokens[field],))
+            parts.append(literal)
+        return ''.join(parts)
+
+
+class BatchJobRunner(object):
+    """
+        BatchJobRunner holds the functionality for submitting the jobs of a
+        pipeline that is the same for every batch system: writing the job
+        scripts and epilogue, deferred submission, job arrays, fused chains,
+        barrier jobs and job priorities.  Backends subclass it and implement
+        the methods that raise NotImplementedError.
+
+        attributes
+        held_jobs: a list of job_id,server pairs that were submitted with a
+            user hold
+        submit_with_hold: if True any root job (job with no dependency) will be
+            submitted with a user hold
+        log_dir: directory to store log files, will be created if it doesn't
+            exist
+        execution_log_dir: log directory on execution host if different
+            than log_dir
+        pipeline_bin: allow a pipeline bin directory to be added to PATH.
+            if set, this string will be prepended to the user's PATH
+            at job run time
+        validate: if true, run validate command
+        queue: optional queue, if None the batch system default will be used
+        submit:  If False job scripts will be generated but jobs will not be
+            submitted.  Useful for debugging pipelines.
+        send_failure_email: if true, send user email if a pipeline tool exits
+            with non zero value and aborts the pipeline
+        resume: if true, the log directory holds the submission journal of
+            an earlier, interrupted, submission of the same pipeline. Jobs
+            recorded in the journal are not submitted again, they keep the
+            job IDs they were submitted with
+    """
+
+    # the template script, which will be customized for each job. The logic
+    # common to all jobs lives in the sourced job library (civet_job.sh), the
+    # script only defines the job's variables and runs its command.
+    # $VAR will be substituted before job submission $$VAR will become $VAR
+    # after substitution
+    script_template = textwrap.dedent("""\
+        #!/bin/bash
+        
+        # This script was generated by Civet (Version $CIVET_VERSION)
+        $INFO
+        
+        $BATCH_DIRECTIVES
+        
+        # define civet job functions
+        source $JOB_LIB
+        if [ "$${CIVET_JOB_LIB_VERSION}" != "$JOB_LIB_VERSION" ]; then
+            echo "$JOB_LIB is version $${CIVET_JOB_LIB_VERSION}, this job requires version $JOB_LIB_VERSION" >&2
+            exit 1
+        fi
+
+        CIVET_VERSION="$CIVET_VERSION"
+        CIVET_LOGDIR=$LOG_DIR
+        CIVET_BIN="$CIVET_BIN"
+        CIVET_PIPELINE_PATH="$PIPELINE_PATH"
+        CIVET_TOOL_PATH="$TOOL_PATH"
+        CIVET_PYTHON="$CIVET_PYTHON"
+        CIVET_VALIDATE="$VALIDATE"
+        CIVET_RUN_VALIDATION=$RUN_VALIDATION
+        CIVET_MASTER_FILE="$MASTER_FILE"
+        CIVET_FILES_TO_VALIDATE=($FILES_TO_VALIDATE)
+        CIVET_MODULE_PURGE=$MODULE_PURGE
+        CIVET_MODULES=($MODULES)
+        CIVET_MODULE_SNAPSHOT="$MODULE_SNAPSHOT"
+        CIVET_EMAIL_LIST="$EMAIL_LIST"
+        CIVET_SEND_FAILURE_EMAIL=$SEND_FAILURE_EMAIL
+        CIVET_ERROR_STRINGS=($ERROR_STRINGS)
+        CIVET_LOCAL_TEMP=$LOCAL_TEMP
+        $VERSION_CMDS
+        civet_job_start
+
+        $FILE_TEST
+
+        civet_job_version
+
+        # command(s) passed into BatchJob:
+        $CMD
+        
+        civet_job_finish $$?
+    
+    """)
+
+    # the template for the script shared by the elements of a job array.
+    # Element N runs the job script listed on line N of the array's manifest,
+    # manifest lines are tab delimited: job name, job script, stdout path and
+    # stderr path
+    array_script_template = textwrap.dedent("""\
+        #!/bin/bash
+
+        # This script was generated by Civet (Version $CIVET_VERSION)
+        # Job array of $ARRAY_SIZE Civet jobs, listed in $MANIFEST
+
+        $BATCH_DIRECTIVES
+
+        IFS=$$'\\t' read NAME SCRIPT STDOUT STDERR <<< "$$(sed -n "$${PBS_ARRAYID}{p;q}" $MANIFEST)"
+
+        if [ -z "$$SCRIPT" ]; then
+            echo "No job for array index $${PBS_ARRAYID} in $MANIFEST" >&2
+            exit 1
+        fi
+
+        # the job script uses its job name to name its log files
+        export PBS_JOBNAME=$$NAME
+        exec bash $$SCRIPT > $$STDOUT 2> $$STDERR
+    """)
+
+    # the template for a fused job, which runs a chain of Civet jobs one after
+    # the other in a single batch job.  $CHAIN_CMDS calls civet_chain_job for
+    # each job in the chain
+    chain_script_template = textwrap.dedent("""\
+        #!/bin/bash
+
+        # This script was generated by Civet (Version $CIVET_VERSION)
+        # Fused job, runs $CHAIN_SIZE Civet jobs in sequence
+
+        $BATCH_DIRECTIVES
+
+        # define civet job functions
+        source $JOB_LIB
+        if [ "$${CIVET_JOB_LIB_VERSION}" != "$JOB_LIB_VERSION" ]; then
+            echo "$JOB_LIB is version $${CIVET_JOB_LIB_VERSION}, this job requires version $JOB_LIB_VERSION" >&2
+            exit 1
+        fi
+
+        CIVET_LOGDIR=$LOG_DIR
+
+        $CHAIN_CMDS
+    """)
+
+    # the template job epilogue, which will be shared between all jobs
+    # submitted by this job runner
+    # $VAR will be substituted before job submission $$VAR will become $VAR
+    # after substitution
+    epilogue_template = textwrap.dedent("""\
+        #!/bin/bash
+
+        # This script was generated by Civet (Version $CIVET_VERSION)
+
+        #define civet shell functions
+        source $FUNCTIONS
+
+        PBS_JOBID=$$1
+        PBS_JOBNAME=$$(get_array_job_name $$1 $$4 $LOG_DIR/submitted_shell_scripts)
+        EXIT_STATUS=$${10}
+        WALLTIME=$$(get_walltime $$7)
+        WALLTIME_REQUESTED=$$(get_walltime $$6)
+        CIVET_LOGDIR=$LOG_DIR
+        CIVET_DELETE_CMD=$DELETE_CMD
+
+
+        # the TORQUE epilogue doesn't seem to have USER defined, which is the default
+        # TorqueJobRunner uses for sending error emails unless one is supplied.  Fix that.
+        if [ -z $${USER+x} ]; then
+            USER=$$(whoami)
+        fi
+
+        if [ $$EXIT_STATUS -lt 0 ]; then
+            # Negative job exit status indicates Torque error, such as wall time limit
+            if [ $$EXIT_STATUS -eq "-11" ]; then
+                MESSAGE="Job hit walltime limit ($${WALLTIME_REQUESTED})"
+            else
+                MESSAGE="TORQUE Error ($${EXIT_STATUS})"
+            fi
+            send_failure_email $EMAIL_LIST "$$MESSAGE"
+            if $ABORT; then
+                abort_pipeline $LOG_DIR $$EXIT_STATUS $$WALLTIME $$WALLTIME_REQUESTED
+            fi
+        elif [ $$EXIT_STATUS -gt 0 ]; then
+            # Job exited with non-zero, Job script should have already sent email
+            if $ABORT; then
+                abort_pipeline $LOG_DIR $$EXIT_STATUS $$WALLTIME $$WALLTIME_REQUESTED
+            fi
+        else
+            # normal exit
+
+            # in some specific cases, the job script may have created the -status.txt file
+            # if so,  don't recreate it
+            if [ ! -f $LOG_DIR/$${PBS_JOBNAME}-status.txt ]; then
+                echo "exit_status=0" > $LOG_DIR/$${PBS_JOBNAME}-status.txt
+                echo "walltime=$$WALLTIME" >> $LOG_DIR/$${PBS_JOBNAME}-status.txt
+                echo "requested_walltime=$$WALLTIME_REQUESTED" >> $LOG_DIR/$${PBS_JOBNAME}-status.txt
+
+                # memory use is recorded for civet_resource_history, when the
+                # batch system reports it
+                MEM_USED=$$(get_resource mem $$7)
+                if [ -n "$$MEM_USED" ]; then
+                    echo "mem_used=$$MEM_USED" >> $LOG_DIR/$${PBS_JOBNAME}-status.txt
+                    echo "requested_mem=$$(get_resource mem $$6)" >> $LOG_DIR/$${PBS_JOBNAME}-status.txt
+                fi
+            fi
+
+            $SLEEP
+
+            echo "Run finished on $$(date)" >> $LOG_DIR/$${PBS_JOBNAME}-run.log
+        fi
+
+    """)
+
+    # highest job priority the batch system accepts, critical path priorities
+    # are scaled to 0 - max_priority
+    max_priority = None
+
+    # command used by abort_pipeline to delete the rest of a failed
+    # pipeline's jobs
+    delete_command = None
+
+    # if True, the epilogue sleeps for config.io_sync_sleep seconds so that
+    # the job's output files are visible on other hosts before its dependent
+    # jobs start
+    io_sync_sleep = True
+
+    def __init__(self, log_dir="log", submit_with_hold=True,
+                 pipeline_bin=None, validate=False,
+                 execution_log_dir=None, queue=None, submit=True,
+                 epilogue_email=None, pipeline_path=None, validation_file=None,
+                 send_failure_email=True, submit_threads=1, job_arrays=False,
+                 array_slot_limit=0, fuse_chains=False, max_dependencies=None,
+                 critical_path_priority=False, resume=False):
+        self.held_jobs = []
+        self.submit_with_hold = submit_with_hold
+        self.validate = validate
+        self.log_dir = os.path.abspath(log_dir)
+        self._job_names = set()
+        self.pipeline_bin = pipeline_bin
+        self.execution_log_dir = execution_log_dir
+        self.queue = queue
+        self.submit = submit
+        self._id_seq = 0  # used to fake job IDs when self.submit is False
+        self.need_to_write_epilogue = True
+        self.epilogue_email=epilogue_email
+        self.pipeline_path = pipeline_path
+        self.validation_file = validation_file
+        self.send_failure_email = send_failure_email
+        self.submit_threads = submit_threads
+        self.submitted_jobs = []
+        self._plan = None
+        self._resolved_plans = []
+        self._writer = None
+        self.job_arrays = job_arrays
+        self.array_slot_limit = array_slot_limit
+        self.fuse_chains = fuse_chains
+        self.max_dependencies = max_dependencies
+        self.critical_path_priority = critical_path_priority
+        self._array_element = None
+        self._static_tokens = None
+        self._compiled_script = None
+        self._script_dir_ready = False
+        self._compile_lock = threading.Lock()
+
+        if self.execution_log_dir:
+            self.execution_log_dir = os.path.abspath(self.execution_log_dir)
+
+        self.epilogue_filename = os.path.join(self.log_dir, _SHELL_SCRIPT_DIR, "epilogue.sh")
+
+        utilities.make_sure_path_exists(self.log_dir)
+          
+        # on resume the batch ID log is rewritten with every job, including
+        # the ones submitted earlier
+        self._id_log = open(os.path.join(log_dir, common.BATCH_ID_LOG), 'w')
+
+        journal = os.path.join(self.log_dir, common.SUBMIT_JOURNAL)
+        self._resumed_jobs = {}
+        if resume:
+            self._resumed_jobs = submission.SubmissionJournal.load(journal)[0]
+        self._journal = submission.SubmissionJournal(journal, append=resume)
+
+        if not self.submit:
+            # we aren't actually submitting jobs,  create a file in the log 
+            # directory that civet_status can use to detect this case
+            open(os.path.join(log_dir, common.NO_SUB_FLAG), 'w').close()
+
+        # do some sanity checking on groups of files created in the log dir
+        g_test_file = os.path.join(log_dir, ".group_test")
+        open(g_test_file, 'w').close()
+        gid = os.stat(g_test_file).st_gid
+        os.remove(g_test_file)
+        if gid not in os.getgroups():
+            print(textwrap.fill("ERROR: The log directory {} has a group ID "
+                                "that you are not a member of. This will "
+                                "prevent the batch system from operating correctly.".format(self.log_dir),
+                                width=80, break_long_words=False),
+                  file=sys.stderr)
+            print("\nPIPELINE NOT SUBMITTED\n", file=sys.stderr)
+            sys.exit(1)
+
+    def _submit_job(self, batch_job, filename, array_size=None):
+        """
+            submit a BatchJob whose script has already been written
+            :param batch_job: job to submit
+            :param filename: path to the job script
+            :param array_size: if not None, submit as a job array with this
+                many elements
+            :return: job id
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def array_element_id(array_id, index):
+        """
+            return the ID of an element of a job array
+            :param array_id: job array ID
+            :param index: element index
+            :return: element ID
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _generate_directives(batch_job, epilogue_filename=None):
+        """
+            Generate the batch system directives inserted at the top of a job
+            script, documenting the resources requested when the job was
+            submitted and allowing the script to be rerun by hand
+            :param batch_job: BatchJob for which to generate directives
+            :param epilogue_filename: path of the job epilogue
+            :return: directives as a string
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def generate_env(workdir):
+        """
+            Generate the environment string to send along with a job
+            :param workdir: working directory of the job
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def submit_managed_job(task):
+        """
+            submit a managed job from the civet_managed_batch_master program,
+            described by a task dictionary rather than a BatchJob
+            :param task: dictionary describing the task.
+            :return: batch job ID
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def submit_simple_job(task):
+        """
+            Submit a basic batch job, without all the extra stuff used in a
+            normal civet job.  This is used to submit the
+            civet_managed_batch_master command.
+            :param task: dictionary describing the job
+            :return: batch job ID
+        """
+        raise NotImplementedError
+
+    def release_all(self):
+        """
+            Release all jobs in self.held_jobs, following the release policy
+            set in the config file.  If jobs are released in waves and
+            release_in_background is set, the first wave is released now and
+            a civet_release process started in the background releases the
+            rest, so that civet_run doesn't wait for them.
+        """
+
+        # if we are 'faking' pipeline submission with civet_run -n, then there
+        # is nothing to do
+        if not self.submit or not self.held_jobs:
+            return
+
+        policy = ReleasePolicy.from_config()
+        job_manager = self.get_job_manager()
+        jobs = list(self.held_jobs)
+
+        try:
+            if policy.wave_size and config.release_in_background and \
+                    len(jobs) > policy.wave_size:
+                first_wave = jobs[:policy.wave_size]
+                errors = job_manager.release_jobs(first_wave)
+                self._release_in_background(jobs[policy.wave_size:])
+                self.held_jobs = [job_id for job_id in first_wave
+                                  if job_id in errors]
+            else:
+                errors = policy.release(job_manager, jobs)
+                self.held_jobs = [job_id for job_id in jobs
+                                  if job_id in errors]
+        finally:
+            job_manager.close()
+
+    def _release_in_background(self, job_ids):
+        """
+            start a civet_release process, detached from this one, to release
+            job_ids following the release policy.  The first wave has just
+            been released, so civet_release waits wave_interval before
+            releasing its first wave.
+        """
+        jobs_file = os.path.join(self.log_dir, common.RELEASE_LIST)
+        with open(jobs_file, 'w') as f:
+            for job_id in job_ids:
+                f.write(job_id + '\n')
+
+        with open(os.path.join(self.log_dir, common.RELEASE_LOG), 'a') as log:
+            subprocess.Popen([sys.executable,
+                              os.path.join(common.CIVET_HOME, "bin",
+                                           "civet_release"),
+                              "--delay-first", "--jobs-file", jobs_file,
+                              self.log_dir],
+                             stdin=open(os.devnull), stdout=log,
+                             stderr=subprocess.STDOUT, close_fds=True,
+                             preexec_fn=os.setsid)
+
+    def get_job_manager(self):
+        """
+            :return: BatchJobManager for the jobs submitted by this runner
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+            Release any resources (e.g. server connections) held by the job
+            runner.  Subclasses that override this must call it, it records
+            the batch system request statistics in the log directory.
+        """
+        if self._writer:
+            self._writer.close()
+        self._journal.close()
+        retry.write_stats(os.path.join(self.log_dir, common.REQUEST_STATS))
+
+    def queue_job(self, batch_job, allow_fusion=True):
+        """
+          queue a BatchJob.
+
+          If defer_submission() has been called, the job script is queued to
+          be written in the background and the job is only recorded for
+          submission by submit_deferred(), and a PendingJobId is returned in
+          place of the batch job ID.
+          
+          :param batch_job: description of the job to queue
+          :param allow_fusion: if False, a deferred job will always be
+              submitted as its own batch job, even if fuse_chains is set
+          :return: batch job ID (or placeholder for a deferred job)
+        """
+        
+        self._prepare_job(batch_job)
+
+        if self._plan is not None:
+            if self._resumed_jobs:
+                # submit_deferred() writes the script once it knows whether
+                # the job, or the array or chain it is part of, was submitted
+                # before the submission was interrupted
+                filename, writes = self._script_filename(batch_job), []
+            else:
+                filename, script_write = self._write_script_background(batch_job)
+                writes = [script_write]
+            return self._plan.add(batch_job, filename,
+                                  self._array_key(batch_job.name),
+                                  allow_fusion, writes)
+
+        filename = self.write_script(batch_job)
+        job_id = self._submit_journaled(batch_job, filename)
+        self._log_job_id(job_id, batch_job)
+        return job_id
+
+    def _prepare_job(self, batch_job):
+        """
+            check the job's name and fill in its default stdout/stderr paths
+            :param batch_job: BatchJob
+        """
+
+        # batch job names should be unique for civet pipelines because the 
+        # job name is used to name log files and other output
+        # Civet generates unique names for each step, so this is just checking
+        # for a programming error
+        assert batch_job.name not in self._job_names
+        self._job_names.add(batch_job.name)
+        
+        if self.execution_log_dir:
+            log_dir = self.execution_log_dir
+        else:
+            log_dir = self.log_dir
+
+        # set batch_job.stderr_path and batch_job.stdout_path if they aren't already set
+        if not batch_job.stdout_path:
+            batch_job.stdout_path =  os.path.join(log_dir, batch_job.name + ".o")
+        if not batch_job.stderr_path:
+            batch_job.stderr_path = os.path.join(log_dir, batch_job.name + ".e")
+
+    def defer_submission(self):
+        """
+            Start collecting jobs passed to queue_job() rather than submitting
+            them immediately.  The collected jobs are submitted by
+            submit_deferred().
+
+            Job scripts are written by self.submit_threads writer threads
+            while the rest of the pipeline is queued, each job waits for its
+            script to be written before it is submitted.
+        """
+        self._plan = submission.SubmissionPlan()
+        if not self._writer:
+            self._writer = submission.ScriptWriter(self.submit_threads)
+
+    def begin_array_element(self, name_prefix, index):
+        """
+            Jobs queued after this is called, until end_array_element(), form
+            element 'index' of a group of job arrays.  When the deferred jobs
+            are submitted, a job named <name_prefix>-<index>_<suffix> is merged
+            with the jobs named <name_prefix>-<i>_<suffix> from the other
+            elements into a single job array.
+
+            This has no effect unless the runner was created with
+            job_arrays=True and submission has been deferred.
+
+            :param name_prefix: job name prefix shared by all elements
+            :param index: element index
+        """
+        self._array_element = (name_prefix, index)
+
+    def end_array_element(self):
+        self._array_element = None
+
+    def _array_key(self, job_name):
+        """
+            return the array key for a job being queued, the name the job array
+            would be submitted with, or None if the job isn't an array element
+        """
+        if not self.job_arrays or not self._array_element:
+            return None
+        prefix, index = self._array_element
+        marker = "{0}-{1}_".format(prefix, index)
+        if not job_name.startswith(marker):
+            return None
+        return "{0}_{1}".format(prefix, job_name[len(marker):])
+
+    def uses_job_arrays(self):
+        """
+            :return: True if jobs queued between begin_array_element() and
+                end_array_element() may be merged into job arrays
+        """
+        return self.job_arrays and self._plan is not None
+
+    def single_array_jobs(self, name_prefix):
+        """
+            :param name_prefix: name prefix passed to begin_array_element()
+            :return: number of the jobs queued as elements of the job arrays
+                for name_prefix that can't be merged into an array, and will
+                be submitted as individual jobs
+        """
+        if not self.uses_job_arrays():
+            return 0
+        return self._plan.single_array_jobs(name_prefix + '_')
+
+    def submit_deferred(self):
+        """
+            Submit all jobs queued since defer_submission() was called.
+
+            Jobs are submitted one dependency level at a time.  The jobs within
+            a level do not depend on each other, so they are submitted
+            concurrently using up to self.submit_threads connections. Job IDs
+            are written to the batch ID log after each level, in the order the
+            jobs were queued.
+
+            A job is submitted as soon as its script (and, for an array or
+            chain, its members' scripts) has been written, so the scripts of
+            later levels are still being written while the earlier levels
+            are submitted.
+
+            If a submission fails, the rest of the level is allowed to finish
+            and the exception is re-raised.  Jobs that were submitted are still
+            logged and recorded in self.submitted_jobs.
+        """
+        plan = self._plan
+        self._plan = None
+        self._resolved_plans.append(plan)
+
+        plan.reduce_dependencies()
+
+        if self.fuse_chains:
+            for chain in plan.build_chains():
+                self._write_chain_script(chain)
+
+        for array in plan.build_arrays():
+            self._write_array_script(array)
+
+        if self._resumed_jobs:
+            self._write_unjournaled_scripts(plan)
+
+        if self.critical_path_priority:
+            self._set_priorities(plan)
+
+        # fake job IDs are handed out sequentially, don't shuffle them
+        workers = self.submit_threads if self.submit else 1
+
+        for level in plan.levels():
+            for unit in level:
+                plan.resolve_dependencies(unit)
+                self._limit_dependencies(unit.batch_job, workers)
+
+            utilities.run_in_threads(self._submit_pending, level, workers)
+
+            failed = None
+            for unit in level:
+                if unit.error:
+                    if not failed:
+                        failed = unit
+                elif isinstance(unit, (submission.PendingArray,
+                                       submission.PendingChain)):
+                    for pending in unit.members:
+                        self._log_job_id(pending.job_id, pending.batch_job)
+                else:
+                    self._log_job_id(unit.job_id, unit.batch_job)
+            if failed:
+                raise failed.error
+
+        if self.submit:
+            self._journal.complete()
+
+    def _set_priorities(self, plan):
+        """
+            Give each job in the plan a priority proportional to the length of
+            its critical path, the walltime of the longest chain of jobs that
+            starts with it.  Jobs that hold up the most downstream work are
+            started first when the pipeline's jobs compete for resources.
+            :param plan: SubmissionPlan with any arrays and chains built
+        """
+        critical_paths = plan.critical_paths()
+        longest = max(critical_paths.values()) if critical_paths else 0
+        if not longest:
+            return
+        for unit, length in critical_paths.items():
+            unit.batch_job.priority = int(round(self.max_priority * float(length) / longest))
+
+    def _limit_dependencies(self, batch_job, workers=1):
+        """
+            If a job depends on more than self.max_dependencies jobs, submit a
+            tree of barrier jobs in front of it so that no job has more than
+            max_dependencies dependencies.  pbs_server re-evaluates a job's
+            whole dependency list whenever one of its dependencies changes
+            state, so very long lists get expensive for the server.
+
+            The barrier jobs are submitted and logged immediately, the jobs
+            they depend on must already have been submitted.
+
+            :param batch_job: BatchJob with resolved dependencies, its
+                depends_on is replaced with the top level of barrier jobs
+            :param workers: number of threads to submit barrier jobs with
+        """
+        fan_in = self.max_dependencies
+        depends_on = batch_job.depends_on
+        if not fan_in or not depends_on or len(depends_on) <= fan_in:
+            return
+
+        level = 0
+        while len(depends_on) > fan_in:
+            level += 1
+            barriers = []
+            for i in range(0, len(depends_on), fan_in):
+                barrier_job = BatchJob('echo "placeholder job used for synchronizing dependencies"',
+                                       workdir=batch_job.workdir,
+                                       depends_on=depends_on[i:i + fan_in],
+                                       name="{0}_deps{1}_{2}".format(batch_job.name, level, i // fan_in + 1),
+                                       walltime="00:02:00",
+                                       email_list=batch_job.email_list)
+                self._prepare_job(barrier_job)
+                barriers.append(submission.PendingJob(barrier_job,
+                                                      self.write_script(barrier_job)))
+
+            utilities.run_in_threads(self._submit_pending, barriers, workers)
+
+            for pending in barriers:
+                if pending.error:
+                    raise pending.error
+                self._log_job_id(pending.job_id, pending.batch_job)
+
+            depends_on = [pending.job_id for pending in barriers]
+
+        batch_job.depends_on = depends_on
+
+    def resolve_job_id(self, job_id):
+        """
+            Translate a placeholder returned by queue_job() for a deferred job
+            into the batch job ID it was submitted with.
+            :param job_id: job ID or placeholder
+            :return: job ID (None if the job has not been submitted)
+        """
+        if not isinstance(job_id, submission.PendingJobId):
+            return job_id
+        for plan in [self._plan] + self._resolved_plans:
+            if plan:
+                try:
+                    return plan.resolve(job_id)
+                except KeyError:
+                    continue
+        return None
+
+    def _submit_pending(self, unit):
+        """
+            submit a PendingJob or PendingArray from a SubmissionPlan. Array
+            members are given the IDs of their array elements.  Waits for
+            the unit's scripts to be written first.
+        """
+        try:
+            for script_write in submission.unit_writes(unit):
+                script_write.wait()
+            if isinstance(unit, submission.PendingArray):
+                unit.job_id = self._submit_journaled(unit.batch_job,
+                                                     unit.script_path,
+                                                     array_size=len(unit))
+                for pending in unit.members:
+                    pending.job_id = self.array_element_id(unit.job_id,
+                                                      pending.array_index)
+                    pending.batch_job.depends_on = unit.batch_job.depends_on
+            elif isinstance(unit, submission.PendingChain):
+                unit.job_id = self._submit_journaled(unit.batch_job,
+                                                     unit.script_path)
+                for pending in unit.members:
+                    pending.job_id = unit.job_id
+                    pending.batch_job.depends_on = unit.batch_job.depends_on
+            else:
+                unit.job_id = self._submit_journaled(unit.batch_job,
+                                                     unit.script_path)
+        except Exception as e:
+            unit.error = e
+
+    def _submit_journaled(self, batch_job, filename, array_size=None):
+        """
+            submit a job and record it in the submission journal.  When
+            resuming, a job that the journal shows was already submitted is
+            not submitted again, the ID it was submitted with is returned.
+            :param batch_job: job to submit
+            :param filename: path to the job script
+            :param array_size: passed on to _submit_job()
+            :return: job id
+        """
+        if batch_job.name in self._resumed_jobs:
+            job_id, held = self._resumed_jobs[batch_job.name]
+            if held:
+                self.held_jobs.append(job_id)
+            self.submitted_jobs.append(job_id)
+            return job_id
+
+        job_id = self._submit_job(batch_job, filename, array_size)
+        if self.submit:
+            self._journal.record(job_id, batch_job.name,
+                                 self.submit_with_hold and not batch_job.depends_on)
+        return job_id
+
+    def _write_unjournaled_scripts(self, plan):
+        """
+            when resuming, write the scripts of the jobs in the plan that
+            were not submitted before the submission was interrupted.  The
+            scripts of the jobs that were submitted (and of the members of
+            submitted arrays and chains) are left as they were, the batch
+            system may already be running them.
+            :param plan: SubmissionPlan with any arrays and chains built
+        """
+        for unit in plan.units():
+            if unit.batch_job.name in self._resumed_jobs:
+                continue
+            if isinstance(unit, (submission.PendingArray,
+                                 submission.PendingChain)):
+                members = unit.members
+            else:
+                members = [unit]
+            for pending in members:
+                filename, script_write = self._write_script_background(pending.batch_job)
+                pending.writes.append(script_write)
+
+    def _write_array_script(self, array):
+        """
+            write the manifest and job script for a PendingArray, and create
+            the BatchJob used to submit it
+            :param array: PendingArray
+        """
+        static_tokens = self._get_static_tokens()
+        log_dir = static_tokens['LOG_DIR']
+
+        # the array is submitted with the resources of its members, which
+        # SubmissionPlan has checked are the same for all of them
+        assert array.key not in self._job_names
+        self._job_names.add(array.key)
+
+        batch_job = copy.copy(array.members[0].batch_job)
+        batch_job.name = array.key
+        batch_job.stdout_path = os.path.join(log_dir, array.key + ".o")
+        batch_job.stderr_path = os.path.join(log_dir, array.key + ".e")
+        batch_job.depends_on = []
+        batch_job.info = None
+        array.batch_job = batch_job
+
+        script_dir = os.path.join(self.log_dir, _SHELL_SCRIPT_DIR)
+        manifest = []
+        for pending in array.members:
+            member = pending.batch_job
+            manifest.append('\t'.join([
+                member.name,
+                os.path.join(log_dir, _SHELL_SCRIPT_DIR, member.name + ".sh"),
+                member.stdout_path,
+                member.stderr_path]) + '\n')
+
+        tokens = {
+            'CIVET_VERSION': static_tokens['CIVET_VERSION'],
+            'ARRAY_SIZE': len(array),
+            'MANIFEST': os.path.join(log_dir, _SHELL_SCRIPT_DIR, array.key + ".manifest"),
+            'BATCH_DIRECTIVES': self._generate_directives(batch_job, self.epilogue_filename)
+        }
+
+        array.script_path = os.path.join(script_dir, array.key + ".sh")
+        if array.key in self._resumed_jobs:
+            return
+        array.writes = [
+            self._writer.write(os.path.join(script_dir, array.key + ".manifest"),
+                               ''.join(manifest)),
+            self._writer.write(array.script_path,
+                               string.Template(self.array_script_template).substitute(tokens))]
+
+    def _write_chain_script(self, chain):
+        """
+            write the job script for a PendingChain, and create the BatchJob
+            used to submit it.  The fused job requests the largest number of
+            processors and memory of any job in the chain, and the sum of their
+            walltimes.
+            :param chain: PendingChain
+        """
+        static_tokens = self._get_static_tokens()
+        log_dir = static_tokens['LOG_DIR']
+        members = [pending.batch_job for pending in chain.members]
+
+        batch_job = copy.copy(members[0])
+        batch_job.name = members[0].name + "_chain"
+        assert batch_job.name not in self._job_names
+        self._job_names.add(batch_job.name)
+
+        batch_job.stdout_path = os.path.join(log_dir, batch_job.name + ".o")
+        batch_job.stderr_path = os.path.join(log_dir, batch_job.name + ".e")
+        batch_job.depends_on = []
+        batch_job.info = None
+        batch_job.ppn = max(int(m.ppn) for m in members)
+
+        mem = [int(m.mem[:-2]) for m in members if m.mem]
+        batch_job.mem = str(max(mem)) if mem else None
+
+        batch_job.walltime = BatchJob.walltime_seconds_to_string(
+            sum(BatchJob.walltime_string_to_seconds(m.walltime) for m in members))
+        chain.batch_job = batch_job
+
+        cmds = []
+        for member in members:
+            cmds.append("civet_chain_job {0} {1} {2} {3} {4} {5} || exit $?".format(
+                member.name,
+                os.path.join(log_dir, _SHELL_SCRIPT_DIR, member.name + ".sh"),
+                member.workdir, member.stdout_path, member.stderr_path,
+                member.walltime))
+
+        tokens = {
+            'CIVET_VERSION': static_tokens['CIVET_VERSION'],
+            'CHAIN_SIZE': len(chain),
+            'JOB_LIB': static_tokens['JOB_LIB'],
+            'JOB_LIB_VERSION': static_tokens['JOB_LIB_VERSION'],
+            'LOG_DIR': log_dir,
+            'CHAIN_CMDS': '\n'.join(cmds),
+            'BATCH_DIRECTIVES': self._generate_directives(batch_job, self.epilogue_filename)
+        }
+
+        chain.script_path = os.path.join(self.log_dir, _SHELL_SCRIPT_DIR,
+                                         batch_job.name + ".sh")
+        if batch_job.name in self._resumed_jobs:
+            return
+        chain.writes = [self._writer.write(
+            chain.script_path,
+            string.Template(self.chain_script_template).substitute(tokens))]
+
+    def _log_job_id(self, job_id, batch_job):
+        self._id_log.write(job_id + '\t' + batch_job.name + '\t' + str(
+            self._printable_dependencies(batch_job.depends_on)) + '\n')
+        self._id_log.flush()
+
+    def write_script(self, batch_job):
+
+        #create script directory if necessary
+        self._setup_script_dir(batch_job.email_list)
+
+        #write batch script, unless the job was submitted with it before a
+        #resumed submission was interrupted
+        filename = self._script_filename(batch_job)
+        if batch_job.name in self._resumed_jobs:
+            return filename
+        with open(filename, "w") as script_file:
+            script_file.write(self.generate_script(batch_job))
+
+        return filename
+
+    def _write_script_background(self, batch_job):
+        """
+            generate a job's script and queue it to be written by the
+            deferred submission ScriptWriter
+            :param batch_job: BatchJob
+            :return: (path of the job script, ScriptWrite)
+        """
+        self._setup_script_dir(batch_job.email_list)
+        filename = self._script_filename(batch_job)
+        return filename, self._writer.write(filename,
+                                            self.generate_script(batch_job))
+
+    def _script_filename(self, batch_job):
+        return os.path.join(self.log_dir, _SHELL_SCRIPT_DIR, "{0}.sh".format(batch_job.name))
+
+    def generate_script(self, batch_job):
+        """
+            Generate a batch script based on our template and return as
+            a string.
+            
+            mainly intended to be used internally in the job runner, but it could 
+            be useful externally for debugging/logging the contents of a job 
+            script generated for a batch_job
+
+            The template is compiled the first time this is called, with the
+            tokens that are the same for every job in the pipeline already
+            substituted, so only the per-job fields are filled in here.
+
+            :param batch_job: BatchJob for which to generate script
+            :return: batch script as string
+        """  
+        tokens = {}
+        
+        tokens['BATCH_DIRECTIVES'] = self._generate_directives(batch_job, self.epilogue_filename)
+        tokens['CMD'] = batch_job.cmd
+        
+        if batch_job.modules:
+            tokens['MODULES'] = ' '.join(batch_job.modules)
+        else:
+            tokens['MODULES'] = ""
+        tokens['MODULE_SNAPSHOT'] = self._module_snapshot(batch_job.modules)
+
+        if self.validate and batch_job.files_to_validate:
+            tokens['RUN_VALIDATION'] = 1
+            tokens['FILES_TO_VALIDATE'] = ' '.join(batch_job.files_to_validate)
+            tokens['MASTER_FILE'] = self.validation_file
+        else:
+            tokens['RUN_VALIDATION'] = 0
+            tokens['FILES_TO_VALIDATE'] = ""
+            tokens['MASTER_FILE'] = ""
+            
+        if batch_job.version_cmds:
+            tokens['VERSION_CMDS'] = "function civet_version_cmds {{\n{0}\n}}\n".format(
+                '\n'.join("    civet_version_cmd {0} {1}".format(
+                    self._version_cmd_key(batch_job, vc), pipes.quote(vc))
+                    for vc in batch_job.version_cmds))
+        else:
+            tokens['VERSION_CMDS'] = ""
+
+        if batch_job.error_strings:
+            tokens['ERROR_STRINGS'] = ' '.join(pipes.quote(e) for e in batch_job.error_strings)
+        else:
+            tokens['ERROR_STRINGS'] = ''
+            
+        if batch_job.info:
+            tokens['INFO'] = "# " + batch_job.info.replace('\n', "\n# ")
+        else:
+            tokens['INFO'] = ""
+        
+        tokens['FILE_TEST'] = self._build_file_test(batch_job)
+
+        if batch_job.email_list:
+            tokens['EMAIL_LIST'] = batch_job.email_list
+        else:
+            tokens['EMAIL_LIST'] = "${USER}"
+
+        if batch_job.tool_path:
+            tokens['TOOL_PATH'] = batch_job.tool_path + ":"
+        else:
+            tokens['TOOL_PATH'] = ''
+
+        tokens['LOCAL_TEMP'] = 'true' if batch_job.local_temp else 'false'
+
+        return self._get_compiled_script().substitute(tokens)
+
+    @staticmethod
+    def _version_cmd_key(batch_job, version_cmd):
+        """
+            key identifying the output of a version command, which is the
+            same for every job that runs it with the same modulefiles and
+            tool path.  The first job to run the command saves its output
+            under this key, the others refer to it rather than running the
+            command again.
+        """
+        key = '\n'.join([version_cmd, batch_job.tool_path or ''] +
+                        list(batch_job.modules or []))
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _module_snapshot(self, modules):
+        """
+            path of the snapshot of the environment produced by purging (if
+            configured) and loading a job's modulefiles.  Jobs loading the
+            same modulefiles share a snapshot, the first one to run saves it
+            and the others restore it rather than running modulecmd.
+
+            :param modules: list of modulefiles the job loads
+            :return: path of the snapshot file, or an empty string if
+                snapshots aren't enabled or the job doesn't change its
+                modulefiles
+        """
+        if not config.module_snapshots:
+            return ''
+        if not modules and not config.purge_user_modulefiles:
+            return ''
+
+        key = '\n'.join([str(config.purge_user_modulefiles)] + list(modules))
+        return os.path.join(self._get_static_tokens()['LOG_DIR'],
+                            _MODULE_SNAPSHOT_DIR,
+                            hashlib.sha1(key.encode('utf-8')).hexdigest() + ".sh")
+
+    def _get_static_tokens(self):
+        """
+            tokens that have the same value for every job script and epilogue
+            generated by this runner. These are resolved once, which saves
+            running 'git describe' for every job we generate.
+        """
+        with self._compile_lock:
+            if self._static_tokens is None:
+                tokens = {}
+
+                if self.execution_log_dir:
+                    tokens['LOG_DIR'] = self.execution_log_dir
+                else:
+                    tokens['LOG_DIR'] = self.log_dir
+
+                tokens['ID_FILE'] = common.BATCH_ID_LOG
+                tokens['CIVET_PYTHON'] = config.civet_python
+                tokens['VALIDATE'] = os.path.join(common.CIVET_HOME, "bin/validate")
+                tokens['FUNCTIONS'] = os.path.join(common.CIVET_HOME, "lib/job_runner/functions.sh")
+                tokens['JOB_LIB'] = os.path.join(common.CIVET_HOME, "lib/job_runner/civet_job.sh")
+                tokens['JOB_LIB_VERSION'] = _JOB_LIB_VERSION
+
+                if self.pipeline_bin:
+                    tokens['CIVET_BIN'] = "{0}:{1}".format(self.pipeline_bin, os.path.join(common.CIVET_HOME, "bin"))
+                else:
+                    tokens['CIVET_BIN'] = os.path.join(common.CIVET_HOME, "bin")
+
+                tokens['CIVET_VERSION'] = version.version_from_git()
+                tokens['SEND_FAILURE_EMAIL'] = 'true' if self.send_failure_email else 'false'
+
+                if self.pipeline_path:
+                    tokens['PIPELINE_PATH'] = self.pipeline_path + ":"
+                else:
+                    tokens['PIPELINE_PATH'] = ''
+
+                tokens['MODULE_PURGE'] = 'true' if config.purge_user_modulefiles else 'false'
+
+                self._static_tokens = tokens
+
+        return self._static_tokens
+
+    def _get_compiled_script(self):
+        """
+            return the job script template compiled with this runner's static
+            tokens
+        """
+        static_tokens = self._get_static_tokens()
+        with self._compile_lock:
+            if self._compiled_script is None:
+                self._compiled_script = CompiledTemplate(self.script_template,
+                                                         static_tokens)
+        return self._compiled_script
+
+    def generate_epilogue(self, email_list, abort_on_failure=True):
+
+        static_tokens = self._get_static_tokens()
+
+        tokens = {}
+        tokens['CIVET_VERSION'] = static_tokens['CIVET_VERSION']
+        tokens['FUNCTIONS'] = static_tokens['FUNCTIONS']
+        tokens['EMAIL_LIST'] = email_list if email_list else "${USER}"
+        tokens['ABORT'] = 'true' if abort_on_failure else 'false'
+        tokens['DELETE_CMD'] = self.delete_command
+        tokens['LOG_DIR'] = static_tokens['LOG_DIR']
+
+        if self.io_sync_sleep and config.io_sync_sleep:
+            tokens['SLEEP'] = (
+                            "# sleep to overcome any lag with NFS file attribute cacheing\n"
+                            "# This ensures that downstream jobs will see all output files written by this job\n"
+                            "sleep {}".format(config.io_sync_sleep)
+            )
+        else:
+            tokens['SLEEP'] = ""
+
+        return string.Template(self.epilogue_template).substitute(tokens)
+
+    def _printable_dependencies(self, dependency_list):
+        """
+            Return a list containing shortened (hostname removed) job
+            dependencies
+
+            :param dependency_list: list of job IDs to reformat
+            :return: formatted dependency string
+        """
+        shortened = []
+        for id in dependency_list:
+            shortened.append(id.split('.', 1)[0])
+            
+        return shortened
+        
+    def _build_file_test(self, batch_job):
+        """
+            Return a chunk of bash code that will perform the required file 
+            test(s) for this job. This code will exit using the file_test_exit 
+            function, which will do some logging in addition to exiting the job
+
+            :param batch_job: BatchJob to generate file tests for insertion into
+                              job script
+            :return: bash code to perform file tests, to be inserted into script
+        """
+        header = "#pre job file test\n"
+        
+        # need the walltime because we will create a -status.txt file if we need
+        # to bail out because of the file test
+        if batch_job.walltime:
+            walltime = batch_job.walltime
+        else:
+            walltime = "unlimited"
+    
+        if batch_job.file_test_logic == 'AND':
+            test_type = '&&'
+        elif batch_job.file_test_logic == 'OR':
+            test_type = '||'
+        else:
+            test_type = '&&'  #else default to AND to be safe, but BatchJob should force it to be either AND or OR
+
+        if not batch_job.files_to_test:
+            bash_code = ""
+        elif isinstance(batch_job.files_to_test, utilities.string_types):
+            bash_code = header + 'if [ -e {0} ]; then file_test_exit {1} {2}; fi'.format(batch_job.files_to_test, self.log_dir, walltime)
+        else:
+            tests = []
+            bash_code = header + "if [["
+            for file in batch_job.files_to_test:
+                tests.append(' -e "{0}" '.format(file))
+            bash_code += test_type.join(tests)
+            bash_code += ']]; then file_test_exit {0} {1}; fi'.format(self.log_dir, walltime)
+            
+        return bash_code
+
+    def _setup_script_dir(self, email_list):
+        """
+        setup the directory in the log_dir to hold all of the shell scripts we
+        will generate.  Also write the epilogue script to this directory
+
+        :param email_list:  we need the list of email addresses (usually a
+            single address) when generating the epilogue script from the
+            template
+        """
+
+        if self._script_dir_ready:
+            return
+
+        script_dir = os.path.join(self.log_dir, _SHELL_SCRIPT_DIR)
+        try:
+            os.makedirs(script_dir)
+            os.chmod(script_dir, stat.S_IRWXU)
+
+            if self.need_to_write_epilogue:
+                with open(self.epilogue_filename, "w") as epilogue_file:
+                    epilogue_file.write(self.generate_epilogue(email_list))
+                os.chmod(self.epilogue_filename, stat.S_IRWXU)
+                self.need_to_write_epilogue = False
+
+        except OSError as exception:
+            if exception.errno != errno.EEXIST:
+                print('Error while creating directory ' + script_dir, file=sys.stderr)
+                raise
+
+        self._script_dir_ready = True
+
@@ -0,0 +1,400 @@
+#
+# Copyright (C) 2016  The Jackson Laboratory
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+#
+#   This file is sourced by every batch job script generated by civet. It
+#   holds the logic that is common to all jobs (logging, validation, version
+#   commands, checking the command's exit status and stderr log), so that the
+#   job scripts themselves only need to define their per-job variables and
+#   run their command between civet_job_start and civet_job_finish.
+#
+#   The job script defines these variables before calling civet_job_start:
+#
+#   CIVET_VERSION             version of civet that generated the script
+#   CIVET_LOGDIR              pipeline log directory
+#   CIVET_BIN                 directories to add to PATH for civet/pipeline bin
+#   CIVET_PIPELINE_PATH       pipeline path to prepend to PATH (may be empty)
+#   CIVET_TOOL_PATH           tool path to prepend to PATH (may be empty)
+#   CIVET_PYTHON              python interpreter used to run validate
+#   CIVET_VALIDATE            path to the validate program
+#   CIVET_RUN_VALIDATION      1 to validate files before running, otherwise 0
+#   CIVET_MASTER_FILE         validation master file
+#   CIVET_FILES_TO_VALIDATE   array of files to validate
+#   CIVET_MODULE_PURGE        true to purge user modulefiles before loading
+#   CIVET_MODULES             array of modulefiles to load
+#   CIVET_MODULE_SNAPSHOT     file to save the environment produced by the
+#                             modulefiles to, or restore it from (may be
+#                             empty)
+#   CIVET_EMAIL_LIST          failure email recipients
+#   CIVET_SEND_FAILURE_EMAIL  true to send an email if the command fails
+#   CIVET_ERROR_STRINGS       array of strings (grep basic regular
+#                             expressions) that indicate failure if found in
+#                             the job's stderr log
+#   CIVET_LOCAL_TEMP          true to create a node-local scratch directory,
+#                             CIVET_SCRATCH, for the tool's temp files
+#
+#   and optionally a civet_version_cmds function that runs the tool's version
+#   commands with civet_version_cmd.  The command of a job that runs tools
+#   connected by streams (named pipes) runs them with civet_stream.
+#
+#   Fused jobs, which run a chain of job scripts in one batch job, define
+#   CIVET_LOGDIR and call civet_chain_job for each job in the chain.
+#
+#   Job scripts check CIVET_JOB_LIB_VERSION after sourcing this file, so the
+#   version must be incremented whenever the interface above changes.  The
+#   matching value in the generator is _JOB_LIB_VERSION in batch_system.py
+#
+
+CIVET_JOB_LIB_VERSION=6
+
+# define civet shell functions
+source "$(dirname "${BASH_SOURCE[0]}")/functions.sh"
+
+function civet_job_failed {
+
+    # report a failure, make sure the epilogue will run, and exit the job
+    local MESSAGE=$1
+    local EXIT_VAL=$2
+    local SEND_EMAIL=$3
+
+    echo "$MESSAGE  Aborting pipeline!" >&2
+    civet_job_scratch_cleanup
+    if $SEND_EMAIL; then
+        send_failure_email $CIVET_EMAIL_LIST "$MESSAGE"
+    fi
+    check_epilogue ${CIVET_LOGDIR}/submitted_shell_scripts/epilogue.sh
+    exit $EXIT_VAL
+}
+
+function civet_job_start {
+
+    local RUN_LOG=${CIVET_LOGDIR}/${PBS_JOBNAME}-run.log
+    local DATE=$(date)
+
+    # the scratch directory is created by civet_job_version, never use one
+    # inherited from the environment
+    unset CIVET_SCRATCH
+
+    exec 2> ${CIVET_LOGDIR}/${PBS_JOBNAME}-err.log
+
+    echo "Run time log for $PBS_JOBNAME ($PBS_JOBID)" > $RUN_LOG
+    echo "Using Civet $CIVET_VERSION" >> $RUN_LOG
+
+    echo "stderr log for $PBS_JOBNAME ($PBS_JOBID)" >&2
+
+    echo "Run began on $DATE" >> $RUN_LOG
+
+    echo "EXECUTION HOST DETAILS:" >> $RUN_LOG
+    uname -a >> $RUN_LOG
+
+    civet_job_modules
+
+    # add any tool/pipeline paths (if specified) to PATH
+    # add the Civet bin directory to our PATH
+    PATH=${CIVET_TOOL_PATH}${CIVET_PIPELINE_PATH}${CIVET_BIN}:$PATH
+
+    # log the PATH in the job's -run.log to assist with debugging
+    echo "PATH=$PATH" >> $RUN_LOG
+
+    cd $PBS_O_WORKDIR
+
+    # run validate command, if configured to do so
+    if [ $CIVET_RUN_VALIDATION -ne 0 ]; then
+        $CIVET_PYTHON $CIVET_VALIDATE -m $CIVET_MASTER_FILE "${CIVET_FILES_TO_VALIDATE[@]}" >> $RUN_LOG
+        local VALIDATION_STATUS=$?
+
+        if [ $VALIDATION_STATUS -ne 0 ]; then
+            civet_job_failed "Command not run, pre-run validation returned non-zero value." $VALIDATION_STATUS true
+        fi
+    fi
+}
+
+function civet_job_modules {
+
+    # set up the job's modulefiles.  If the modulefiles' environment was
+    # saved by an earlier job, restore it rather than running modulecmd. The
+    # snapshot is stale, and the modulefiles are loaded normally, unless
+    # this job starts with the same MODULEPATH, LOADEDMODULES and values of
+    # the variables the modulefiles change as the job that saved it.
+    local RUN_LOG=${CIVET_LOGDIR}/${PBS_JOBNAME}-run.log
+
+    if [ -n "$CIVET_MODULE_SNAPSHOT" ] && [ -r "$CIVET_MODULE_SNAPSHOT" ]; then
+        if source "$CIVET_MODULE_SNAPSHOT"; then
+            echo "Modulefiles restored from $CIVET_MODULE_SNAPSHOT" >> $RUN_LOG
+            return
+        fi
+        echo "Module snapshot $CIVET_MODULE_SNAPSHOT is stale, loading modulefiles" >> $RUN_LOG
+    fi
+
+    # exported variables before the modulefiles are loaded, to find what
+    # they change
+    local -A BEFORE
+    local VAR
+    if [ -n "$CIVET_MODULE_SNAPSHOT" ]; then
+        for VAR in $(compgen -e); do
+            BEFORE[$VAR]=${!VAR}
+        done
+    fi
+
+    if $CIVET_MODULE_PURGE; then
+        # first unload any loaded modulefiles, these may be loaded automatically
+        # in a user's startup scripts, but they could conflict with modulefiles
+        # specified by the Civet tool
+        module purge
+    fi
+
+    # then load modulefiles, if any, specified by the tool xml
+    local MODULE
+    for MODULE in "${CIVET_MODULES[@]}"; do
+        module load $MODULE
+    done
+
+    if [ -z "$CIVET_MODULE_SNAPSHOT" ]; then
+        return
+    fi
+
+    # save the snapshot, written to a temporary file and renamed so a job
+    # never sources a partly written one
+    local TMP_SNAPSHOT="${CIVET_MODULE_SNAPSHOT}.${HOSTNAME}.$$"
+    mkdir -p "$(dirname "$CIVET_MODULE_SNAPSHOT")"
+    {
+        echo "# environment of modulefiles: ${CIVET_MODULES[*]}"
+        local -A AFTER
+        local -A CHANGED
+        for VAR in $(compgen -e); do
+            AFTER[$VAR]=1
+            if [ "$VAR" != "_" ] && [ "${BEFORE[$VAR]-}" != "${!VAR}" ]; then
+                CHANGED[$VAR]=1
+            fi
+        done
+        for VAR in "${!BEFORE[@]}"; do
+            if [ -z "${AFTER[$VAR]+set}" ]; then
+                CHANGED[$VAR]=1
+            fi
+        done
+
+        # the variables must start with the values they had in this job
+        CHANGED[MODULEPATH]=${CHANGED[MODULEPATH]-0}
+        CHANGED[LOADEDMODULES]=${CHANGED[LOADEDMODULES]-0}
+        for VAR in "${!CHANGED[@]}"; do
+            printf '[ "${%s-}" = %q ] || return 1\n' "$VAR" "${BEFORE[$VAR]-}"
+        done
+        for VAR in "${!CHANGED[@]}"; do
+            if [ ${CHANGED[$VAR]} -eq 0 ]; then
+                continue
+            elif [ -n "${AFTER[$VAR]+set}" ]; then
+                printf 'export %s=%q\n' "$VAR" "${!VAR}"
+            else
+                printf 'unset %s\n' "$VAR"
+            fi
+        done
+    } > "$TMP_SNAPSHOT" && mv -f "$TMP_SNAPSHOT" "$CIVET_MODULE_SNAPSHOT"
+    if [ $? -eq 0 ]; then
+        echo "Modulefiles saved to $CIVET_MODULE_SNAPSHOT" >> $RUN_LOG
+    else
+        rm -f "$TMP_SNAPSHOT"
+    fi
+}
+
+function civet_job_version {
+
+    # all pre-job checks passed, create the scratch directory and run any
+    # supplied version commands
+
+    echo "Working directory: $(pwd)" >> ${CIVET_LOGDIR}/${PBS_JOBNAME}-run.log
+
+    if $CIVET_LOCAL_TEMP; then
+        # TMPDIR is the job's own directory on the node's local disk when the
+        # batch system provides one
+        local SCRATCH
+        SCRATCH=$(mktemp -d "${TMPDIR:-/tmp}/civet.XXXXXXXX")
+        if [ $? -ne 0 ]; then
+            civet_job_failed "Could not create scratch directory in ${TMPDIR:-/tmp}." 1 true
+        fi
+        export CIVET_SCRATCH=$SCRATCH
+        echo "Scratch directory: ${HOSTNAME}:${CIVET_SCRATCH}" >> ${CIVET_LOGDIR}/${PBS_JOBNAME}-run.log
+    fi
+
+    # the exit status of the version commands is not checked, a non-zero
+    # status breaks some pipelines
+    if declare -F civet_version_cmds > /dev/null; then
+        civet_version_cmds > ${CIVET_LOGDIR}/${PBS_JOBNAME}-version.log 2>&1
+    fi
+}
+
+function civet_version_cmd {
+
+    # run a version command, unless another job of the pipeline ran it
+    # already.  $1 is the key of the command, identifying its output, which
+    # is saved in the log directory's versions directory and referred to by
+    # every job running the command with the same key.
+    local KEY=$1
+    local CMD=$2
+    local OUTPUT=${CIVET_LOGDIR}/versions/${KEY}.log
+
+    mkdir -p ${CIVET_LOGDIR}/versions
+    # the job that creates the output file runs the command (noclobber)
+    if ( set -C; echo "$CMD" > "$OUTPUT" ) 2> /dev/null; then
+        ( eval "$CMD" ) >> "$OUTPUT" 2>&1
+    fi
+    echo "$CMD: see versions/${KEY}.log"
+}
+
+function civet_job_finish {
+
+    local CMD_EXIT_STATUS=$1
+
+    civet_job_scratch_cleanup
+
+    echo "EXIT STATUS: $CMD_EXIT_STATUS" >> ${CIVET_LOGDIR}/${PBS_JOBNAME}-run.log
+    if [ $CMD_EXIT_STATUS -ne 0 ]; then
+        civet_job_failed "Command returned non-zero value ($CMD_EXIT_STATUS)." $CMD_EXIT_STATUS $CIVET_SEND_FAILURE_EMAIL
+    fi
+
+    # check error log for list of keywords, all of them in a single pass
+    # over the log, which can be large
+    if [ ${#CIVET_ERROR_STRINGS[@]} -gt 0 ]; then
+        if grep -q -f <(printf '%s\n' "${CIVET_ERROR_STRINGS[@]}") ${CIVET_LOGDIR}/${PBS_JOBNAME}-err.log; then
+            civet_job_failed "Found error string in stderr log." 1 $CIVET_SEND_FAILURE_EMAIL
+        fi
+    fi
+
+    check_epilogue ${CIVET_LOGDIR}/submitted_shell_scripts/epilogue.sh
+}
+
+function civet_job_scratch_cleanup {
+
+    # the tool's temp files are only needed while its commands run
+    if [ -n "$CIVET_SCRATCH" ]; then
+        rm -rf "$CIVET_SCRATCH"
+        unset CIVET_SCRATCH
+    fi
+}
+
+function civet_stream {
+
+    # run the commands of tools connected by named pipes at the same time.
+    # usage: civet_stream PIPE... -- COMMAND...
+    # the commands are in pipeline order, each reads the pipes written by
+    # the one before it.
+    #
+    # Opening a pipe blocks until the tool at the other end opens it too.
+    # Whenever a tool exits, every pipe is opened and closed again, which
+    # releases a tool still waiting to open a pipe that the exited tool
+    # never opened: a reader gets end of file and a writer is killed by
+    # SIGPIPE when it writes, so the job fails rather than hanging.  When a
+    # tool fails, the others are killed: a tool kills the tools started
+    # before it, and the tools started after a failed tool are killed here.
+    # Each tool runs in its own process group (set -m), so killing the group
+    # also kills the programs it started.
+    local PIPES=()
+    while [ $# -gt 0 ] && [ "$1" != "--" ]; do
+        PIPES+=("$1")
+        shift
+    done
+    shift
+
+    mkfifo "${PIPES[@]}" || return $?
+
+    local PIDS=()
+    local STATUS=0
+    local CMD PID PIPE EXIT_VAL
+
+    set -m
+    for CMD in "$@"; do
+        (
+            ( eval "$CMD" )
+            EXIT_VAL=$?
+            if [ $EXIT_VAL -ne 0 ]; then
+                echo "Streamed command $((${#PIDS[@]} + 1)) returned non-zero value ($EXIT_VAL)." >&2
+                for PID in "${PIDS[@]}"; do
+                    kill -- -$PID 2> /dev/null
+                done
+            fi
+            # opening a fifo read/write doesn't block
+            for PIPE in "${PIPES[@]}"; do
+                exec 3<> "$PIPE"
+                exec 3<&-
+            done
+            exit $EXIT_VAL
+        ) &
+        PIDS+=($!)
+    done
+    set +m
+
+    for PID in "${PIDS[@]}"; do
+        wait $PID
+        EXIT_VAL=$?
+        # a tool killed by SIGPIPE or SIGTERM is usually the victim of
+        # another tool's failure, prefer reporting that tool's status
+        case $EXIT_VAL in
+            0)
+                ;;
+            141|143)
+                if [ $STATUS -eq 0 ]; then
+                    STATUS=$EXIT_VAL
+                fi
+                ;;
+            *)
+                if [ $STATUS -eq 0 ] || [ $STATUS -eq 141 ] || [ $STATUS -eq 143 ]; then
+                    STATUS=$EXIT_VAL
+                fi
+                local OTHER
+                for OTHER in "${PIDS[@]}"; do
+                    kill -- -$OTHER 2> /dev/null
+                done
+                ;;
+        esac
+    done
+
+    return $STATUS
+}
+
+function civet_chain_job {
+
+    # run one job of a fused chain.  The job script runs in a child shell
+    # under its own job name and working directory.  The epilogue only runs
+    # once for the whole fused job, so the job's -status.txt file is written
+    # here.
+    local NAME=$1
+    local SCRIPT=$2
+    local WORKDIR=$3
+    local STDOUT=$4
+    local STDERR=$5
+    local WALLTIME_REQ=$6
+    local STATUS_FILE=${CIVET_LOGDIR}/${NAME}-status.txt
+    local START=$SECONDS
+
+    rm -f $STATUS_FILE
+    CIVET_CHAIN_MEMBER=1 PBS_JOBNAME=$NAME PBS_O_WORKDIR=$WORKDIR bash $SCRIPT > $STDOUT 2> $STDERR
+    local EXIT_VAL=$?
+    local ELAPSED=$((SECONDS - START))
+
+    # the job script writes its own -status.txt file if it exits because of
+    # its file test, don't recreate it
+    if [ ! -f $STATUS_FILE ]; then
+        echo "exit_status=${EXIT_VAL}" > $STATUS_FILE
+        printf "walltime=%02d:%02d:%02d\n" $((ELAPSED / 3600)) $((ELAPSED % 3600 / 60)) $((ELAPSED % 60)) >> $STATUS_FILE
+        echo "requested_walltime=${WALLTIME_REQ}" >> $STATUS_FILE
+    fi
+
+    if [ $EXIT_VAL -eq 0 ]; then
+        echo "Run finished on $(date)" >> ${CIVET_LOGDIR}/${NAME}-run.log
+    fi
+
+    return $EXIT_VAL
+}
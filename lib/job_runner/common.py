@@ -21,6 +21,13 @@ CANCEL_LOG_FILENAME = "cancel.log"
 NO_SUB_FLAG = "NO_SUBMIT"
 MANAGED_MODE_FLAG = "MANAGED_BATCH"
 GCP_MODE_FLAG = "CLOUD_GCP"
+LOCAL_MODE_FLAG = "LOCAL"
+RELEASE_LIST = "release_list.txt"
+RELEASE_LOG = "civet_release.log"
+REQUEST_STATS = "batch_request_stats.txt"
+SUBMIT_JOURNAL = "submission_journal.txt"
+GENERATED_PATHS = "generated_paths.txt"
+TOOL_JOB_LOG = "tool_job_list.txt"
 
 CIVET_HOME = os.path.normpath(os.path.join(os.path.realpath(os.path.abspath(os.path.split(inspect.getfile( inspect.currentframe() ))[0])), "../../"))
 
@@ -37,6 +44,45 @@ def get_status_from_file(logdir, job_name):
         return None
 
 
+def format_env(variables):
+    """
+        turn a list of (name, value) pairs into a batch environment string
+        (NAME=value,NAME=value).  Commas and backslashes in the values are
+        escaped with a backslash, so a value can be any path.
+    """
+    return ','.join("{0}={1}".format(
+        name, value.replace('\\', '\\\\').replace(',', '\\,'))
+        for name, value in variables)
+
+
+def parse_env(env):
+    """
+        turn a batch environment string (see format_env) into a dictionary
+    """
+    items = []
+    item = []
+    escaped = False
+    for c in env:
+        if escaped:
+            item.append(c)
+            escaped = False
+        elif c == '\\':
+            escaped = True
+        elif c == ',':
+            items.append(''.join(item))
+            item = []
+        else:
+            item.append(c)
+    items.append(''.join(item))
+
+    variables = {}
+    for item in items:
+        if '=' in item:
+            name, value = item.split('=', 1)
+            variables[name] = value
+    return variables
+
+
 def jobs_from_logdir(logdir):
     batch_jobs = []
     for line in open(os.path.join(logdir, BATCH_ID_LOG)):
@@ -0,0 +1,140 @@
+# Copyright 2016 The Jackson Laboratory
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+job_runner/dag.py
+
+algorithms on the job dependency graph of a pipeline.
+
+A graph is described by a list of nodes and a dictionary mapping each node to
+the nodes it depends on.  Nodes can be any hashable value, dependencies on
+values that are not in the node list are ignored (for example dependencies on
+jobs that were already submitted).
+"""
+
+
+def topological_order(nodes, dependencies):
+    """
+    Order nodes so that every node comes after all of the nodes it depends on.
+    Nodes with no ordering constraint between them keep their relative order
+    from the nodes list.
+
+    :param nodes: list of nodes
+    :param dependencies: dictionary of node -> list of nodes it depends on
+    :return: list of nodes in topological order
+    """
+    node_set = set(nodes)
+    dependents = dict((n, []) for n in nodes)
+    remaining = {}
+    for n in nodes:
+        deps = set(d for d in dependencies.get(n, []) if d in node_set)
+        remaining[n] = len(deps)
+        for d in deps:
+            dependents[d].append(n)
+
+    position = dict((n, i) for i, n in enumerate(nodes))
+    ready = [n for n in nodes if remaining[n] == 0]
+    order = []
+    while ready:
+        # keep the ready list sorted by original position so the result is
+        # deterministic
+        ready.sort(key=position.get, reverse=True)
+        n = ready.pop()
+        order.append(n)
+        for child in dependents[n]:
+            remaining[child] -= 1
+            if remaining[child] == 0:
+                ready.append(child)
+
+    if len(order) != len(nodes):
+        raise ValueError("dependency cycle detected in job graph")
+
+    return order
+
+
+def transitive_reduction(nodes, dependencies):
+    """
+    Remove the dependencies that are implied by other dependencies. If a node
+    depends on a and b, and b depends (directly or indirectly) on a, the
+    node's dependency on a is redundant: it can't start before b finishes,
+    which can't happen before a finishes.  Dependencies on values that are
+    not in the node list, and duplicates, are left alone.
+
+    :param nodes: list of nodes
+    :param dependencies: dictionary of node -> list of nodes it depends on
+    :return: dictionary of node -> list of the nodes it depends on, without
+        the redundant dependencies, in their original order
+    """
+    # the ancestors of each node, as a bit set indexed by position in nodes
+    bit = dict((n, 1 << i) for i, n in enumerate(nodes))
+    ancestors = {}
+    reduced = {}
+    for n in topological_order(nodes, dependencies):
+        deps = dependencies.get(n, [])
+        implied = 0
+        direct = 0
+        for d in deps:
+            if d in bit:
+                implied |= ancestors[d]
+                direct |= bit[d]
+        reduced[n] = [d for d in deps if d not in bit or not implied & bit[d]]
+        ancestors[n] = implied | direct
+    return reduced
+
+
+def critical_path_lengths(nodes, dependencies, weight):
+    """
+    Compute the critical path length of each node: the node's own weight
+    plus the largest critical path length of any node that depends on it.
+    This is the least amount of time it will take to finish everything that
+    depends on the node once it starts.
+
+    :param nodes: list of nodes
+    :param dependencies: dictionary of node -> list of nodes it depends on
+    :param weight: function returning the weight (e.g. run time) of a node
+    :return: dictionary of node -> critical path length
+    """
+    node_set = set(nodes)
+    lengths = {}
+    downstream = dict((n, 0) for n in nodes)
+    for n in reversed(topological_order(nodes, dependencies)):
+        lengths[n] = weight(n) + downstream[n]
+        for d in dependencies.get(n, []):
+            if d in node_set:
+                downstream[d] = max(downstream[d], lengths[n])
+    return lengths
+
+
+def levels(nodes, dependencies):
+    """
+    Group nodes into topological levels. Level 0 holds the nodes with no
+    dependencies, level n holds the nodes whose deepest dependency is in level
+    n - 1.  There are no dependencies between nodes in the same level.
+
+    :param nodes: list of nodes
+    :param dependencies: dictionary of node -> list of nodes it depends on
+    :return: list of levels, each level is a list of nodes in the same relative
+        order as the nodes list
+    """
+    node_set = set(nodes)
+    depth = {}
+    for n in topological_order(nodes, dependencies):
+        deps = [depth[d] for d in dependencies.get(n, []) if d in node_set]
+        depth[n] = max(deps) + 1 if deps else 0
+
+    grouped = []
+    for n in nodes:
+        while len(grouped) <= depth[n]:
+            grouped.append([])
+        grouped[depth[n]].append(n)
+    return grouped
@@ -27,13 +27,21 @@ function module {
 }
 
 function get_walltime {
+    get_resource walltime $1
+}
+
+function get_resource {
+
+    # print the value of resource $1 from the comma separated name=value
+    # resource list $2 (the requested or used resources passed to the
+    # epilogue), nothing if it isn't in the list
     local saveIFS=$IFS
     IFS=','
-    for RESOURCE in $1
+    for RESOURCE in $2
     do
         NAME=$(echo $RESOURCE | cut -d "=" -sf 1)
         VALUE=$(echo $RESOURCE | cut -d "=" -sf 2)
-        if [ $NAME = "walltime" ]; then
+        if [ "$NAME" = "$1" ]; then
             echo $VALUE
             IFS=$saveIFS
             return 0
@@ -43,6 +51,27 @@ function get_walltime {
     IFS=$saveIFS
 }
 
+function get_array_job_name {
+
+    # elements of a job array are named <array name>-<index>, the name of the
+    # Civet job run by an element is on line <index> of the array's manifest.
+    # Jobs that are not array elements keep their name
+    local JOBID=$1
+    local JOBNAME=$2
+    local SCRIPT_DIR=$3
+
+    if [[ $JOBID =~ \[([0-9]+)\] ]]; then
+        local INDEX=${BASH_REMATCH[1]}
+        local MANIFEST=${SCRIPT_DIR}/${JOBNAME%-${INDEX}}.manifest
+        if [ -f $MANIFEST ]; then
+            sed -n "${INDEX}{p;q}" $MANIFEST | cut -f 1
+            return 0
+        fi
+    fi
+
+    echo $JOBNAME
+}
+
 function send_failure_email {
 
     # send an email notification regarding the pipeline failure
@@ -72,21 +101,29 @@ function abort_pipeline {
     echo "Aborting pipeline" > ${LOGDIR}/${PBS_JOBNAME}-abort.log
 
     # if this pipeline is "managed" then the pipeline manager will take care
-    # of deleting the rest of the running pipeline jobs
-    if [ -f ${LOGDIR}/MANAGED_BATCH ]; then
+    # of deleting the rest of the running pipeline jobs, likewise for a
+    # pipeline run locally by civet_run --local
+    if [ -f ${LOGDIR}/MANAGED_BATCH ] || [ -f ${LOGDIR}/LOCAL ]; then
         return
     fi
 
-    echo "calling qdel on all jobs (ignoring previous job state)" >> ${LOGDIR}/${PBS_JOBNAME}-abort.log
+    # the epilogue sets CIVET_DELETE_CMD to the batch system's delete
+    # command, epilogues written by older versions of civet don't
+    local DELETE_CMD=${CIVET_DELETE_CMD:-qdel}
+
+    echo "calling ${DELETE_CMD} on all jobs (ignoring previous job state)" >> ${LOGDIR}/${PBS_JOBNAME}-abort.log
     
-    # just iterate over all of the job ids in this pipeline and try to 
-    # qdel them.  We don't care what the state is, or even if they still exit
+    # delete all of the other jobs in this pipeline with a single delete
+    # command (xargs only splits the list if it is too long for one command
+    # line), rather than one command and server connection per job.  We don't
+    # care what the state is, or even if they still exist
     while read ID NAME DEP; do
         if [ "$ID" != "$PBS_JOBID" ]; then
-            echo "calling qdel on $ID (${NAME})" >> ${LOGDIR}/${PBS_JOBNAME}-abort.log
-            qdel ${ID} >> ${LOGDIR}/${PBS_JOBNAME}-abort.log 2>&1
+            echo "deleting $ID (${NAME})" >> ${LOGDIR}/${PBS_JOBNAME}-abort.log
+            echo "$ID"
         fi
-    done < ${LOGDIR}/pipeline_batch_id_list.txt
+    done < ${LOGDIR}/pipeline_batch_id_list.txt | \
+        xargs -r ${DELETE_CMD} >> ${LOGDIR}/${PBS_JOBNAME}-abort.log 2>&1
 
 }
 
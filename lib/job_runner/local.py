@@ -0,0 +1,410 @@
+# Copyright 2016 The Jackson Laboratory
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+job_runner/local.py
+
+run the jobs of a pipeline on the current host instead of submitting them to
+a batch system.
+
+LocalJobRunner writes the same job scripts and epilogue as the batch system
+backends, and LocalExecutor runs the pipeline's task list (as created by
+Pipeline.create_task_list()) with a dependency aware process pool.  A job is
+only started once all of its dependencies have completed successfully and
+there are enough free cores and memory for it.  Every job writes its
+-status.txt file through the epilogue, just like a batch job, so civet_status
+can report on a local pipeline.
+
+Local pipelines are canceled like managed pipelines: civet_cancel writes the
+cancel log and the executor stops the pipeline's jobs when it sees it.
+"""
+
+from __future__ import print_function
+
+import datetime
+import getpass
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from batch_job import *
+from batch_system import BatchJobManager, BatchJobRunner
+import common
+
+
+# prefix of the IDs given to local jobs
+JOB_ID_PREFIX = "local."
+
+
+class JobManager(BatchJobManager):
+    """
+        local jobs are not in any queue, everything civet_status needs to know
+        about them is in their -status.txt files.  The executor running the
+        pipeline takes care of canceling them.
+    """
+
+    E_UNKNOWN = 1
+    E_STATE = 2
+
+    # jobs are stopped with SIGTERM, a job killed by a signal exits with
+    # 128 + the signal number
+    CANCELED_EXIT_STATUS = 128 + signal.SIGTERM
+    WALLTIME_LIMIT_EXIT_STATUS = -11
+
+    def query_job(self, job_id):
+        return None
+
+    def delete_job(self, job_id):
+        return self.E_UNKNOWN
+
+    def release_job(self, job_id):
+        return 0
+
+
+class LocalJobRunner(BatchJobRunner):
+    """
+        writes the job scripts of a pipeline that will be run by a
+        LocalExecutor.  Jobs can't be submitted, except with submit=False to
+        only generate the scripts.
+    """
+
+    # abort_pipeline doesn't delete the jobs of a local pipeline, the
+    # executor stops running them once a job fails
+    delete_command = "true"
+
+    # every job runs on this host, there is no NFS attribute cache to wait for
+    io_sync_sleep = False
+
+    def _submit_job(self, batch_job, filename, array_size=None):
+        if self.submit:
+            raise ValueError("jobs can not be submitted to the local batch "
+                             "system, use civet_run --local to run the "
+                             "pipeline on this host")
+
+        #self.submit is False, fake a job ID
+        job_id = "{0}{1}".format(JOB_ID_PREFIX, self._id_seq)
+        self._id_seq += 1
+        self._log_job_id(job_id, batch_job)
+        return job_id
+
+    @staticmethod
+    def array_element_id(array_id, index):
+        return "{0}-{1}".format(array_id, index)
+
+    @staticmethod
+    def _generate_directives(batch_job, epilogue_filename=None):
+        """
+            Generate comments documenting the resources requested by the job.
+            There is no batch system to read them, the LocalExecutor gets the
+            job's resources from its task.
+
+            :param batch_job: BatchJob for which to generate the comments
+        """
+        directives = ["# walltime={0}".format(batch_job.walltime),
+                      "# threads={0}".format(batch_job.ppn)]
+
+        if batch_job.mem:
+            directives.append("# mem={0}".format(batch_job.mem))
+
+        if batch_job.name:
+            directives.append("# name={0}".format(batch_job.name))
+
+        return '\n'.join(directives)
+
+    @staticmethod
+    def generate_env(workdir):
+        """
+            Generate the environment string for a job, the executor adds these
+            variables to its own environment when it runs the job
+
+            :param workdir: working directory of the job
+        """
+        return common.format_env([('PBS_O_WORKDIR', workdir)])
+
+    @staticmethod
+    def submit_managed_job(task):
+        raise ValueError("managed batch mode requires a batch system")
+
+    @staticmethod
+    def submit_simple_job(task):
+        raise ValueError("managed batch mode requires a batch system")
+
+    def release_all(self):
+        self.held_jobs = []
+
+    def get_job_manager(self):
+        return JobManager()
+
+
+class _LocalJob(object):
+    """
+        a task being run by a LocalExecutor
+
+        task: task dictionary
+        job_id: ID given to the job, used as its PBS_JOBID
+        threads: cores reserved for the job
+        mem: memory (GB) reserved for the job
+        process: Popen of the job script, then of the epilogue
+        in_epilogue: True once the job script has exited and the epilogue has
+            been started
+        start_time: time the job script was started
+    """
+    def __init__(self, task, job_id):
+        self.task = task
+        self.job_id = job_id
+        self.threads = int(task['threads']) if task.get('threads') else 1
+        self.mem = int(task['mem']) if task.get('mem') else 0
+        self.process = None
+        self.in_epilogue = False
+        self.start_time = None
+
+    @property
+    def name(self):
+        return self.task['name']
+
+
+def _physical_memory():
+    """
+        :return: physical memory of this host in GB
+    """
+    return (os.sysconf('SC_PAGE_SIZE') *
+            os.sysconf('SC_PHYS_PAGES')) // (1024 ** 3)
+
+
+def _format_walltime(seconds):
+    seconds = int(seconds)
+    return "{0:02d}:{1:02d}:{2:02d}".format(seconds // 3600,
+                                            seconds % 3600 // 60,
+                                            seconds % 60)
+
+
+class LocalExecutor(object):
+    """
+        run a list of tasks on the current host
+
+        log_dir: pipeline log directory
+        max_cores: number of cores the pipeline may use, defaults to all of
+            them
+        max_mem: memory (GB) the pipeline may use, defaults to all physical
+            memory.  Jobs that don't request memory aren't counted.
+        poll_interval: seconds to wait between checks of the running jobs
+    """
+
+    def __init__(self, log_dir, max_cores=None, max_mem=None,
+                 poll_interval=0.5):
+        self.log_dir = log_dir
+        self.max_cores = max_cores if max_cores else multiprocessing.cpu_count()
+        self.max_mem = max_mem if max_mem else _physical_memory()
+        self.poll_interval = poll_interval
+        self.job_ids = []
+        self._cores_used = 0
+        self._mem_used = 0
+
+    def run(self, tasks, silent=False):
+        """
+            run the tasks, returning once they have all finished or the
+            pipeline has been aborted or canceled
+            :param tasks: list of task dictionaries, each task's dependencies
+                are the names of earlier tasks
+            :param silent: if True, only errors are printed
+            :return: True if every task completed successfully
+        """
+        jobs = []
+        by_name = {}
+        for i, task in enumerate(tasks):
+            job = _LocalJob(task, "{0}{1}".format(JOB_ID_PREFIX, i))
+            jobs.append(job)
+            by_name[job.name] = job
+
+        for job in jobs:
+            for dep in job.task['dependencies']:
+                if dep not in by_name:
+                    raise ValueError("{0} depends on unknown task {1}".format(
+                        job.name, dep))
+
+        self._log_job_ids(jobs, by_name)
+
+        pending = list(jobs)
+        running = []
+        complete = set()
+        failed = False
+        canceled = False
+
+        try:
+            while pending or running:
+                progress = False
+
+                if not canceled and os.path.exists(os.path.join(
+                        self.log_dir, common.CANCEL_LOG_FILENAME)):
+                    if not silent:
+                        print("Pipeline canceled, stopping all jobs")
+                    canceled = True
+                    self._stop(running, pending)
+                    break
+
+                for job in list(running):
+                    if job.process.poll() is None:
+                        continue
+                    progress = True
+                    if not job.in_epilogue:
+                        self._start_epilogue(job)
+                        continue
+
+                    running.remove(job)
+                    self._release(job)
+                    status = common.get_status_from_file(self.log_dir,
+                                                         job.name)
+                    if status and status.get('exit_status') == '0':
+                        complete.add(job.name)
+                    else:
+                        print("{0} failed, aborting pipeline".format(job.name),
+                              file=sys.stderr)
+                        failed = True
+
+                if failed:
+                    # like abort_pipeline deleting the rest of a batch
+                    # pipeline's jobs
+                    self._stop(running, pending)
+                    break
+
+                for job in list(pending):
+                    if not all(dep in complete
+                               for dep in job.task['dependencies']):
+                        continue
+                    if not self._fits(job, running):
+                        continue
+                    pending.remove(job)
+                    self._start(job)
+                    running.append(job)
+                    progress = True
+                    if not silent:
+                        print("{0}: {1}".format(job.job_id, job.name))
+
+                if not progress:
+                    time.sleep(self.poll_interval)
+
+        except KeyboardInterrupt:
+            # treat an interrupt like civet_cancel
+            print("Interrupted, stopping all jobs", file=sys.stderr)
+            with open(os.path.join(self.log_dir, common.CANCEL_LOG_FILENAME),
+                      'w') as cancel_log:
+                cancel_log.write("DATESTAMP=" + datetime.datetime.now().strftime(
+                    '%Y-%m-%d %H:%M:%S') + '\n')
+            self._stop(running, pending)
+            return False
+
+        return not failed and not canceled
+
+    def _log_job_ids(self, jobs, by_name):
+        """
+            list every job in the pipeline's batch ID log, this is the list of
+            jobs civet_status reports on
+        """
+        with open(os.path.join(self.log_dir, common.BATCH_ID_LOG),
+                  'w') as id_log:
+            for job in jobs:
+                deps = [by_name[d].job_id for d in job.task['dependencies']]
+                id_log.write(job.job_id + '\t' + job.name + '\t' +
+                             str(deps) + '\n')
+                self.job_ids.append(job.job_id)
+
+    def _fits(self, job, running):
+        """
+            check if there are enough free cores and memory to start a job.
+            A job that asks for more than the whole budget is run by itself.
+        """
+        if not running:
+            return True
+        return (self._cores_used + job.threads <= self.max_cores and
+                self._mem_used + job.mem <= self.max_mem)
+
+    def _start(self, job):
+        task = job.task
+        env = dict(os.environ)
+        env.update(common.parse_env(task.get('batch_env', '')))
+        env['PBS_JOBID'] = job.job_id
+        env['PBS_JOBNAME'] = job.name
+
+        # job scripts written for SLURM run the epilogue themselves unless
+        # they are run as part of a larger job, we run it
+        env['CIVET_CHAIN_MEMBER'] = '1'
+
+        with open(task['stdout_path'], 'w') as stdout, \
+                open(task['stderr_path'], 'w') as stderr:
+            job.process = subprocess.Popen(['bash', task['script_path']],
+                                           stdout=stdout, stderr=stderr,
+                                           cwd=env.get('PBS_O_WORKDIR'),
+                                           env=env, preexec_fn=os.setsid)
+        job.start_time = time.time()
+        self._cores_used += job.threads
+        self._mem_used += job.mem
+
+    def _start_epilogue(self, job):
+        """
+            run the epilogue for a job whose script has exited, with the same
+            arguments Torque passes to a job epilogue
+        """
+        exit_status = job.process.returncode
+        if exit_status < 0:
+            # killed by a signal
+            exit_status = 128 - exit_status
+
+        task = job.task
+        args = ['bash', task['epilogue_path'], job.job_id, getpass.getuser(),
+                '', job.name, '',
+                "walltime={0}".format(task['walltime']),
+                "walltime={0}".format(
+                    _format_walltime(time.time() - job.start_time)),
+                '', '', str(exit_status)]
+
+        with open(task['stdout_path'], 'a') as stdout, \
+                open(task['stderr_path'], 'a') as stderr:
+            job.process = subprocess.Popen(args, stdout=stdout, stderr=stderr,
+                                           preexec_fn=os.setsid)
+        job.in_epilogue = True
+
+    def _release(self, job):
+        self._cores_used -= job.threads
+        self._mem_used -= job.mem
+
+    def _stop(self, running, pending):
+        """
+            stop the running jobs and record them, and any pending jobs, as
+            canceled the same way civet_cancel does
+        """
+        for job in running:
+            try:
+                os.killpg(job.process.pid, signal.SIGTERM)
+            except OSError:
+                # already exited
+                pass
+        for job in running:
+            job.process.wait()
+            self._release(job)
+            self._write_canceled(job, 'R')
+        for job in pending:
+            self._write_canceled(job, 'H')
+
+    def _write_canceled(self, job, state):
+        status_file = os.path.join(self.log_dir,
+                                   job.name + common.JOB_STATUS_SUFFIX)
+        if not os.path.exists(status_file):
+            with open(status_file, 'w') as summary_file:
+                summary_file.write("canceled=TRUE\n")
+                summary_file.write("state_at_cancel={0}".format(state))
+
+
+JobRunner = LocalJobRunner
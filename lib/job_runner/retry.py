@@ -0,0 +1,157 @@
+# Copyright 2016 The Jackson Laboratory
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+job_runner/retry.py
+
+RetryPolicy makes requests of the batch system, retrying the ones that fail
+with a transient error (the server is busy or dropped the connection) with
+exponential backoff.  Requests that fail with a permanent error (a bad queue
+or resource request) are not retried, there is no point waiting to be told
+the same thing again.
+
+The delay before each retry is chosen at random between zero and the
+exponential backoff limit ("full jitter"), so that many clients retrying
+against a struggling server don't all hit it again at the same moment.
+
+Every policy counts its requests, retries and failures and how long the
+requests took, see all_stats() and write_stats().
+"""
+
+from __future__ import print_function
+
+import random
+import sys
+import threading
+import time
+
+
+_policies = {}
+_policies_lock = threading.Lock()
+
+
+class RetryPolicy(object):
+    """
+        name: name of the request, used in messages and statistics
+        is_transient: function taking the exception raised by a failed
+            request, returns True if the request should be retried
+        max_retries: maximum number of times to retry a request
+        base_delay: backoff limit (seconds) for the first retry, doubled for
+            each retry after that
+        max_delay: maximum backoff limit (seconds)
+
+        Policies are shared per process, use get_policy() to create them.
+    """
+
+    def __init__(self, name, is_transient, max_retries=4, base_delay=2.0,
+                 max_delay=30.0):
+        self.name = name
+        self.is_transient = is_transient
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def delay(self, retry):
+        """
+            :param retry: retry number, starting at 1
+            :return: seconds to wait before the retry
+        """
+        limit = min(self.max_delay, self.base_delay * 2 ** (retry - 1))
+        return random.uniform(0, limit)
+
+    def call(self, request, *args, **kwargs):
+        """
+            call request(*args, **kwargs), retrying it while it raises an
+            exception that is_transient() accepts
+            :return: the value returned by request
+            :raises: the exception raised by the last attempt, if it failed
+        """
+        start = time.time()
+        retry = 0
+        try:
+            while True:
+                try:
+                    return request(*args, **kwargs)
+                except Exception as e:
+                    if retry >= self.max_retries or not self.is_transient(e):
+                        with self._lock:
+                            self.failures += 1
+                        raise
+                    retry += 1
+                    delay = self.delay(retry)
+                    print("{0} failed ({1}), retrying in {2:.1f} "
+                          "seconds...".format(self.name, e, delay),
+                          file=sys.stderr)
+                    time.sleep(delay)
+        finally:
+            elapsed = time.time() - start
+            with self._lock:
+                self.calls += 1
+                self.retries += retry
+                self.total_seconds += elapsed
+                self.max_seconds = max(self.max_seconds, elapsed)
+
+    def stats(self):
+        """
+            :return: dictionary of the policy's statistics
+        """
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'retries': self.retries,
+                'failures': self.failures,
+                'total_seconds': round(self.total_seconds, 3),
+                'max_seconds': round(self.max_seconds, 3)
+            }
+
+
+def get_policy(name, is_transient, **kwargs):
+    """
+        return the process-wide RetryPolicy for requests called name,
+        creating it if necessary.  See RetryPolicy for the arguments.
+    """
+    with _policies_lock:
+        if name not in _policies:
+            _policies[name] = RetryPolicy(name, is_transient, **kwargs)
+        return _policies[name]
+
+
+def all_stats():
+    """
+        :return: dictionary of policy name -> statistics for every policy that
+            has been used
+    """
+    with _policies_lock:
+        policies = list(_policies.values())
+    return dict((p.name, p.stats()) for p in policies if p.calls)
+
+
+def write_stats(path):
+    """
+        write the statistics of every policy that has been used to path, as
+        <policy>.<statistic>=<value> lines
+    """
+    stats = all_stats()
+    if not stats:
+        return
+    with open(path, 'w') as f:
+        for name in sorted(stats):
+            for key in sorted(stats[name]):
+                f.write("{0}.{1}={2}\n".format(name, key, stats[name][key]))
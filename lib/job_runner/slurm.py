@@ -0,0 +1,744 @@
+#!/usr/bin/env python
+
+# Copyright 2016 The Jackson Laboratory
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+job_runner/slurm.py
+
+provide functionality for queueing and querying jobs on a SLURM cluster
+
+Jobs are submitted with 'sbatch --parsable' and controlled with the SLURM
+command line tools, which must be in PATH.  The names of the commands are
+module attributes so they can be pointed at stub programs for testing.
+
+Civet job scripts and the job library use the Torque names for the job
+variables (PBS_JOBID, PBS_JOBNAME, PBS_O_WORKDIR, PBS_ARRAYID), the
+directives block written at the top of each SLURM job script sets them from
+their SLURM equivalents.  SLURM has no per-job epilogue, so the job script
+runs the Civet epilogue itself when it exits.
+"""
+
+from __future__ import print_function
+
+import getpass
+import subprocess
+import sys
+import tempfile
+import textwrap
+
+# make sure we look in the parent directory for modules when running as a script
+# so that we can find the utilities module
+if __name__ == "__main__":
+    sys.path.insert(0, "..")
+
+from batch_job import *
+from batch_system import BatchJobManager, BatchJobRunner
+import common
+import retry as retry_policy
+import utilities
+
+
+SBATCH = "sbatch"
+SQUEUE = "squeue"
+SACCT = "sacct"
+SCANCEL = "scancel"
+SCONTROL = "scontrol"
+
+#TODO: make dependency type settable per job
+_DEFAULT_DEPEND_TYPE = "afterok"
+
+# SLURM only lets users lower the priority of their jobs, by raising their
+# nice value.  Critical path priorities are scaled to 0 - _MAX_PRIORITY and
+# jobs are submitted with --nice=_MAX_PRIORITY - priority, so the jobs on the
+# critical path are not penalized at all
+_MAX_PRIORITY = 1000
+
+# sbatch/squeue/scontrol error messages for failures that may go away if the
+# command is retried, the controller is busy or unreachable.  Other failures
+# (an invalid partition or job id...) are permanent and are not retried.
+_TRANSIENT_MESSAGES = (
+    "Socket timed out",
+    "Unable to contact slurm controller",
+    "Resource temporarily unavailable",
+    "Zero Bytes were transmitted",
+    "Connection refused",
+    "temporarily unable",
+    "try again",
+)
+
+# job IDs passed to a single squeue/sacct/scancel/scontrol command
+_MAX_IDS_PER_COMMAND = 1000
+
+# squeue states of jobs that have not finished, and the Torque state letter
+# civet uses for them. Pending jobs are mapped by their reason, see
+# _torque_state()
+_ACTIVE_STATES = {
+    'RUNNING': 'R',
+    'COMPLETING': 'R',
+    'CONFIGURING': 'R',
+    'SUSPENDED': 'R',
+    'STOPPED': 'R',
+    'SIGNALING': 'R',
+    'STAGE_OUT': 'R',
+    'RESIZING': 'R',
+    'REQUEUED': 'Q',
+    'REQUEUE_HOLD': 'H',
+    'REQUEUE_FED': 'Q',
+    'RESV_DEL_HOLD': 'H',
+}
+
+# Torque style mail options -> sbatch --mail-type
+_MAIL_TYPES = {
+    'a': "FAIL",
+    'b': "BEGIN",
+    'e': "END"
+}
+
+
+class _TransientFailure(Exception):
+    def __init__(self, rval, out, err):
+        super(_TransientFailure, self).__init__(err.strip())
+        self.result = (rval, out, err)
+
+
+def _is_transient(e):
+    return isinstance(e, _TransientFailure)
+
+
+def _run_once(cmd, retry_transient, env=None):
+    try:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, env=env)
+        out, err = process.communicate()
+        rval = process.returncode
+    except OSError as e:
+        out, err, rval = "", str(e), -1
+
+    if rval and retry_transient and \
+            any(message in err for message in _TRANSIENT_MESSAGES):
+        raise _TransientFailure(rval, out, err)
+    return rval, out, err
+
+
+def _run(cmd, retry=True, env=None):
+    """
+        run a SLURM command
+        :param cmd: command as a list of arguments
+        :param retry: if True, retry a command that fails with a transient
+            error. The SLURM controller may be too busy to respond to a
+            request.
+        :param env: environment for the command, defaults to ours
+        :return: (exit status, stdout, stderr)
+    """
+    policy = retry_policy.get_policy(os.path.basename(cmd[0]), _is_transient)
+    try:
+        return policy.call(_run_once, cmd, retry, env)
+    except _TransientFailure as e:
+        return e.result
+
+
+def _chunks(ids):
+    for i in range(0, len(ids), _MAX_IDS_PER_COMMAND):
+        yield ids[i:i + _MAX_IDS_PER_COMMAND]
+
+
+def _slurm_mem(mem):
+    """
+        convert a Torque style memory request (e.g. '4gb') to the form used
+        by sbatch --mem (e.g. '4G')
+    """
+    mem = str(mem).lower()
+    for suffix in ['kb', 'mb', 'gb', 'tb']:
+        if mem.endswith(suffix):
+            return mem[:-len(suffix)] + suffix[0].upper()
+    return mem
+
+
+def _slurm_walltime(walltime):
+    """
+        normalize a walltime to hours:minutes:seconds, which sbatch accepts
+        even if the number of hours is more than a day
+    """
+    return BatchJob.walltime_seconds_to_string(
+        BatchJob.walltime_string_to_seconds(walltime))
+
+
+def _torque_walltime(slurm_time):
+    """
+        convert a time reported by squeue or sacct ([days-]hours:minutes:seconds
+        with leading fields omitted when zero) to hours:minutes:seconds
+    """
+    if not slurm_time or slurm_time.upper() in ("UNLIMITED", "INVALID",
+                                                "NOT_SET"):
+        return None
+    days = 0
+    if '-' in slurm_time:
+        days, slurm_time = slurm_time.split('-', 1)
+    seconds = BatchJob.walltime_string_to_seconds(slurm_time)
+    return BatchJob.walltime_seconds_to_string(int(days) * 86400 + seconds)
+
+
+def array_element_id(array_id, index):
+    """
+        return the ID of an element of a job array
+        :param array_id: job array ID, e.g. '1234'
+        :param index: element index
+        :return: element ID, e.g. '1234_5'
+    """
+    return "{0}_{1}".format(array_id, index)
+
+
+class JobManager(BatchJobManager):
+    """
+        This class encapsulates the functionality for monitoring and controlling
+        SLURM jobs.
+
+        query_jobs() makes a single squeue request for all of the jobs, and
+        a single sacct request for any that squeue no longer lists.
+    """
+
+    # SLURM error codes for an invalid job id and a job that has already
+    # completed, scancel only reports them as messages
+    E_UNKNOWN = 2017
+    E_STATE = 2021
+
+    # a job killed by scancel or its time limit gets SIGTERM, the job script
+    # records 128 + SIGTERM as its exit status
+    CANCELED_EXIT_STATUS = 143
+    WALLTIME_LIMIT_EXIT_STATUS = -11
+
+    def __init__(self, user=None):
+        """
+        :param user: user whose jobs are listed by squeue, defaults to the
+            current user
+        """
+        self.user = user if user else getpass.getuser()
+
+    def query_job(self, job_id):
+        """
+            Query the status of a job
+
+            query_job will return None if SLURM does not know the job,
+            otherwise it will return a JobStatus object.
+
+            :param job_id: job id of job to query
+        """
+        return self.query_jobs([job_id])[job_id]
+
+    def query_jobs(self, job_ids):
+        """
+            Query the status of several jobs
+
+            :param job_ids: list of job ids to query
+            :return: dictionary of job id -> JobStatus, or None if SLURM does
+                not know the job
+        """
+        if not job_ids:
+            return {}
+
+        statuses = self._squeue(job_ids)
+        finished = [job_id for job_id in job_ids if job_id not in statuses]
+        if finished:
+            statuses.update(self._sacct(finished))
+        for job_id in job_ids:
+            statuses.setdefault(job_id, None)
+        return statuses
+
+    def _squeue(self, job_ids):
+        """
+            list the user's unfinished jobs.  squeue rejects the whole request
+            if any of the job ids it is given are unknown, so rather than
+            passing job_ids we list all of the user's jobs and pick out ours.
+        """
+        wanted = set(job_ids)
+        rval, out, err = _run([SQUEUE, "--noheader", "--array",
+                               "--user", self.user,
+                               "--format", "%i|%j|%T|%r|%M|%l"])
+        if rval != 0:
+            raise Exception("Error querying SLURM jobs: {}".format(err.strip()))
+
+        statuses = {}
+        for line in out.splitlines():
+            fields = line.strip().split('|')
+            if len(fields) != 6 or fields[0] not in wanted:
+                continue
+            job_id, name, state, reason, used, limit = fields
+            torque_state = _torque_state(state, reason)
+            if torque_state is None:
+                # finished, get the exit status from sacct
+                continue
+            statuses[job_id] = JobStatus(name, torque_state, None,
+                                         _torque_walltime(used),
+                                         _torque_walltime(limit))
+        return statuses
+
+    def _sacct(self, job_ids):
+        """
+            get the status of finished jobs from the accounting database
+        """
+        statuses = {}
+        for chunk in _chunks(job_ids):
+            rval, out, err = _run([SACCT, "--noheader", "--parsable2",
+                                   "--allocations", "--jobs", ",".join(chunk),
+                                   "--format",
+                                   "JobID,JobName,State,ExitCode,Elapsed,Timelimit"])
+            if rval != 0:
+                # accounting may not be enabled, we just don't know about
+                # these jobs
+                continue
+            for line in out.splitlines():
+                fields = line.strip().split('|')
+                if len(fields) != 6:
+                    continue
+                job_id, name, state, exit_code, elapsed, limit = fields
+                state = state.split()[0] if state else state
+                torque_state = _torque_state(state, None)
+                if torque_state is None:
+                    torque_state = 'C'
+                    exit_status = self._exit_status(state, exit_code)
+                else:
+                    exit_status = None
+                statuses[job_id] = JobStatus(name, torque_state, exit_status,
+                                             _torque_walltime(elapsed),
+                                             _torque_walltime(limit))
+        return statuses
+
+    def _exit_status(self, state, exit_code):
+        """
+            Torque style exit status of a finished job, a string like
+            JobStatus.exit_status
+        """
+        if state == "TIMEOUT":
+            return str(self.WALLTIME_LIMIT_EXIT_STATUS)
+        if state == "CANCELLED":
+            # deleted, possibly before it ran
+            return None
+        status, signal = (exit_code.split(':') + ['0'])[:2]
+        if int(signal):
+            return str(128 + int(signal))
+        return status
+
+    def delete_job(self, job_id):
+        """
+           Cancel a job
+
+           :param job_id: job id to delete
+           :return:  0 on success, otherwise an error code
+        """
+        return self._scancel([job_id]).get(job_id, 0)
+
+    def delete_jobs(self, job_ids):
+        """
+            Cancel several jobs with a single scancel command
+
+            :param job_ids: list of job ids
+            :return: dictionary of job id -> error code for the jobs that could
+                not be deleted, other than because they are unknown or
+                already complete.
+        """
+        errors = self._scancel(job_ids)
+        return dict((job_id, rval) for job_id, rval in errors.items()
+                    if rval not in (self.E_UNKNOWN, self.E_STATE))
+
+    def _scancel(self, job_ids):
+        errors = {}
+        for chunk in _chunks(list(job_ids)):
+            rval, out, err = _run([SCANCEL] + chunk, retry=False)
+            if rval == 0:
+                continue
+            # scancel reports each job it could not cancel on its own line,
+            # e.g. "scancel: error: Kill job error on job id 1234: Invalid job
+            # id specified"
+            reported = False
+            for line in err.splitlines():
+                for job_id in chunk:
+                    if "job id {}:".format(job_id) in line or \
+                            "job id {} ".format(job_id) in line:
+                        reported = True
+                        if "Invalid job id" in line:
+                            errors[job_id] = self.E_UNKNOWN
+                        elif "already complet" in line:
+                            errors[job_id] = self.E_STATE
+                        else:
+                            errors[job_id] = rval
+            if not reported:
+                for job_id in chunk:
+                    errors[job_id] = rval
+        return errors
+
+    def release_job(self, job_id):
+        """
+        Release a user hold on a job
+        :param job_id: job to release
+        """
+        return self.release_jobs([job_id]).get(job_id, 0)
+
+    def release_jobs(self, job_ids):
+        """
+            Release the user hold on several jobs with a single scontrol
+            command
+            :param job_ids: list of job ids
+            :return: dictionary of job id -> error code for the jobs that
+                could not be released
+        """
+        errors = {}
+        for chunk in _chunks(list(job_ids)):
+            rval, out, err = _run([SCONTROL, "release", ",".join(chunk)])
+            if rval:
+                for job_id in chunk:
+                    errors[job_id] = rval
+        return errors
+
+    def queued_job_count(self):
+        """
+            :return: number of pending jobs (from all users) that are eligible
+                to run, None if squeue fails
+        """
+        rval, out, err = _run([SQUEUE, "-h", "-r", "-t", "PENDING", "-o",
+                               "%r"])
+        if rval:
+            return None
+        return sum(1 for reason in out.split()
+                   if _torque_state('PENDING', reason) == 'Q')
+
+
+def _torque_state(state, reason):
+    """
+        map a SLURM job state to the Torque state letter civet uses, None for
+        a job that has finished
+    """
+    if state == 'PENDING':
+        if reason in ("Dependency", "JobHeldUser", "JobHeldAdmin"):
+            return 'H'
+        elif reason == "BeginTime":
+            return 'W'
+        return 'Q'
+    return _ACTIVE_STATES.get(state)
+
+
+class JobStatus(object):
+    """
+        JobStatus - the status of a SLURM job, with the same properties as the
+        Torque JobStatus
+
+        state: Torque job state letter (Q, H, W, R or C)
+        exit_status: exit status (as a string) of a completed job, otherwise None
+    """
+    def __init__(self, name, state, exit_status, walltime, requested_walltime):
+        self.name = name
+        self.state = state
+        self.exit_status = exit_status
+        self._walltime = walltime
+        self._requested_walltime = requested_walltime
+
+    # squeue and sacct don't report these
+    error_path = None
+    stdout_path = None
+
+    @property
+    def walltime(self):
+        return self._walltime if self._walltime else "00:00:00"
+
+    @property
+    def requested_walltime(self):
+        return self._requested_walltime if self._requested_walltime else "unlimited"
+
+
+class SlurmJobRunner(BatchJobRunner):
+    """
+        SlurmJobRunner is a class that encapsulates the functionality of
+        submitting jobs to a SLURM cluster.
+
+        See BatchJobRunner for the attributes shared by all job runners.
+    """
+
+    max_priority = _MAX_PRIORITY
+    delete_command = SCANCEL
+
+    array_element_id = staticmethod(array_element_id)
+
+    def _submit_job(self, batch_job, filename, array_size=None):
+        """
+            submit a BatchJob whose script has already been written
+            :param batch_job: job to submit
+            :param filename: path to the job script
+            :param array_size: if not None, submit as a job array with this
+                many elements
+            :return: job id
+        """
+        if self.submit:
+            stdout_path = batch_job.stdout_path
+            stderr_path = batch_job.stderr_path
+            if array_size:
+                # like Torque, give each array element its own stdout/stderr
+                stdout_path += "-%a"
+                stderr_path += "-%a"
+
+            args = self._sbatch_args(batch_job.name, batch_job.nodes,
+                                     batch_job.ppn, batch_job.walltime,
+                                     batch_job.mem, stdout_path, stderr_path,
+                                     batch_job.mail_option,
+                                     batch_job.email_list, self.queue)
+
+            if batch_job.depends_on:
+                args.append("--dependency=" + self._dependency_string(batch_job))
+            elif self.submit_with_hold:
+                args.append("--hold")
+
+            if batch_job.date_time:
+                args.append("--begin=" + batch_job.date_time.strftime("%Y-%m-%dT%H:%M:%S"))
+
+            if batch_job.priority is not None:
+                args.append("--nice={0}".format(max(0, _MAX_PRIORITY - batch_job.priority)))
+
+            if array_size:
+                array = "--array=1-{0}".format(array_size)
+                if self.array_slot_limit:
+                    array += "%{0}".format(self.array_slot_limit)
+                args.append(array)
+
+            job_id = self.submit_with_retry(
+                args, filename,
+                self._job_env(batch_job.name,
+                              self.generate_env(batch_job.workdir)))
+
+            if self.submit_with_hold and not batch_job.depends_on:
+                self.held_jobs.append(job_id)
+
+        else:
+            #self.submit is False, fake a job ID
+            job_id = "{0}".format(self._id_seq)
+            self._id_seq += 1
+
+        self.submitted_jobs.append(job_id)
+        return job_id
+
+    @staticmethod
+    def _sbatch_args(name, nodes, ppn, walltime, mem, stdout_path,
+                     stderr_path, mail_option, email_list, queue):
+        """
+            build the sbatch options shared by all of our submissions.  The
+            job's variables are passed in sbatch's environment, see _job_env
+            :return: list of sbatch options
+        """
+        args = ["--job-name=" + name,
+                "--nodes={0}".format(nodes),
+                "--ntasks-per-node=1",
+                "--cpus-per-task={0}".format(ppn),
+                "--export=ALL"]
+
+        if walltime:
+            args.append("--time=" + _slurm_walltime(walltime))
+        if mem:
+            args.append("--mem=" + _slurm_mem(mem))
+        if stdout_path:
+            args.append("--output=" + stdout_path)
+        if stderr_path:
+            args.append("--error=" + stderr_path)
+        if queue:
+            args.append("--partition=" + queue)
+
+        if mail_option and mail_option != 'n':
+            args.append("--mail-type=" + ",".join(_MAIL_TYPES[o] for o in mail_option))
+        if email_list:
+            args.append("--mail-user=" + email_list)
+
+        return args
+
+    @staticmethod
+    def _job_env(name, env):
+        """
+            build the environment to run sbatch with, which --export=ALL
+            passes on to the job.  The variables aren't listed in --export
+            itself, sbatch splits its argument on commas so a value such as
+            a path containing one would be broken up.
+
+            :param name: job name
+            :param env: batch environment string, see generate_env
+            :return: environment dictionary
+        """
+        job_env = dict(os.environ)
+        job_env.update(common.parse_env(env))
+        # PBS_JOBNAME is set explicitly so the job can't inherit one from the
+        # submitting environment (e.g. civet_managed_batch_master submitting
+        # jobs from its own batch job)
+        job_env['PBS_JOBNAME'] = name
+        return job_env
+
+    @staticmethod
+    def submit_with_retry(args, script_path, env=None):
+        """
+        submit a job with sbatch, retrying on failure.
+
+        :param args: list of sbatch options
+        :param script_path: path to the job script
+        :param env: environment to run sbatch with, see _job_env
+        :return: job id
+        """
+        rval, out, err = _run([SBATCH, "--parsable"] + args + [script_path],
+                              env=env)
+        if rval != 0:
+            raise Exception("Error submitting job.  "
+                            "sbatch error: '{0}'".format(err.strip()))
+
+        # --parsable prints "jobid" or "jobid;cluster"
+        return out.strip().split(';')[0]
+
+    @staticmethod
+    def submit_managed_job(task):
+        """
+        submit a managed job from the civet_managed_batch_master program.  Not
+        passed as a BatchJob object, but simply as dictionary describing the
+        task
+        :param task: dictionary describing the task.
+        :return: batch job ID
+        """
+        args = SlurmJobRunner._sbatch_args(task['name'], 1, task['threads'],
+                                           task['walltime'], task['mem'],
+                                           task['stdout_path'],
+                                           task['stderr_path'],
+                                           task['mail_options'],
+                                           task['email_list'],
+                                           task['queue'])
+        return SlurmJobRunner.submit_with_retry(
+            args, str(task['script_path']),
+            SlurmJobRunner._job_env(task['name'], task['batch_env']))
+
+    @staticmethod
+    def submit_simple_job(task):
+        """
+        Submit a basic batch job, without all the extra stuff used in a normal
+        civet job.  This is used to submit the civet_managed_batch_master
+        command.
+        :param task:
+        :return:
+        """
+        workdir = task.get('workdir', os.getcwd())
+        args = SlurmJobRunner._sbatch_args(task['name'], 1,
+                                           task.get('threads', '1'),
+                                           task['walltime'], task.get('mem'),
+                                           task.get('stdout_path'),
+                                           task.get('stderr_path'),
+                                           task.get('mail_options'),
+                                           task.get('email_list'),
+                                           task['queue'])
+
+        # generate a simple batch submission script to run our command
+        with tempfile.NamedTemporaryFile(delete=False) as tf:
+            tf.write("#!/bin/bash\n")
+            tf.write("cd $PBS_O_WORKDIR\n")
+            tf.write(task['cmd'])
+            script_path = tf.name
+
+        job_id = SlurmJobRunner.submit_with_retry(
+            args, script_path,
+            SlurmJobRunner._job_env(task['name'],
+                                    SlurmJobRunner.generate_env(workdir)))
+        os.unlink(script_path)
+
+        return job_id
+
+    def get_job_manager(self):
+        return JobManager()
+
+    @staticmethod
+    def generate_env(workdir):
+        """
+            Generate the environment variables to export to the job, in
+            addition to the submitting environment (see _job_env)
+
+            :param workdir: working directory of the job
+        """
+        # our script start with "cd $PBS_O_WORKDIR", make sure we set it
+        return common.format_env([('PBS_O_WORKDIR', workdir)])
+
+    @staticmethod
+    def _generate_directives(batch_job, epilogue_filename=None):
+        """
+            Generate #SBATCH directives to insert into batch script to
+            facilitate rerunning individual scripts by hand (during
+            development) as well as documenting the resources requested when
+            the job was submitted.  They are followed by the code that maps the
+            SLURM job variables to the Torque names used by civet, and that
+            runs the epilogue when the job exits.
+
+            :param batch_job: BatchJob for which to generate directives
+            :param epilogue_filename: path of the job epilogue
+        """
+        directives = ["#SBATCH --time=" + _slurm_walltime(batch_job.walltime),
+                      "#SBATCH --nodes={0}".format(batch_job.nodes),
+                      "#SBATCH --ntasks-per-node=1",
+                      "#SBATCH --cpus-per-task={0}".format(batch_job.ppn)]
+
+        if batch_job.mem:
+            directives.append("#SBATCH --mem=" + _slurm_mem(batch_job.mem))
+
+        if batch_job.name:
+            directives.append("#SBATCH --job-name=" + batch_job.name)
+
+        if batch_job.stderr_path:
+            directives.append("#SBATCH --error=" + batch_job.stderr_path)
+
+        if batch_job.stdout_path:
+            directives.append("#SBATCH --output=" + batch_job.stdout_path)
+
+        directives.append(textwrap.dedent("""
+            # civet uses the Torque names for the job's variables
+            if [ -n "${SLURM_ARRAY_JOB_ID}" ]; then
+                export PBS_JOBID=${SLURM_ARRAY_JOB_ID}_${SLURM_ARRAY_TASK_ID}
+                export PBS_ARRAYID=${SLURM_ARRAY_TASK_ID}
+            else
+                export PBS_JOBID=${SLURM_JOB_ID:-$PBS_JOBID}
+            fi
+            export PBS_JOBNAME=${PBS_JOBNAME:-$SLURM_JOB_NAME}
+            export PBS_O_WORKDIR=${PBS_O_WORKDIR:-$SLURM_SUBMIT_DIR}"""))
+
+        if epilogue_filename:
+            # the jobs of a fused chain are run by the chain's job, which
+            # runs the epilogue for all of them
+            walltime = batch_job.walltime if batch_job.walltime else "unlimited"
+            directives.append(textwrap.dedent("""
+                # SLURM has no per-job epilogue, run ours when the job exits
+                if [ -z "${{CIVET_CHAIN_MEMBER}}" ]; then
+                    trap 'exit 143' TERM
+                    trap 'CIVET_EXIT=$?; bash {0} "$PBS_JOBID" "" "" "$PBS_JOBNAME" "" "walltime={1}" "walltime=$(printf "%02d:%02d:%02d" $((SECONDS / 3600)) $((SECONDS % 3600 / 60)) $((SECONDS % 60)))" "" "" $CIVET_EXIT' EXIT
+                fi
+                unset CIVET_CHAIN_MEMBER""").format(epilogue_filename, walltime))
+
+        return '\n'.join(directives)
+
+    @staticmethod
+    def _dependency_string(batch_job):
+        """
+            Generate a SLURM dependency string for a batch job to be passed to
+            sbatch --dependency. A dependency on a job array is satisfied once
+            every element of the array has completed successfully.
+
+            This will return empty string if batch_job.depends_on is empty.
+
+            :param batch_job: BatchJob for which to generate dependency string
+            :return: dependency string for job
+        """
+        if not batch_job.depends_on:
+            return ""
+        elif isinstance(batch_job.depends_on, utilities.string_types):
+            depends_on = [batch_job.depends_on]
+        else:
+            depends_on = batch_job.depends_on
+
+        return "{0}:{1}".format(_DEFAULT_DEPEND_TYPE, ':'.join(depends_on))
+
+
+# the names used to look up the classes of a backend, see batch_system.py
+JobRunner = SlurmJobRunner
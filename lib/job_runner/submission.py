@@ -0,0 +1,624 @@
+# Copyright 2016 The Jackson Laboratory
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+job_runner/submission.py
+
+support for deferred job submission.  Rather than submitting each job as soon
+as it is queued, a job runner can record the jobs of a pipeline in a
+SubmissionPlan and submit them afterwards, one dependency level at a time.
+All of the jobs in a level are independent of each other, so they can be
+submitted concurrently.
+
+Jobs queued with an array key can be merged into job arrays: all of the
+jobs that share a key (for example the same tool in every iteration of a
+foreach) are submitted with a single request, and each job becomes one
+element of the array.
+
+Linear chains of jobs can also be fused: a job whose only purpose is to
+feed the next one is run in the same batch job as its successor, saving the
+scheduling overhead of a separate job.
+
+Job scripts are written by a ScriptWriter on a pool of worker threads, so
+the time spent waiting on a slow shared file system overlaps with building
+the rest of the plan and with submitting the jobs whose scripts are already
+written.
+
+Every job is recorded in a SubmissionJournal as soon as it is submitted, so
+that a submission that was interrupted can be resumed: the plan is rebuilt and
+only the jobs that are missing from the journal are submitted.
+"""
+
+import threading
+
+import dag
+import utilities
+
+
+class PendingJobId(str):
+    """
+    Placeholder returned in place of a batch job ID for a job that has been
+    queued in a SubmissionPlan but not yet submitted.  It can be used anywhere
+    a job ID is used while building a pipeline (creator jobs, depends_on
+    lists), and is replaced by the real ID when the plan is submitted.
+
+    The value of the placeholder is the job name, which is unique within a
+    pipeline.
+    """
+    pass
+
+
+class PendingJob(object):
+    """
+    a job in a SubmissionPlan
+
+    batch_job: the BatchJob to submit
+    script_path: path of the job script written for batch_job
+    placeholder: PendingJobId handed out for this job
+    job_id: batch system job ID, set once the job is submitted
+    error: exception raised while submitting the job, if any
+    array_key: jobs with the same array key may be submitted as one job array
+    array: the PendingArray this job was merged into, if any
+    array_index: index of this job within its array (starting at 1)
+    chain: the PendingChain this job was fused into, if any
+    fusable: False if the job must not be fused into a chain
+    writes: ScriptWrites that must finish before the job is submitted
+    """
+    def __init__(self, batch_job, script_path, array_key=None, fusable=True,
+                 writes=None):
+        self.batch_job = batch_job
+        self.script_path = script_path
+        self.writes = writes if writes else []
+        self.placeholder = PendingJobId(batch_job.name)
+        self.job_id = None
+        self.error = None
+        self.array_key = array_key
+        self.array = None
+        self.array_index = None
+        self.chain = None
+        self.fusable = fusable
+
+
+class PendingArray(object):
+    """
+    a group of PendingJobs that will be submitted as a single job array
+
+    key: array key shared by the members
+    members: list of PendingJobs, element i of the array runs members[i - 1]
+    batch_job: BatchJob describing the array, set by the job runner before
+        submission
+    script_path: path of the array's job script
+    job_id: batch system ID of the array, set once the array is submitted
+    error: exception raised while submitting the array, if any
+    writes: ScriptWrites for the array's script and manifest
+    """
+    def __init__(self, key, members):
+        self.key = key
+        self.members = members
+        self.batch_job = None
+        self.script_path = None
+        self.writes = []
+        self.job_id = None
+        self.error = None
+
+        for i, pending in enumerate(members, 1):
+            pending.array = self
+            pending.array_index = i
+
+    def __len__(self):
+        return len(self.members)
+
+
+class PendingChain(object):
+    """
+    a chain of PendingJobs that will run one after the other in a single
+    batch job.  Each job in the chain depends on the job before it, and
+    nothing else has to wait for a job in the chain that doesn't also have
+    to wait for the next job.
+
+    members: list of PendingJobs, in the order they run
+    batch_job: BatchJob describing the fused job, set by the job runner
+        before submission
+    script_path: path of the fused job's script
+    job_id: batch system ID of the fused job, shared by all members
+    error: exception raised while submitting the chain, if any
+    writes: ScriptWrites for the fused job's script
+    """
+    def __init__(self, members):
+        self.members = members
+        self.batch_job = None
+        self.script_path = None
+        self.writes = []
+        self.job_id = None
+        self.error = None
+
+        for pending in members:
+            pending.chain = self
+
+    def __len__(self):
+        return len(self.members)
+
+
+def unit_writes(unit):
+    """
+    :param unit: PendingJob, PendingArray or PendingChain
+    :return: the ScriptWrites that must finish before the unit can be
+        submitted.  An array or chain runs its members' scripts, so it waits
+        for those as well as its own.
+    """
+    writes = list(unit.writes)
+    if isinstance(unit, (PendingArray, PendingChain)):
+        for pending in unit.members:
+            writes.extend(pending.writes)
+    return writes
+
+
+class ScriptWrite(object):
+    """
+    a file queued for writing by a ScriptWriter
+
+    path: path of the file
+    error: exception raised while writing the file, if any
+    """
+    def __init__(self, path, content):
+        self.path = path
+        self.content = content
+        self.error = None
+        self._done = threading.Event()
+
+    def finish(self, error=None):
+        self.error = error
+        self.content = None
+        self._done.set()
+
+    def wait(self):
+        """
+        wait for the file to be written, re-raising any error from writing it
+        """
+        # wait with a timeout so that a KeyboardInterrupt isn't blocked
+        while not self._done.wait(1):
+            pass
+        if self.error:
+            raise self.error
+
+
+class ScriptWriter(object):
+    """
+    writes files on a pool of worker threads.  The queue of files waiting to
+    be written is bounded, write() blocks once it is full so that a large
+    pipeline doesn't hold all of its rendered scripts in memory.
+    """
+    def __init__(self, max_workers, max_pending=None):
+        """
+        :param max_workers: number of writer threads
+        :param max_pending: maximum number of files waiting to be written,
+            defaults to four per thread
+        """
+        self.max_workers = max(1, max_workers)
+        if not max_pending:
+            max_pending = 4 * self.max_workers
+        self._queue = utilities.queue.Queue(max_pending)
+        self._threads = []
+
+    def write(self, path, content):
+        """
+        queue a file to be written
+        :param path: path of the file
+        :param content: string to write to the file
+        :return: ScriptWrite to wait on
+        """
+        if not self._threads:
+            for i in range(self.max_workers):
+                t = threading.Thread(target=self._worker)
+                t.daemon = True
+                t.start()
+                self._threads.append(t)
+
+        script_write = ScriptWrite(path, content)
+        self._queue.put(script_write)
+        return script_write
+
+    def _worker(self):
+        while True:
+            script_write = self._queue.get()
+            if script_write is None:
+                return
+            try:
+                with open(script_write.path, "w") as f:
+                    f.write(script_write.content)
+            except (IOError, OSError) as e:
+                script_write.finish(e)
+            else:
+                script_write.finish()
+
+    def close(self):
+        """
+        wait for the queued files to be written and stop the writer threads
+        """
+        for t in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+
+class SubmissionJournal(object):
+    """
+    records each batch job of a pipeline as soon as it has been submitted.
+    Each line is
+
+        <job ID>\t<job name>\t<1 if submitted with a user hold, otherwise 0>
+
+    and a final line containing only COMPLETE is written once every job of
+    the pipeline has been submitted.  The file is only created when the first
+    job is recorded.
+    """
+    COMPLETE = "COMPLETE"
+
+    def __init__(self, path, append=False):
+        """
+        :param path: path of the journal
+        :param append: if True, add to an existing journal rather than
+            replacing it
+        """
+        self.path = path
+        self._mode = 'a' if append else 'w'
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _write(self, line):
+        with self._lock:
+            if not self._file:
+                self._file = open(self.path, self._mode)
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def record(self, job_id, name, held):
+        """
+        :param job_id: batch system ID of the job
+        :param name: job name
+        :param held: True if the job was submitted with a user hold
+        """
+        self._write("{0}\t{1}\t{2}".format(job_id, name, int(bool(held))))
+
+    def complete(self):
+        """
+        record that the whole pipeline has been submitted
+        """
+        self._write(self.COMPLETE)
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+            self._mode = 'a'
+
+    @classmethod
+    def load(cls, path):
+        """
+        read a journal written by an earlier submission of the pipeline
+        :param path: path of the journal
+        :return: (jobs, complete) jobs is a dictionary of job name ->
+            (job ID, held) for the jobs that were submitted, complete is True
+            if the earlier submission finished
+        """
+        jobs = {}
+        complete = False
+        with open(path) as journal:
+            for line in journal:
+                fields = line.rstrip('\n').split('\t')
+                if fields == [cls.COMPLETE]:
+                    complete = True
+                elif len(fields) == 3:
+                    jobs[fields[1]] = (fields[0], fields[2] == '1')
+                # anything else is a line that was only partly written when
+                # the earlier submission was interrupted
+        return jobs, complete
+
+
+def array_compatible(batch_job):
+    """
+    jobs can only share a job array if they would be submitted with the same
+    attributes, this returns a value that is equal for such jobs
+    :param batch_job: BatchJob
+    """
+    return (batch_job.nodes, batch_job.ppn, batch_job.walltime, batch_job.mem,
+            batch_job.workdir, batch_job.mail_option, batch_job.email_list,
+            batch_job.date_time)
+
+
+class SubmissionPlan(object):
+    """
+    The ordered set of jobs queued for deferred submission.
+    """
+
+    def __init__(self):
+        self.jobs = []
+        self.arrays = []
+        self.chains = []
+        self._by_placeholder = {}
+
+    def add(self, batch_job, script_path, array_key=None, fusable=True,
+            writes=None):
+        """
+        add a job to the plan
+        :param batch_job: BatchJob to submit
+        :param script_path: path of the job script written for batch_job
+        :param array_key: optional key, jobs with the same key may be merged
+            into a job array by build_arrays()
+        :param fusable: if False, build_chains() won't fuse this job
+        :param writes: ScriptWrites that must finish before the job is
+            submitted
+        :return: PendingJobId to use in place of the job's batch ID
+        """
+        pending = PendingJob(batch_job, script_path, array_key, fusable,
+                             writes)
+        self.jobs.append(pending)
+        self._by_placeholder[pending.placeholder] = pending
+        return pending.placeholder
+
+    def dependencies(self, pending):
+        """
+        :param pending: PendingJob
+        :return: list of job IDs and placeholders the job depends on
+        """
+        depends_on = pending.batch_job.depends_on
+        if not depends_on:
+            return []
+        elif isinstance(depends_on, utilities.string_types):
+            return [depends_on]
+        return list(depends_on)
+
+    def _array_groups(self):
+        """
+        :return: list of (array key, members, mergeable) for the jobs queued
+            with an array key, in the order the first member was queued.
+            mergeable is True if the members can form a job array.
+        """
+        groups = {}
+        keys = []
+        for pending in self.jobs:
+            if pending.array_key is None or pending.chain is not None:
+                continue
+            if pending.array_key not in groups:
+                groups[pending.array_key] = []
+                keys.append(pending.array_key)
+            groups[pending.array_key].append(pending)
+
+        return [(key, groups[key], len(groups[key]) > 1 and
+                 len(set(array_compatible(p.batch_job)
+                         for p in groups[key])) == 1)
+                for key in keys]
+
+    def build_arrays(self):
+        """
+        merge the jobs that share an array key into PendingArrays.  Jobs are
+        only merged if there is more than one of them and they are array
+        compatible, any other job is submitted on its own.
+        :return: list of PendingArrays
+        """
+        for key, members, mergeable in self._array_groups():
+            if mergeable:
+                self.arrays.append(PendingArray(key, members))
+
+        return self.arrays
+
+    def single_array_jobs(self, key_prefix):
+        """
+        :param key_prefix: prefix of the array keys to count
+        :return: number of jobs queued with an array key starting with
+            key_prefix that build_arrays() won't merge into an array, so
+            they will be submitted on their own
+        """
+        return sum(len(members)
+                   for key, members, mergeable in self._array_groups()
+                   if key.startswith(key_prefix) and not mergeable)
+
+    def reduce_dependencies(self):
+        """
+        drop the dependencies between queued jobs that are implied by other
+        dependencies (see dag.transitive_reduction), so that each job is
+        submitted with the shortest dependency list that gives the same
+        ordering.  Must be called before build_arrays() and build_chains().
+        """
+        graph = dict((pending, [self._by_placeholder.get(d, d)
+                                for d in self.dependencies(pending)])
+                     for pending in self.jobs)
+        reduced = dag.transitive_reduction(self.jobs, graph)
+        for pending in self.jobs:
+            depends_on = [d.placeholder if isinstance(d, PendingJob) else d
+                          for d in reduced[pending]]
+            if len(depends_on) < len(graph[pending]):
+                pending.batch_job.depends_on = depends_on
+
+    def build_chains(self):
+        """
+        fuse linear chains of jobs into PendingChains.  Job b is fused onto
+        the end of the chain ending with job a if:
+
+          - b depends on a, and b's other dependencies are also dependencies
+            of a, so running b right after a never makes b wait longer
+          - every other job that depends on a job in a's chain also depends
+            on b, so running the chain and b together never makes another job
+            wait longer
+
+        Jobs with an array key are left alone so they can form job arrays, as
+        are jobs added with fusable=False.
+        :return: list of PendingChains
+        """
+        dependents = dict((pending, set()) for pending in self.jobs)
+        depends_on = {}
+        for pending in self.jobs:
+            depends_on[pending] = set(self._by_placeholder[d]
+                                      for d in self.dependencies(pending)
+                                      if isinstance(d, PendingJobId))
+            for d in depends_on[pending]:
+                dependents[d].add(pending)
+
+        chain_of = {}
+        for pending in self.jobs:
+            if pending.array_key is not None or not pending.fusable:
+                continue
+            for prev in depends_on[pending]:
+                if prev.array_key is not None or not prev.fusable:
+                    continue
+                chain = chain_of.get(prev, [prev])
+                if chain[-1] is not prev:
+                    continue
+                other_deps = set(self.dependencies(pending))
+                other_deps.discard(prev.placeholder)
+                if not other_deps <= set(self.dependencies(prev)):
+                    continue
+                if not all(d is pending or d in chain or pending in depends_on[d]
+                           for member in chain for d in dependents[member]):
+                    continue
+                chain.append(pending)
+                for member in chain:
+                    chain_of[member] = chain
+                break
+
+        seen = set()
+        for pending in self.jobs:
+            chain = chain_of.get(pending)
+            if chain and id(chain) not in seen:
+                seen.add(id(chain))
+                self.chains.append(PendingChain(chain))
+
+        return self.chains
+
+    def units(self):
+        """
+        :return: list of things to submit, the jobs that are not part of an
+            array or chain, the arrays and the chains, in the order the
+            (first) job was queued
+        """
+        units = []
+        for pending in self.jobs:
+            if pending.chain is not None:
+                if pending is pending.chain.members[0]:
+                    units.append(pending.chain)
+            elif pending.array is None:
+                units.append(pending)
+            elif pending.array_index == 1:
+                units.append(pending.array)
+        return units
+
+    def _unit(self, pending):
+        if pending.chain is not None:
+            return pending.chain
+        return pending.array if pending.array is not None else pending
+
+    def unit_dependencies(self, unit):
+        """
+        :param unit: PendingJob or PendingArray
+        :return: list of the job IDs and placeholders the unit depends on. For
+            an array or chain, this is the union of its members' dependencies
+            on jobs outside of it.
+        """
+        if isinstance(unit, (PendingArray, PendingChain)):
+            members = set(p.placeholder for p in unit.members)
+            depends_on = []
+            for pending in unit.members:
+                for d in self.dependencies(pending):
+                    if d not in depends_on and d not in members:
+                        depends_on.append(d)
+            return depends_on
+        return self.dependencies(unit)
+
+    def graph(self):
+        """
+        :return: (units, dependencies) where units is the list returned by
+            units() and dependencies maps each unit to the units it depends on
+        """
+        units = self.units()
+        graph = {}
+        for unit in units:
+            graph[unit] = [self._unit(self._by_placeholder[d])
+                           for d in self.unit_dependencies(unit)
+                           if isinstance(d, PendingJobId)]
+        return units, graph
+
+    def levels(self):
+        """
+        :return: the jobs and arrays of the plan grouped by dependency level,
+            each level in the order the jobs were queued
+        """
+        units, graph = self.graph()
+        return dag.levels(units, graph)
+
+    def critical_paths(self):
+        """
+        :return: dictionary of unit -> critical path length in seconds, using
+            each unit's requested walltime as its run time.  Every element
+            of an array is assumed to run at the same time.
+        """
+        units, graph = self.graph()
+        return dag.critical_path_lengths(units, graph, self._walltime)
+
+    @staticmethod
+    def _walltime(unit):
+        # arrays and chains must already have their batch_job
+        walltime = unit.batch_job.walltime
+        if not walltime:
+            return 0
+        return unit.batch_job.walltime_string_to_seconds(walltime)
+
+    def resolve(self, job_id):
+        """
+        translate a placeholder into the real job ID. Anything that is not a
+        placeholder is returned unchanged.
+        :param job_id: job ID or PendingJobId
+        :return: job ID, or None if the job has not been submitted
+        """
+        if isinstance(job_id, PendingJobId):
+            return self._by_placeholder[job_id].job_id
+        return job_id
+
+    def resolve_dependencies(self, unit):
+        """
+        replace any placeholders in a job's (or array's) depends_on with the
+        real job IDs.  A job that depends on some of the jobs submitted as
+        elements of an array depends on those elements alone, or on the whole
+        array if it depends on all of them.  Every element of an array is
+        submitted with the same dependencies, so an array that depends on
+        elements of another array depends on the whole of that array.  Must
+        be called after all of the jobs it depends on have been submitted.
+        :param unit: PendingJob, PendingArray or PendingChain
+        """
+        dependencies = self.unit_dependencies(unit)
+        members = {}
+        for d in dependencies:
+            if isinstance(d, PendingJobId):
+                pending = self._by_placeholder[d]
+                if pending.array is not None:
+                    members.setdefault(pending.array, set()).add(pending)
+
+        depends_on = []
+        for d in dependencies:
+            if isinstance(d, PendingJobId):
+                pending = self._by_placeholder[d]
+                array = pending.array
+                if array is not None and (isinstance(unit, PendingArray) or
+                                          len(members[array]) == len(array)):
+                    job_id = array.job_id
+                else:
+                    # the element's ID for an array member, the chain's for
+                    # a chain member
+                    job_id = pending.job_id
+            else:
+                job_id = d
+            assert job_id is not None
+            if job_id not in depends_on:
+                depends_on.append(job_id)
+        unit.batch_job.depends_on = depends_on
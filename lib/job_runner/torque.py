@@ -22,11 +22,10 @@ provide functionality for queueing and querying jobs on a TORQUE cluster
 
 from __future__ import print_function
 
-import errno
+import re
 import sys
-import textwrap
 import socket
-import stat
+import threading
 import time
 import tempfile
 
@@ -39,20 +38,158 @@ if __name__ == "__main__":
     sys.path.insert(0, "..")
     
 from batch_job import *
+from batch_system import BatchJobManager, BatchJobRunner
 import common
 import civet_exceptions
-import utilities
-import version
 import config
+import retry
+import utilities
 
 #TODO: make dependency type settable per job
 _DEFAULT_DEPEND_TYPE = "afterok"
 
-_SHELL_SCRIPT_DIR = "submitted_shell_scripts"
+# Torque job priorities range from -1024 to 1023, critical path priorities
+# are scaled to 0 - _MAX_PRIORITY
+_MAX_PRIORITY = 1023
 
 _error_strings = None
 
-_MAX_RETRY = 4
+# Torque errors (see torque_errors.txt) that may go away if the request is
+# retried: the server is busy or restarting, or the connection was dropped.
+# Other errors, such as an unknown queue or an invalid resource request, are
+# permanent and are not retried.
+_TRANSIENT_ERRORS = frozenset([
+    15008,  # trqauthd unable to authenticate
+    15012,  # System error
+    15013,  # PBS server internal error
+    15014,  # Dependent parent job currently in routing queue
+    15033,  # Batch protocol error
+    15035,  # No free connections
+    15046,  # Resource temporarily unavailable
+    15049,  # Checkpoint busy, may retry
+    15058,  # Bad DIS based Request Protocol
+    15062,  # Request not allowed: Server shutting down
+    15085,  # Time out
+    15091,  # Error allocating memory - out of memory
+    15092,  # Error allocating controling mutex
+    15093,  # Error setting thread attributes
+    15094,  # Error creating thread
+    15095,  # Error in socket select
+    15096,  # Unable to get connection to socket
+    15097,  # Error writing data to socket
+    15098,  # Error reading data from socket
+    15099,  # Socket close detected
+    15100,  # Error listening on socket
+    15111,  # socket information is not accessible
+    15112,  # data on socket does not process correctly
+    15114,  # Premature End of File
+    15120,  # Can not establish connection
+    15121,  # Job function must be temporarily delayed
+    15133,  # Could not connect to batch server
+    15134,  # Server busy. Currently no available threads
+])
+
+# pbs_server will drop a client connection that has been idle for a while.
+# Rather than risk using a connection the server has already closed, we throw
+# away pooled connections that have not been used for this many seconds
+_MAX_CONNECTION_IDLE = 60
+
+_connection_pools = {}
+_connection_pools_lock = threading.Lock()
+
+# the parts of the job environment string that are the same for every job,
+# see TorqueJobRunner.generate_env()
+_static_env = None
+
+
+class TorqueError(Exception):
+    """
+        a request to pbs_server failed, code is the Torque error code.  If
+        ambiguous is True the code may belong to a request made concurrently
+        on another thread, see _ErrnoTracker
+    """
+    def __init__(self, message, code, ambiguous=False):
+        super(TorqueError, self).__init__("{0}.  Torque error {1}: '{2}'{3}".format(
+            message, code, torque_strerror(code),
+            " (may be the error of a concurrent request)" if ambiguous else ""))
+        self.code = code
+        self.ambiguous = ambiguous
+
+
+class _ErrnoTracker(object):
+    """
+        libtorque reports why a request failed in the process-wide pbs_errno,
+        which pbs.error() reads.  Requests are made concurrently from several
+        threads without serializing them, so the pbs_errno read after a failed
+        request may have been set by a request on another thread.
+
+        Every request is bracketed by start() and finish().  finish() reads
+        pbs_errno for a failed request and reports whether any other request
+        started, finished or was still in flight while it ran, in which case
+        the error code is ambiguous.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._events = 0
+
+    def start(self):
+        """
+            :return: token to pass to finish()
+        """
+        with self._lock:
+            self._in_flight += 1
+            self._events += 1
+            return self._events
+
+    def finish(self, token, failed):
+        """
+            :param token: value returned by start()
+            :param failed: True if the request failed
+            :return: (error code, ambiguous), error code is None if the request
+                succeeded
+        """
+        with self._lock:
+            code = None
+            ambiguous = False
+            if failed:
+                code = pbs.error()[0]
+                ambiguous = self._in_flight > 1 or self._events != token
+            self._in_flight -= 1
+            self._events += 1
+            return code, ambiguous
+
+
+_errno_tracker = _ErrnoTracker()
+
+
+def _is_transient(e):
+    """
+        return True if a failed pbs_server request should be retried
+    """
+    if isinstance(e, PBSQuery.PBSError):
+        # PBSQuery raises PBSError when it can't connect to the server
+        return True
+    if isinstance(e, TorqueError):
+        # codes that aren't Torque error codes (such as 0 or a system errno)
+        # come from the connection rather than the server
+        return (e.ambiguous or e.code in _TRANSIENT_ERRORS or
+                not _is_torque_error(e.code))
+    return False
+
+
+_CONNECT_RETRY = retry.get_policy("pbs_connect", _is_transient)
+_QUERY_RETRY = retry.get_policy("pbs_query", _is_transient)
+_SUBMIT_RETRY = retry.get_policy("pbs_submit", _is_transient)
+
+
+def _connect(server_name):
+    token = _errno_tracker.start()
+    connection = pbs.pbs_connect(server_name)
+    code, ambiguous = _errno_tracker.finish(token, connection <= 0)
+    if connection <= 0:
+        raise TorqueError("Error connecting to pbs_server", code, ambiguous)
+    return connection
 
 
 def _connect_to_server(server=None):
@@ -63,33 +200,129 @@ def _connect_to_server(server=None):
         This function is shared between JobManager and TorqueJobRunner
     """
     server_name = server if server else pbs.pbs_default()
+    return _CONNECT_RETRY.call(_connect, server_name)
 
-    retry = 0
-    connection = pbs.pbs_connect(server_name)
 
-    while connection <= 0 and retry < _MAX_RETRY:
-        retry += 1
-        time.sleep(retry ** 2)
-        connection = pbs.pbs_connect(server_name)
-        
-    if connection <= 0:
-        e, e_msg = pbs.error()
-        # the batch system returned an error, throw exception 
-        raise Exception("Error connecting to pbs_server.  "
-            "Torque error {0}: '{1}'".format(e, torque_strerror(e)))
-        
-    return connection
-
-
-def torque_strerror(err):
+def _load_error_strings():
     global _error_strings
     if not _error_strings:
         _error_strings = dict(line.strip().split('\t') for line in open(os.path.join(common.CIVET_HOME, "lib/job_runner/torque_errors.txt")))
-            
-    return _error_strings[str(err)]
+    return _error_strings
 
-        
-class JobManager(object):
+
+def _is_torque_error(err):
+    return str(err) in _load_error_strings()
+
+
+def torque_strerror(err):
+    return _load_error_strings().get(str(err), "unknown error")
+
+
+def is_array_id(job_id):
+    """
+        return True if job_id is the ID of a whole job array (e.g.
+        '1234[].server')
+    """
+    return '[]' in job_id
+
+
+def array_element_id(array_id, index):
+    """
+        return the ID of an element of a job array
+        :param array_id: job array ID, e.g. '1234[].server'
+        :param index: element index
+        :return: element ID, e.g. '1234[5].server'
+    """
+    return array_id.replace('[]', '[{0}]'.format(index), 1)
+
+
+def get_connection_pool(server=None):
+    """
+        return the ConnectionPool for a pbs_server, creating it if necessary.
+
+        There is one pool per server per process, so a TorqueJobRunner and any
+        JobManager talking to the same server share their connections.
+    """
+    with _connection_pools_lock:
+        if server not in _connection_pools:
+            _connection_pools[server] = ConnectionPool(server)
+        return _connection_pools[server]
+
+
+class ConnectionPool(object):
+    """
+        A pool of open connections to a pbs_server.
+
+        Opening a connection to pbs_server costs a TCP handshake and an
+        authentication round trip through trqauthd, and a busy server may take
+        several seconds to accept one.  Rather than connecting and
+        disconnecting for every request, callers acquire() a connection, make
+        their request, and release() it back to the pool for reuse.
+
+        A connection that produced an error may have been dropped by the
+        server; callers should discard() it instead of releasing it, and the
+        next acquire() will transparently open a new connection.  Connections
+        that have been idle longer than _MAX_CONNECTION_IDLE seconds are also
+        discarded rather than reused.
+    """
+
+    def __init__(self, server=None):
+        self.server = server
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+            get a connection from the pool, connecting to the server if there
+            are no usable idle connections
+            :return: pbs_server connection handle
+        """
+        stale = []
+        connection = None
+        now = time.time()
+        with self._lock:
+            while self._idle:
+                c, last_used = self._idle.pop()
+                if now - last_used < _MAX_CONNECTION_IDLE:
+                    connection = c
+                    break
+                stale.append(c)
+
+        for c in stale:
+            pbs.pbs_disconnect(c)
+
+        if connection is None:
+            connection = _connect_to_server(self.server)
+        return connection
+
+    def release(self, connection):
+        """
+            return a healthy connection to the pool
+            :param connection: connection obtained from acquire()
+        """
+        with self._lock:
+            self._idle.append((connection, time.time()))
+
+    def discard(self, connection):
+        """
+            close a connection that may no longer be usable rather than
+            returning it to the pool
+            :param connection: connection obtained from acquire()
+        """
+        pbs.pbs_disconnect(connection)
+
+    def close(self):
+        """
+            disconnect all idle connections
+        """
+        with self._lock:
+            idle = self._idle
+            self._idle = []
+        for c, last_used in idle:
+            pbs.pbs_disconnect(c)
+
+
+class JobManager(BatchJobManager):
     """
         This class encapsulates the functionality for monitoring and controlling
         a Torque job.
@@ -105,24 +338,26 @@ class JobManager(object):
     CANCELED_EXIT_STATUS = 271
     WALLTIME_LIMIT_EXIT_STATUS = -11
 
-    def __init__(self, pbs_server=None):
-        self.pbsq = None
-        retry = 0
-        cached_exception = None
-        while not self.pbsq and retry < _MAX_RETRY:
-            try:
-                self.pbsq = PBSQuery.PBSQuery(server=pbs_server)
-            except PBSQuery.PBSError as e:
-                cached_exception = e
-                retry += 1
-                time.sleep(retry ** 2)
-
-        if not self.pbsq:
-            if cached_exception:
-                raise civet_exceptions.CivetException(cached_exception.message)
-            else:
-                raise civet_exceptions.CivetException("Unable to instantiate PBSQuery instance, unknown error.")
+    def __init__(self, pbs_server=None, connection_pool=None,
+                 max_workers=None):
+        """
+        :param pbs_server: pbs_server to connect to, None for the default server
+        :param connection_pool: optional ConnectionPool to use for delete and
+            release requests.  Defaults to the process-wide pool for pbs_server,
+            which is shared with any TorqueJobRunner using the same server
+        :param max_workers: maximum number of concurrent delete requests,
+            defaults to the submit_threads config file parameter
+        """
+        self.max_workers = max_workers if max_workers else config.submit_threads
+        try:
+            self.pbsq = _QUERY_RETRY.call(PBSQuery.PBSQuery, server=pbs_server)
+        except PBSQuery.PBSError as e:
+            raise civet_exceptions.CivetException(e.message)
         self.pbs_server = pbs_server
+        if connection_pool:
+            self.connection_pool = connection_pool
+        else:
+            self.connection_pool = get_connection_pool(pbs_server)
 
     def query_job(self, job_id):
         """
@@ -134,24 +369,7 @@ class JobManager(object):
             :param job_id: job id of job to query
         """
 
-        # with some versions of Torque (Torque 4),  it is fairly common for
-        # Torque to fail to establish a connection when making lots of
-        # successive queries. If this happens,  wait and retry again
-        retry = 0
-        job_status = None
-
-        while job_status is None:
-            try:
-                job_status = self.pbsq.getjob(job_id)
-            except PBSQuery.PBSError as e:
-                if retry < _MAX_RETRY:
-                    retry += 1
-                    print("Retrying connection...", file=sys.stderr)
-                    time.sleep(retry ** 2)
-                    continue
-                else:
-                    # TODO use custom exception rather than PBSQuery.PBSError
-                    raise e
+        job_status = self._query_with_retry(self.pbsq.getjob, job_id)
 
         # check to see if the job existed.  this is kind of lame, but we can't
         # just do "if job_status:" because PBSQuery.getjob returns an empty 
@@ -163,6 +381,46 @@ class JobManager(object):
         else:
             return None
 
+    def query_jobs(self, job_ids):
+        """
+            Query server for the status of several jobs
+
+            All of the jobs on the server are fetched with a single request
+            rather than making a request per job.  pbs_server only lists the
+            elements of a job array as part of their array, so an array
+            element is queried on its own if its array is still known to the
+            server.
+
+            :param job_ids: list of job ids to query
+            :return: dictionary of job id -> JobStatus, or None if the job does
+                not exist on the server
+        """
+        if not job_ids:
+            return {}
+
+        all_jobs = self._query_with_retry(self.pbsq.getjobs)
+
+        statuses = {}
+        for job_id in job_ids:
+            if job_id in all_jobs and 'Job_Name' in all_jobs[job_id]:
+                statuses[job_id] = JobStatus(all_jobs[job_id])
+            elif re.sub(r'\[\d+\]', '[]', job_id, 1) in all_jobs:
+                statuses[job_id] = self.query_job(job_id)
+            else:
+                statuses[job_id] = None
+        return statuses
+
+    def _query_with_retry(self, query, *args):
+        """
+            call a PBSQuery query method, retrying if it fails
+        """
+
+        # with some versions of Torque (Torque 4),  it is fairly common for
+        # Torque to fail to establish a connection when making lots of
+        # successive queries. If this happens,  wait and retry again
+        # TODO use custom exception rather than PBSQuery.PBSError
+        return _QUERY_RETRY.call(query, *args)
+
     def delete_job(self, job_id):
         """
            Sends job delete request to pbs_server for job
@@ -170,35 +428,113 @@ class JobManager(object):
            :param job_id: job id to delete
            :return:  pbs_deljob return value (0 on success)
         """
-        connection = _connect_to_server(self.pbs_server)
-        rval = pbs.pbs_deljob(connection, job_id, '')
-        pbs.pbs_disconnect(connection)
-        return rval
+        return self._pooled_request(pbs.pbs_deljob, job_id, '')
 
-    def delete_all_jobs(self, ids):
+    def delete_jobs(self, job_ids):
+        """
+            Delete several jobs.  The jobs are split between up to
+            self.max_workers threads, each of which makes its delete requests
+            over a single pooled connection.
+
+            :param job_ids: list of job ids
+            :return: dictionary of job id -> error code for the jobs that could
+                not be deleted, other than because they are unknown or
+                already complete.
         """
+        job_ids = list(job_ids)
+        workers = max(1, min(self.max_workers, len(job_ids)))
+        batches = [job_ids[i::workers] for i in range(workers)]
+        errors = {}
+        lock = threading.Lock()
 
-        delete all jobs in a list of jobs
+        def delete_batch(batch):
+            batch_errors = self._pooled_requests(pbs.pbs_deljob, batch, '')
+            with lock:
+                errors.update(batch_errors)
+
+        utilities.run_in_threads(delete_batch, batches, workers)
+        return dict((job_id, rval) for job_id, rval in errors.items()
+                    if rval not in (self.E_UNKNOWN, self.E_STATE))
 
-        :param ids: list of all jobs
-        :return: zero on success, otherwise return value of failed pbs_deljob
-        """
-        for job_id in ids:
-            connection = _connect_to_server(self.pbs_server)
-            rval = pbs.pbs_deljob(connection, job_id, '')
-            pbs.pbs_disconnect(connection)
-            if rval and (rval != self.E_UNKNOWN or rval != self.E_STATE):
-                return rval
-        return 0
-        
     def release_job(self, job_id):
         """
         Release a user hold on a job
         :param job_id: job to release
         """
-        connection = _connect_to_server(self.pbs_server)
-        rval = pbs.pbs_rlsjob(self.connection, job_id, 'u', '')
-        pbs.pbs_disconnect(connection)
+        return self._pooled_request(pbs.pbs_rlsjob, job_id, 'u', '')
+
+    def close(self):
+        """
+            Close the idle pooled connections to pbs_server.  The pool is
+            shared, it will reconnect if it is used again.
+        """
+        self.connection_pool.close()
+
+    def queued_job_count(self):
+        """
+        :return: number of jobs in the Queued state on pbs_server, from its
+            state_count attribute, or None if it isn't reported
+        """
+        servers = self._query_with_retry(self.pbsq.get_serverinfo)
+        for server in servers.values():
+            # state_count is "Transit:0 Queued:12 Held:3 Waiting:0 ..."
+            for count in server.get('state_count', [''])[0].split():
+                state, _, n = count.partition(':')
+                if state == 'Queued':
+                    return int(n)
+        return None
+
+    def _pooled_requests(self, request, job_ids, *args):
+        """
+        make the same request of pbs_server for several jobs, reusing one
+        pooled connection.  As with _pooled_request, a request that fails with
+        an error other than an unknown job id or invalid state is retried once
+        on a new connection.
+
+        :param request: pbs_python function taking (connection, job_id, *args)
+        :param job_ids: list of job ids
+        :return: dictionary of job id -> non-zero return value of request
+        """
+        errors = {}
+        healthy = True
+        connection = self.connection_pool.acquire()
+        for job_id in job_ids:
+            rval = request(connection, job_id, *args)
+            if rval and rval not in (self.E_UNKNOWN, self.E_STATE):
+                self.connection_pool.discard(connection)
+                connection = self.connection_pool.acquire()
+                rval = request(connection, job_id, *args)
+            healthy = not rval or rval in (self.E_UNKNOWN, self.E_STATE)
+            if rval:
+                errors[job_id] = rval
+        if healthy:
+            self.connection_pool.release(connection)
+        else:
+            self.connection_pool.discard(connection)
+        return errors
+
+    def _pooled_request(self, request, job_id, *args):
+        """
+        make a request of pbs_server using a pooled connection.
+
+        A non-zero return value other than an unknown job id or invalid state
+        may mean the pooled connection was closed by the server, so the
+        request is tried once more on a new connection before giving up.
+
+        :param request: pbs_python function taking (connection, job_id, *args)
+        :param job_id: job id to pass to request
+        :return: return value of request (0 on success)
+        """
+        connection = self.connection_pool.acquire()
+        rval = request(connection, job_id, *args)
+        if rval and rval not in (self.E_UNKNOWN, self.E_STATE):
+            self.connection_pool.discard(connection)
+            connection = self.connection_pool.acquire()
+            rval = request(connection, job_id, *args)
+        if rval and rval not in (self.E_UNKNOWN, self.E_STATE):
+            self.connection_pool.discard(connection)
+        else:
+            self.connection_pool.release(connection)
         return rval
 
 
@@ -251,256 +587,26 @@ class JobStatus(object):
             return "unlimited"
 
 
-class TorqueJobRunner(object):
+class TorqueJobRunner(BatchJobRunner):
     """
         TorqueJobRunner is a class that encapsulates the functionality of 
         submitting jobs to a TORQUE cluster.
-       
-        attributes
-        held_jobs: a list of job_id,server pairs that were submitted with a
-            user hold
-        submit_with_hold: if True any root job (job with no dependency) will be
-            submitted with a user hold
-        log_dir: directory to store log files, will be created if it doesn't
-            exist
-        execution_log_dir: log directory on execution host if different
-            than log_dir
-        pipeline_bin: allow a pipeline bin directory to be added to PATH.
-            if set, this string will be prepended to the user's PATH
-            at job run time
-        validate: if true, run validate command
-        queue: optional Torque queue, if None Torque default will be used
-        submit:  If False job scripts will be generated but jobs will not be
-            submitted.  Useful for debugging pipelines.
-        send_failure_email: if true, send user email if a pipeline tool exits
-            with non zero value and aborts the pipeline
-    """
-
-    # the template script, which will be customized for each job
-    # $VAR will be substituted before job submission $$VAR will become $VAR
-    # after substitution
-    script_template = textwrap.dedent("""\
-        #!/bin/bash
-        
-        # This script was generated by Civet (Version $CIVET_VERSION)
-        $INFO
-        
-        $PBS_DIRECTIVES
-        
-        # define civet shell functions
-        source $FUNCTIONS
 
-        CIVET_LOGDIR=$LOG_DIR
-        
-        DATE=$$(date)
-        
-        exec 2> $LOG_DIR/$${PBS_JOBNAME}-err.log
-        
-        echo "Run time log for $$PBS_JOBNAME ($$PBS_JOBID)" > $LOG_DIR/$${PBS_JOBNAME}-run.log
-        echo "Using Civet $CIVET_VERSION" >> $LOG_DIR/$${PBS_JOBNAME}-run.log
-        
-        echo "stderr log for $$PBS_JOBNAME ($$PBS_JOBID)" >&2
+        See BatchJobRunner for the attributes shared by all job runners.
+        pbs_server: pbs_server to submit to, None for the default server
+    """
 
-        echo "Run began on $$DATE" >> $LOG_DIR/$${PBS_JOBNAME}-run.log
-        
-        echo "EXECUTION HOST DETAILS:" >> $LOG_DIR/$${PBS_JOBNAME}-run.log
-        uname -a >> $LOG_DIR/$${PBS_JOBNAME}-run.log
+    max_priority = _MAX_PRIORITY
+    delete_command = "qdel"
 
-        $MODULE_PURGE
-        
-        # then load modulefiles, if any, specified by the tool xml
-        $MODULE_LOAD_CMDS
-        
-        # add any tool/pipeline paths (if specified) to PATH
-        # add the Civet bin directory to our PATH
-        PATH=${TOOL_PATH}${PIPELINE_PATH}$CIVET_BIN:$$PATH
+    array_element_id = staticmethod(array_element_id)
 
-        # log the PATH in the job's -run.log to assist with debugging
-        echo "PATH=$$PATH" >> $LOG_DIR/$${PBS_JOBNAME}-run.log
-        
-        cd $$PBS_O_WORKDIR
-
-        # run validate command, if configured to do so
-        RUN_VALIDATION=$RUN_VALIDATION
-        if [ $$RUN_VALIDATION -ne 0 ]; then
-            $CIVET_PYTHON $VALIDATE -m $MASTER_FILE $FILES_TO_VALIDATE >> $LOG_DIR/$${PBS_JOBNAME}-run.log
-            VALIDATION_STATUS=$$?
-
-            if [ $$VALIDATION_STATUS -ne 0 ]; then
-                MESSAGE="Command not run, pre-run validation returned non-zero value."
-                echo "$$MESSAGE  Aborting pipeline!" >&2
-                send_failure_email $EMAIL_LIST "$$MESSAGE"
-                check_epilogue $LOG_DIR/submitted_shell_scripts/epilogue.sh
-                exit $$VALIDATION_STATUS
-            fi
-        fi
-        
-        $FILE_TEST
-
-        # all pre-job checks passed, run any supplied version commands and
-        # execute command(s)
-
-        echo "Working directory: $$(pwd)" >> $LOG_DIR/$${PBS_JOBNAME}-run.log
-
-        # optional version command, $VERSION_CMDS might be replaced by a noop,
-        # so initialize VERSION_STATUS to 0
-        VERSION_STATUS=0
-        $VERSION_CMDS > $LOG_DIR/$${PBS_JOBNAME}-version.log 2>&1; VERSION_STATUS=$$?
-
-        # GB
-        # temporarily remove requirement for version command to have zero exit status. 
-        # this breaks some pipelines
-        #if [ $$VERSION_STATUS -ne 0 ]; then
-        #    MESSAGE="Command not run, version command returned non-zero value."
-        #    echo "$$MESSAGE  Aborting pipeline!" >&2
-        #    send_failure_email $EMAIL_LIST "$$MESSAGE"
-        #    check_epilogue $LOG_DIR/submitted_shell_scripts/epilogue.sh
-        #    exit $$VERSION_STATUS
-        #fi
-
-        # command(s) passed into BatchJob:
-        $CMD
-        
-        CMD_EXIT_STATUS=$$?
-
-
-        echo "EXIT STATUS: $$CMD_EXIT_STATUS" >> $LOG_DIR/$${PBS_JOBNAME}-run.log
-        if [ $$CMD_EXIT_STATUS -ne 0 ]; then
-            MESSAGE="Command returned non-zero value ($$CMD_EXIT_STATUS)."
-            echo "$$MESSAGE  Aborting pipeline!" >&2
-            if $SEND_FAILURE_EMAIL; then
-                send_failure_email $EMAIL_LIST "$$MESSAGE"
-            fi
-            check_epilogue $LOG_DIR/submitted_shell_scripts/epilogue.sh
-            exit $$CMD_EXIT_STATUS
-        fi
-        
-        # check error log for list of keywords
-        for str in $ERROR_STRINGS; do
-            if grep -q "$$str" $LOG_DIR/$${PBS_JOBNAME}-err.log; then
-                MESSAGE="Found error string in stderr log."
-                echo "$$MESSAGE  Aborting pipeline!" >&2
-                if $SEND_FAILURE_EMAIL; then
-                    send_failure_email $EMAIL_LIST "$$MESSAGE"
-                fi
-                check_epilogue $LOG_DIR/submitted_shell_scripts/epilogue.sh
-                exit 1
-            fi
-        done
-
-        check_epilogue $LOG_DIR/submitted_shell_scripts/epilogue.sh
-    
-    """)
-
-    # the template job epilogue, which will be shared between all jobs
-    # submitted by this TorqueJobRunner
-    # $VAR will be substituted before job submission $$VAR will become $VAR
-    # after substitution
-    epilogue_template = textwrap.dedent("""\
-        #!/bin/bash
-
-        # This script was generated by Civet (Version $CIVET_VERSION)
-
-        #define civet shell functions
-        source $FUNCTIONS
-
-        PBS_JOBID=$$1
-        PBS_JOBNAME=$$4
-        EXIT_STATUS=$${10}
-        WALLTIME=$$(get_walltime $$7)
-        WALLTIME_REQUESTED=$$(get_walltime $$6)
-        CIVET_LOGDIR=$LOG_DIR
-
-
-        # the TORQUE epilogue doesn't seem to have USER defined, which is the default
-        # TorqueJobRunner uses for sending error emails unless one is supplied.  Fix that.
-        if [ -z $${USER+x} ]; then
-            USER=$$(whoami)
-        fi
-
-        if [ $$EXIT_STATUS -lt 0 ]; then
-            # Negative job exit status indicates Torque error, such as wall time limit
-            if [ $$EXIT_STATUS -eq "-11" ]; then
-                MESSAGE="Job hit walltime limit ($${WALLTIME_REQUESTED})"
-            else
-                MESSAGE="TORQUE Error ($${EXIT_STATUS})"
-            fi
-            send_failure_email $EMAIL_LIST "$$MESSAGE"
-            if $ABORT; then
-                abort_pipeline $LOG_DIR $$EXIT_STATUS $$WALLTIME $$WALLTIME_REQUESTED
-            fi
-        elif [ $$EXIT_STATUS -gt 0 ]; then
-            # Job exited with non-zero, Job script should have already sent email
-            if $ABORT; then
-                abort_pipeline $LOG_DIR $$EXIT_STATUS $$WALLTIME $$WALLTIME_REQUESTED
-            fi
-        else
-            # normal exit
-
-            # in some specific cases, the job script may have created the -status.txt file
-            # if so,  don't recreate it
-            if [ ! -f $LOG_DIR/$${PBS_JOBNAME}-status.txt ]; then
-                echo "exit_status=0" > $LOG_DIR/$${PBS_JOBNAME}-status.txt
-                echo "walltime=$$WALLTIME" >> $LOG_DIR/$${PBS_JOBNAME}-status.txt
-                echo "requested_walltime=$$WALLTIME_REQUESTED" >> $LOG_DIR/$${PBS_JOBNAME}-status.txt
-            fi
-
-            $SLEEP
-
-            echo "Run finished on $$(date)" >> $LOG_DIR/$${PBS_JOBNAME}-run.log
-        fi
-
-    """)
-
-    def __init__(self, log_dir="log", submit_with_hold=True, pbs_server=None, 
-                 pipeline_bin=None, validate=False,
-                 execution_log_dir=None, queue=None, submit=True,
-                 epilogue_email=None, pipeline_path=None, validation_file=None,
-                 send_failure_email=True):
-        self.held_jobs = []
-        self.submit_with_hold = submit_with_hold
-        self.validate = validate
-        self.log_dir = os.path.abspath(log_dir)
-        self._job_names = []
+    def __init__(self, log_dir="log", submit_with_hold=True, pbs_server=None,
+                 **kwargs):
         self._server = pbs_server
-        self.pipeline_bin = pipeline_bin
-        self.execution_log_dir = execution_log_dir
-        self.queue = queue
-        self.submit = submit
-        self._id_seq = 0  # used to fake Torque job IDs when self.submit is False
-        self.need_to_write_epilogue = True
-        self.epilogue_email=epilogue_email
-        self.pipeline_path = pipeline_path
-        self.validation_file = validation_file
-        self.send_failure_email = send_failure_email
-
-        if self.execution_log_dir:
-            self.execution_log_dir = os.path.abspath(self.execution_log_dir)
-
-        self.epilogue_filename = os.path.join(self.log_dir, _SHELL_SCRIPT_DIR, "epilogue.sh")
-
-        utilities.make_sure_path_exists(self.log_dir)
-          
-        self._id_log = open(os.path.join(log_dir, common.BATCH_ID_LOG), 'w')
-
-        if not self.submit:
-            # we aren't actually submitting jobs,  create a file in the log 
-            # directory that civet_status can use to detect this case
-            open(os.path.join(log_dir, common.NO_SUB_FLAG), 'w').close()
-
-        # do some sanity checking on groups of files created in the log dir
-        g_test_file = os.path.join(log_dir, ".group_test")
-        open(g_test_file, 'w').close()
-        gid = os.stat(g_test_file).st_gid
-        os.remove(g_test_file)
-        if gid not in os.getgroups():
-            print(textwrap.fill("ERROR: The log directory {} has a group ID "
-                                "that you are not a member of. This will "
-                                "prevent Torque from operating correctly.".format(self.log_dir),
-                                width=80, break_long_words=False),
-                  file=sys.stderr)
-            print("\nPIPELINE NOT SUBMITTED\n", file=sys.stderr)
-            sys.exit(1)
+        self.connection_pool = get_connection_pool(pbs_server)
+        super(TorqueJobRunner, self).__init__(log_dir, submit_with_hold,
+                                              **kwargs)
 
     @staticmethod
     def __make_pbs_attrs(resources, attributes):
@@ -521,33 +627,15 @@ class TorqueJobRunner(object):
 
         return pbs_attrs
 
-    def queue_job(self, batch_job):
+    def _submit_job(self, batch_job, filename, array_size=None):
         """
-          queue a BatchJob.
-          
-          :param batch_job: description of the job to queue
+            submit a BatchJob whose script has already been written
+            :param batch_job: job to submit
+            :param filename: path to the job script
+            :param array_size: if not None, submit as a job array with this
+                many elements
+            :return: job id
         """
-        
-        # batch job names should be unique for civet pipelines because the 
-        # job name is used to name log files and other output
-        # Civet generates unique names for each step, so this is just checking
-        # for a programming error
-        assert batch_job.name not in self._job_names
-        
-        if self.execution_log_dir:
-            log_dir = self.execution_log_dir
-        else:
-            log_dir = self.log_dir
-
-        # set batch_job.stderr_path and batch_job.stdout_path if they aren't already set
-        if not batch_job.stdout_path:
-            batch_job.stdout_path =  os.path.join(log_dir, batch_job.name + ".o")
-        if not batch_job.stderr_path:
-            batch_job.stderr_path = os.path.join(log_dir, batch_job.name + ".e")
-
-        # write batch script
-        filename = self.write_script(batch_job)
-        
         if self.submit:
             # build up our torque job attributes and resources
             job_attributes = {}
@@ -595,6 +683,14 @@ class TorqueJobRunner(object):
             if batch_job.date_time:
                 job_attributes[pbs.ATTR_a] = str(int(time.mktime(batch_job.date_time.timetuple())))
 
+            if batch_job.priority is not None:
+                job_attributes[pbs.ATTR_p] = str(batch_job.priority)
+
+            if array_size:
+                job_attributes[pbs.ATTR_t] = "1-{0}".format(array_size)
+                if self.array_slot_limit:
+                    job_attributes[pbs.ATTR_t] += "%{0}".format(self.array_slot_limit)
+
             pbs_attrs = pbs.new_attropl(len(job_attributes) + len(job_resources))
         
             # populate pbs_attrs
@@ -611,46 +707,22 @@ class TorqueJobRunner(object):
                 attr_idx += 1
             
             # we've initialized pbs_attrs with all the attributes we need to set
-            # now we can connect to the server and submit the job
-            connection = _connect_to_server(self._server)
-
-            # connected to pbs_server
-
-            # submit job
-            retry = 0
-            job_id = pbs.pbs_submit(connection, pbs_attrs, filename,
-                                    self.queue, None)
-
-            # if pbs.pbs_submit failed, try again
-            while not job_id and retry < _MAX_RETRY:
-                retry += 1
-                print("Retrying connection...", file=sys.stderr)
-                time.sleep(retry ** 2)
-                job_id = pbs.pbs_submit(connection, pbs_attrs, filename,
-                                        self.queue, None)
-
-            pbs.pbs_disconnect(connection)
-
-            # check to see if the job was submitted successfully.
-            if not job_id:
-                e, e_msg = pbs.error()
-                # the batch system returned an error, throw exception 
-                raise Exception("Error submitting job.  "
-                                "Torque error {0}: '{1}'".format(e, torque_strerror(e)))
+            # now we can submit the job using a pooled server connection
+            job_id = self.submit_with_retry(pbs_attrs, filename, self.queue,
+                                            connection_pool=self.connection_pool)
 
             if self.submit_with_hold and not batch_job.depends_on:
                 self.held_jobs.append(job_id)
         
         else:
             #self.submit is False, fake a job ID
-            job_id = "{0}.civet".format(self._id_seq)
+            if array_size:
+                job_id = "{0}[].civet".format(self._id_seq)
+            else:
+                job_id = "{0}.civet".format(self._id_seq)
             self._id_seq += 1
-            
-        self._job_names.append(batch_job.name)
 
-        self._id_log.write(job_id + '\t' + batch_job.name + '\t' + str(
-            self._printable_dependencies(batch_job.depends_on)) + '\n')
-        self._id_log.flush()
+        self.submitted_jobs.append(job_id)
         return job_id
 
     @staticmethod
@@ -742,33 +814,39 @@ class TorqueJobRunner(object):
         return job_id
 
     @staticmethod
-    def submit_with_retry(pbs_attrs, script_path, queue, pbs_server=None):
-        # connect to pbs server
-        connection = _connect_to_server(pbs_server)
-
-        # submit job
-        retry = 0
-        job_id = pbs.pbs_submit(connection, pbs_attrs, script_path,
-                                queue, None)
-
-        # if pbs.pbs_submit failed, try again
-        while not job_id and retry < _MAX_RETRY:
-            retry += 1
-            print("Retrying connection...", file=sys.stderr)
-            time.sleep(retry ** 2)
+    def submit_with_retry(pbs_attrs, script_path, queue, pbs_server=None,
+                          connection_pool=None):
+        """
+        submit a job using a pooled connection, retrying on failure.
+        Submission threads make their requests concurrently, a failure whose
+        error code is ambiguous (see _ErrnoTracker) is retried.
+
+        :param pbs_attrs: attropl describing the job
+        :param script_path: path to the job script
+        :param queue: queue to submit to, None for the server's default queue
+        :param pbs_server: server to submit to if connection_pool is None
+        :param connection_pool: ConnectionPool to take a connection from,
+            defaults to the process-wide pool for pbs_server
+        :return: job id
+        """
+        if not connection_pool:
+            connection_pool = get_connection_pool(pbs_server)
+
+        def submit():
+            connection = connection_pool.acquire()
+            token = _errno_tracker.start()
             job_id = pbs.pbs_submit(connection, pbs_attrs, script_path,
                                     queue, None)
+            code, ambiguous = _errno_tracker.finish(token, not job_id)
+            if not job_id:
+                # the server may have dropped our connection, a retry will
+                # start over with a new one
+                connection_pool.discard(connection)
+                raise TorqueError("Error submitting job", code, ambiguous)
+            connection_pool.release(connection)
+            return job_id
 
-        pbs.pbs_disconnect(connection)
-
-        #check to see if the job was submitted successfully.
-        if not job_id:
-            e, e_msg = pbs.error()
-            # the batch system returned an error, throw exception
-            raise Exception("Error submitting job.  "
-                            "Torque error {0}: '{1}'".format(e, torque_strerror(e)))
-
-        return job_id
+        return _SUBMIT_RETRY.call(submit)
 
     def release_job(self, job_id, connection=None):
         """
@@ -777,171 +855,34 @@ class TorqueJobRunner(object):
             :param job_id: job id to release (short form not allowed)
             :param id: job id to release (short form not allowed)
             :param connection: optional connection to a pbs_server, if not
-                  passed release_job will establish a new connection
+                  passed release_job will use a pooled connection, which is
+                  discarded rather than returned to the pool if the request
+                  fails
         """
-        c = connection if connection else _connect_to_server(self._server)
-        
-        rval = pbs.pbs_rlsjob(c, job_id, 'u', '')
-        
-        if not connection:
-            pbs.pbs_disconnect(c)
-        
+        if connection:
+            rval = pbs.pbs_rlsjob(connection, job_id, 'u', '')
+        else:
+            rval = self.get_job_manager()._pooled_request(pbs.pbs_rlsjob,
+                                                          job_id, 'u', '')
+
         if rval == 0:
             self.held_jobs.remove(job_id)
         return rval
 
-    def release_all(self):
+    def get_job_manager(self):
         """
-            Release all jobs in self.held_jobs list reusing connections.  
+            :return: JobManager sharing this runner's pooled connections
         """
+        return JobManager(self._server, self.connection_pool,
+                          self.submit_threads)
 
-        # if we are 'faking' pipeline submission with civet_run -n, then there
-        # is nothing to do
-        if not self.submit:
-            return
-
-        # copy the list of held jobs to iterate over because release_job mutates
-        # self.held_jobs
-        jobs = list(self.held_jobs)  
-        connection = _connect_to_server(self._server)
-        for id in jobs:
-            self.release_job(id, connection)
-        pbs.pbs_disconnect(connection)
-
-    def write_script(self, batch_job):
-
-        #create script directory if necessary
-        self._setup_script_dir(batch_job.email_list)
-
-        #write batch script
-        filename = os.path.join(self.log_dir, _SHELL_SCRIPT_DIR, "{0}.sh".format(batch_job.name))
-        with open(filename, "w") as script_file:
-            script_file.write(self.generate_script(batch_job))
-
-        return filename
-
-    def generate_script(self, batch_job):
+    def close(self):
         """
-            Generate a Torque batch script based on our template and return as
-            a string.
-            
-            mainly intended to be used internally in PBSJobRunner, but it could 
-            be useful externally for debugging/logging the contents of a job 
-            script generated for a batch_job
-
-            :param batch_job: BatchJob for which to generate script
-            :return: batch script as string
-        """  
-        tokens = {}
-        
-        tokens['PBS_DIRECTIVES'] = self._generate_directives(batch_job, self.epilogue_filename)
-        tokens['CMD'] = batch_job.cmd
-        
-        if self.execution_log_dir:
-            tokens['LOG_DIR'] = self.execution_log_dir
-        else:
-            tokens['LOG_DIR'] = self.log_dir
-            
-        tokens['ID_FILE'] = common.BATCH_ID_LOG
-        
-        tokens['MODULE_LOAD_CMDS'] = ""  
-        if batch_job.modules:
-            for module in batch_job.modules:
-                tokens['MODULE_LOAD_CMDS'] = "{0}module load {1}\n".format(tokens['MODULE_LOAD_CMDS'], module)   
-        
-        tokens['CIVET_PYTHON'] = config.civet_python
-        tokens['VALIDATE'] = os.path.join(common.CIVET_HOME, "bin/validate")
-        if self.validate and batch_job.files_to_validate:
-            tokens['RUN_VALIDATION'] = 1
-            tokens['FILES_TO_VALIDATE'] = ' '.join(batch_job.files_to_validate)
-            tokens['MASTER_FILE'] = self.validation_file
-        else:
-            tokens['RUN_VALIDATION'] = 0
-            tokens['FILES_TO_VALIDATE'] = ""
-            tokens['MASTER_FILE'] = ""
-            
-        if batch_job.version_cmds:
-            tokens['VERSION_CMDS'] = "({0})".format('; '.join(batch_job.version_cmds))
-        else:
-            tokens['VERSION_CMDS'] = "#[none given]"
-
-        if batch_job.error_strings:
-            tokens['ERROR_STRINGS'] = ' '.join(batch_job.error_strings)
-        else:
-            tokens['ERROR_STRINGS'] = ''
-            
-        if batch_job.walltime:
-            tokens['WALLTIME_REQUESTED'] = batch_job.walltime
-        else:
-            tokens['WALLTIME_REQUESTED'] = "unlimited"
-            
-        tokens['FUNCTIONS'] = os.path.join(common.CIVET_HOME, "lib/job_runner/functions.sh")
-        
-        if self.pipeline_bin:
-            tokens['CIVET_BIN'] = "{0}:{1}".format(self.pipeline_bin, os.path.join(common.CIVET_HOME, "bin"))
-        else:
-            tokens['CIVET_BIN'] = os.path.join(common.CIVET_HOME, "bin")
-            
-        tokens['CIVET_VERSION'] = version.version_from_git()
-
-        if batch_job.info:
-            tokens['INFO'] = "# " + batch_job.info.replace('\n', "\n# ")
-        else:
-            tokens['INFO'] = ""
-        
-        tokens['FILE_TEST'] = self._build_file_test(batch_job)
-
-        if batch_job.email_list:
-            tokens['EMAIL_LIST'] = batch_job.email_list
-        else:
-            tokens['EMAIL_LIST'] = "${USER}"
-
-        tokens['SEND_FAILURE_EMAIL'] = 'true' if self.send_failure_email else 'false'
-
-        if self.pipeline_path:
-            tokens['PIPELINE_PATH'] = self.pipeline_path + ":"
-        else:
-            tokens['PIPELINE_PATH'] = ''
-
-        if batch_job.tool_path:
-            tokens['TOOL_PATH'] = batch_job.tool_path + ":"
-        else:
-            tokens['TOOL_PATH'] = ''
-
-        if config.purge_user_modulefiles:
-            tokens['MODULE_PURGE'] = (
-                "# first unload any loaded modulefiles, these may be loaded automatically\n"
-                "# in a user's startup scripts, but they could conflict with modulefiles\n"
-                "# specified by the Civet tool\n"
-                "module purge")
-        else:
-            tokens['MODULE_PURGE'] = ""
-        
-        return string.Template(self.script_template).substitute(tokens)
-
-    def generate_epilogue(self, email_list, abort_on_failure=True):
-
-        tokens = {}
-        tokens['CIVET_VERSION'] = version.version_from_git()
-        tokens['FUNCTIONS'] = os.path.join(common.CIVET_HOME, "lib/job_runner/functions.sh")
-        tokens['EMAIL_LIST'] = email_list if email_list else "${USER}"
-        tokens['ABORT'] = 'true' if abort_on_failure else 'false'
-
-        if self.execution_log_dir:
-            tokens['LOG_DIR'] = self.execution_log_dir
-        else:
-            tokens['LOG_DIR'] = self.log_dir
-
-        if config.io_sync_sleep:
-            tokens['SLEEP'] = (
-                            "# sleep to overcome any lag with NFS file attribute cacheing\n"
-                            "# This ensures that downstream jobs will see all output files written by this job\n"
-                            "sleep {}".format(config.io_sync_sleep)
-            )
-        else:
-            tokens['SLEEP'] = ""
-
-        return string.Template(self.epilogue_template).substitute(tokens)
+            Close any pooled connections to pbs_server.  The pool will reconnect
+            if the runner is used again.
+        """
+        self.connection_pool.close()
+        super(TorqueJobRunner, self).close()
 
     @staticmethod
     def generate_env(workdir):
@@ -955,21 +896,23 @@ class TorqueJobRunner(object):
             :param workdir: working directory of the job
         """
     
-        # our script start with "cd $PBS_O_WORKDIR", make sure we set it
-        env = "PBS_O_WORKDIR={0}".format(workdir)
-        
+        global _static_env
+
         # define some of the other typical PBS_O_* environment variables
         # PBS_O_HOST is used to set default stdout/stderr paths, the rest probably
-        # aren't necessary
-        
-        env = "".join([env, ",PBS_O_HOST=", socket.getfqdn()])
-        env = "".join([env, ",PBS_O_PATH=", os.environ['PATH']])
-        if 'HOME' in os.environ:
-            env = "".join([env, ",PBS_O_HOME=", os.environ['HOME']])
-        if 'LOGNAME' in os.environ:
-            env = "".join([env, ",PBS_O_LOGNAME=", os.environ['LOGNAME']])
-        
-        return env
+        # aren't necessary.  These don't change during a run, so look them up
+        # once rather than doing a DNS lookup for every job we submit
+        if _static_env is None:
+            env = "".join([",PBS_O_HOST=", socket.getfqdn()])
+            env = "".join([env, ",PBS_O_PATH=", os.environ['PATH']])
+            if 'HOME' in os.environ:
+                env = "".join([env, ",PBS_O_HOME=", os.environ['HOME']])
+            if 'LOGNAME' in os.environ:
+                env = "".join([env, ",PBS_O_LOGNAME=", os.environ['LOGNAME']])
+            _static_env = env
+
+        # our script start with "cd $PBS_O_WORKDIR", make sure we set it
+        return "PBS_O_WORKDIR={0}{1}".format(workdir, _static_env)
 
     @staticmethod
     def _generate_directives(batch_job, epilogue_filename=None):
@@ -1018,92 +961,28 @@ class TorqueJobRunner(object):
         if not batch_job.depends_on:
             return ""
         elif isinstance(batch_job.depends_on, utilities.string_types):
-            #handle string case
-            return "{0}:{1}".format(_DEFAULT_DEPEND_TYPE, batch_job.depends_on)
-        else:
-            #not a string, assume list of job ids to join
-            return "{0}:{1}".format(_DEFAULT_DEPEND_TYPE, 
-                                    ':'.join(batch_job.depends_on))
-                                    
-    def _printable_dependencies(self, dependency_list):
-        """
-            Return a list containing shortened (hostname removed) job
-            dependencies
-
-            :param dependency_list: Torque dependency string to reformat
-            :return: formatted dependency string
-        """
-        shortened = []
-        for id in dependency_list:
-            shortened.append(id.split('.', 1)[0])
-            
-        return shortened
-        
-    def _build_file_test(self, batch_job):
-        """
-            Return a chunk of bash code that will perform the required file 
-            test(s) for this job. This code will exit using the file_test_exit 
-            function, which will do some logging in addition to exiting the job
-
-            :param batch_job: BatchJob to generate file tests for insertion into
-                              job script
-            :return: bash code to perform file tests, to be inserted into script
-        """
-        header = "#pre job file test\n"
-        
-        # need the walltime because we will create a -status.txt file if we need
-        # to bail out because of the file test
-        if batch_job.walltime:
-            walltime = batch_job.walltime
-        else:
-            walltime = "unlimited"
-    
-        if batch_job.file_test_logic == 'AND':
-            test_type = '&&'
-        elif batch_job.file_test_logic == 'OR':
-            test_type = '||'
-        else:
-            test_type = '&&'  #else default to AND to be safe, but BatchJob should force it to be either AND or OR
-
-        if not batch_job.files_to_test:
-            bash_code = ""
-        elif isinstance(batch_job.files_to_test, utilities.string_types):
-            bash_code = header + 'if [ -e {0} ]; then file_test_exit {1} {2}; fi'.format(batch_job.files_to_test, self.log_dir, walltime)
+            depends_on = [batch_job.depends_on]
         else:
-            tests = []
-            bash_code = header + "if [["
-            for file in batch_job.files_to_test:
-                tests.append(' -e "{0}" '.format(file))
-            bash_code += test_type.join(tests)
-            bash_code += ']]; then file_test_exit {0} {1}; fi'.format(self.log_dir, walltime)
-            
-        return bash_code
-
-    def _setup_script_dir(self, email_list):
-        """
-        setup the directory in the log_dir to hold all of the shell scripts we
-        will generate.  Also write the epilogue script to this directory
-
-        :param email_list:  we need the list of email addresses (usually a
-            single address) when generating the epilogue script from the
-            template
-        """
-
-        script_dir = os.path.join(self.log_dir, _SHELL_SCRIPT_DIR)
-        try:
-            os.makedirs(script_dir)
-            os.chmod(script_dir, stat.S_IRWXU)
-
-            if self.need_to_write_epilogue:
-                with open(self.epilogue_filename, "w") as epilogue_file:
-                    epilogue_file.write(self.generate_epilogue(email_list))
-                os.chmod(self.epilogue_filename, stat.S_IRWXU)
-                self.need_to_write_epilogue = False
-
-        except OSError as exception:
-            if exception.errno != errno.EEXIST:
-                print('Error while creating directory ' + script_dir, file=sys.stderr)
-                raise
+            depends_on = batch_job.depends_on
+
+        # dependencies on job arrays need the array form of the dependency
+        # type, they are satisfied once every element of the array has
+        # completed successfully
+        jobs = [id for id in depends_on if not is_array_id(id)]
+        arrays = [id for id in depends_on if is_array_id(id)]
+
+        dependencies = []
+        if jobs:
+            dependencies.append("{0}:{1}".format(_DEFAULT_DEPEND_TYPE,
+                                                 ':'.join(jobs)))
+        if arrays:
+            dependencies.append("{0}array:{1}".format(_DEFAULT_DEPEND_TYPE,
+                                                      ':'.join(arrays)))
+        return ','.join(dependencies)
+
+
+# the names used to look up the classes of a backend, see batch_system.py
+JobRunner = TorqueJobRunner
 
 
 def main():
@@ -19,7 +19,7 @@ import os
 import inspect
 import logging
 
-from job_runner.torque import TorqueJobRunner as BatchRunner
+import job_runner.batch_system
 
 import config
 
@@ -55,6 +55,7 @@ def submit_management_job(task_db, queue, walltime_hours, max_queued, log_level)
 
     }
     logging.debug("About to start manager job with: {}".format(task))
+    BatchRunner = job_runner.batch_system.get_backend().JobRunner
     return BatchRunner.submit_simple_job(task)
 
 
@@ -62,7 +62,8 @@ class PipelineFile(object):
         'in_dir',
         'temp',
         'filespec',
-        'extensions'
+        'extensions',
+        'stream'
         ]
 
     # attributes that only make sense for a dir tag
@@ -101,13 +102,27 @@ class PipelineFile(object):
     # And the parameters to the pipeline
     params = None
 
+    # tool temp files flagged local_temp are created in this directory, a
+    # node-local scratch directory created by the job script when the job
+    # starts (see civet_job.sh)
+    local_temp_dir = '${CIVET_SCRATCH}'
+
+    # paths given to anonymous temp files and datestamped file names, which
+    # differ every time the pipeline is parsed.  They are recorded in the log
+    # directory so that a resumed submission gives these files the same
+    # paths as the interrupted one.  See record_generated_paths() and
+    # replay_generated_paths()
+    _generated_path_log = None
+    _unrecorded_paths = []
+    _replayed_paths = []
+
     def __init__(self, id, path, files, is_file=False, is_temp=False,
                  is_input=False, is_dir=False, is_string=False, based_on=None,
                  pattern=None, replace=None, append=None,
                  datestamp_prepend=None, datestamp_append=None, in_dir=None,
                  is_parameter=False, is_list=False, from_file=None, create=True,
                  default_output=False, foreach_dep=None, description=None,
-                 paired=False):
+                 paired=False, stream=False):
         self.id = id
         self.path = path
         self.cloud_path = None
@@ -128,12 +143,24 @@ class PipelineFile(object):
         self.create = create
         self.finalized = False
         self.creator_job = None
+        self.creator_jobs = []
         self.consumer_jobs = []
+        # files placed in this directory with in_dir
+        self.dir_files = []
         self.foreach_dep = foreach_dep
         self.from_file = from_file
         self.description = description
         self.paired = paired
 
+        # a named pipe connecting the tool that writes it to the tool that
+        # reads it, see Step
+        self.stream = stream
+
+        # set by the tool for temp files that go in the node-local scratch
+        # directory, rather than the output directory.  A stream is created
+        # in the scratch directory of the job that runs both of its tools.
+        self.local_temp = stream
+
         # need a separate variable for this because is_parameter gets reset to
         # False once the param number -> value conversion happens
         self.list_from_param = True if is_list and is_parameter else False
@@ -150,15 +177,22 @@ class PipelineFile(object):
             self.set_output_dir()
 
     # Track creator jobs to support file-based dependency scheduling.
+    # creator_job is the last job to write the file, the one later jobs
+    # depend on, creator_jobs has every job that wrote it.
     def set_creator_job(self, j):
         self.creator_job = j
+        if j not in self.creator_jobs:
+            self.creator_jobs.append(j)
 
     # Track the jobs that use this file as an input.  This is needed
-    # to properly know when we can remove our temp files at the end
-    # of a run.
+    # to properly know when we can remove our temp files.
     def add_consumer_job(self, j):
         self.consumer_jobs.append(j)
 
+    @property
+    def is_dir(self):
+        return self._is_dir
+
     @staticmethod
     def add_simple_dir(id, path, files, input=False):
         PipelineFile(id, path, files, is_input=input, is_dir=True)
@@ -189,6 +223,54 @@ class PipelineFile(object):
     def register_params(params):
         PipelineFile.params = params
 
+    @staticmethod
+    def record_generated_paths(path, append=False):
+        """
+        write the paths generated so far, and every path generated from now
+        on, to a file
+        :param path: file to record the paths in
+        :param append: if True, add to the paths already recorded in the file
+        """
+        PipelineFile._generated_path_log = open(path, 'a' if append else 'w')
+        PipelineFile._generated_path_log.writelines(PipelineFile._unrecorded_paths)
+        PipelineFile._generated_path_log.flush()
+        PipelineFile._unrecorded_paths = []
+
+    @staticmethod
+    def replay_generated_paths(path):
+        """
+        use the paths recorded by record_generated_paths() in place of
+        generating new ones, in the order they were generated
+        :param path: file the paths were recorded in
+        """
+        with open(path) as f:
+            PipelineFile._replayed_paths = [line.rstrip('\n').split('\t', 1)
+                                            for line in f if line.strip()]
+
+    def _generated_path(self, generate, *args, **kwargs):
+        """
+        :param generate: function called with *args and **kwargs to generate
+            a path for this file
+        :return: the next replayed path, or the generated path
+        """
+        if PipelineFile._replayed_paths:
+            fid, path = PipelineFile._replayed_paths.pop(0)
+            if fid != self.id:
+                raise civet_exceptions.ParseError(
+                    "file '{}' does not match the recorded paths (expected "
+                    "'{}'), the pipeline or its arguments differ from the "
+                    "submission being resumed".format(self.id, fid))
+            return path
+
+        path = generate(*args, **kwargs)
+        entry = "{}\t{}\n".format(self.id, path)
+        if PipelineFile._generated_path_log:
+            PipelineFile._generated_path_log.write(entry)
+            PipelineFile._generated_path_log.flush()
+        else:
+            PipelineFile._unrecorded_paths.append(entry)
+        return path
+
     @staticmethod
     def finalize_file_paths(files):
 
@@ -254,8 +336,9 @@ class PipelineFile(object):
         self.finalized = True
 
         # Make sure a directory exists, unless explicitly requested
-        # to not do so.
-        if self._is_dir and self.create:
+        # to not do so.  The tool creates directories on the scratch
+        # directory when it runs.
+        if self._is_dir and self.create and not self.local_temp:
             utilities.make_sure_path_exists(self.path)
 
         check = circularity.pop()
@@ -271,7 +354,8 @@ class PipelineFile(object):
         # working directory throughout the pipeline lifetime don't
         # foul us up. First check if the file doesn't have a path at all
         # i.e., just a filename.  If so, and it is not an input file,
-        # place it in the output directory.
+        # place it in the output directory.  Paths in the node-local scratch
+        # directory are already absolute once the job expands them.
         if self.is_list and self.list_from_param:
             # file list is passed as a parameter represented as a comma
             # delimited list.
@@ -280,7 +364,7 @@ class PipelineFile(object):
             for f in self.path.split(','):
                 file_list.append(os.path.abspath(f))
             self.path = ','.join(file_list)
-        elif not self.is_string:
+        elif not self.is_string and not self.local_temp:
             path = self.path
             if (os.path.split(path)[0] == '' and (not self.is_input) and
                 self != PipelineFile.output_dir and
@@ -339,7 +423,6 @@ class PipelineFile(object):
 
         # strip out any path - based_on only operates on filenames
         temp_path = os.path.basename(path)
-        now = datetime.datetime.now()
 
         # do the replace first,  so there is no chance other based_on
         # actions could affect the pattern matching
@@ -348,12 +431,25 @@ class PipelineFile(object):
 
         if self.append:
             temp_path = temp_path + self.append
+        if self.datestamp_append or self.datestamp_prepend:
+            temp_path = self._generated_path(self._add_datestamp, temp_path)
+
+        self.path = temp_path
+
+    def _add_datestamp(self, path):
+        now = datetime.datetime.now()
         if self.datestamp_append:
-            temp_path += now.strftime(self.datestamp_append)
+            path += now.strftime(self.datestamp_append)
         if self.datestamp_prepend:
-            temp_path = now.strftime(self.datestamp_prepend) + temp_path
+            path = now.strftime(self.datestamp_prepend) + path
+        return path
 
-        self.path = temp_path
+    @staticmethod
+    def _create_temp_file(my_dir):
+        t = tempfile.NamedTemporaryFile(dir=my_dir, delete=False)
+        name = t.name
+        t.close()
+        return name
 
     def apply_in_dir_and_create_temp(self, files, circularity):
         ind = self.in_dir
@@ -367,7 +463,12 @@ class PipelineFile(object):
                 raise civet_exceptions.ParseError(msg)
             indf = files[ind]
             indf.finalize_file(files, circularity)
+            indf.dir_files.append(self)
             my_dir = indf.path
+            # a file is on the scratch directory if its directory is
+            self.local_temp = indf.local_temp
+        elif self.local_temp:
+            my_dir = PipelineFile.local_temp_dir
         else:
             my_dir = PipelineFile.get_output_dir()
 
@@ -376,13 +477,14 @@ class PipelineFile(object):
         elif self.is_temp and not self.path:
             # If it is an anonymous temp, we'll create it in
             # the proper directory
-            if self._is_dir:
-                self.path = tempfile.mkdtemp(dir=my_dir)
+            if self.local_temp:
+                # the scratch directory doesn't exist until the job runs, and
+                # it is private to the job, so the file is named after its id
+                self.path = os.path.join(my_dir, self.id)
+            elif self._is_dir:
+                self.path = self._generated_path(tempfile.mkdtemp, dir=my_dir)
             else:
-                t = tempfile.NamedTemporaryFile(dir=my_dir, delete=False)
-                name = t.name
-                t.close()
-                self.path = name
+                self.path = self._generated_path(self._create_temp_file, my_dir)
             if ind:
                 self.in_dir = None
         elif ind:
@@ -394,6 +496,12 @@ class PipelineFile(object):
 
             # in_dir has been applied, clear it.
             self.in_dir = None
+        elif self.local_temp:
+            if os.path.isabs(self.path):
+                # an absolute filespec is left where the tool put it
+                self.local_temp = False
+            else:
+                self.path = os.path.join(my_dir, self.path)
 
     @staticmethod
     def parse_xml(e, files):
@@ -562,6 +670,12 @@ class PipelineFile(object):
 
         paired = att.get('paired', 'FALSE').upper() == 'TRUE'
 
+        stream = att.get('stream', 'FALSE').upper() == 'TRUE'
+        if stream and (not is_temp or is_input or in_dir):
+            msg = ("a stream file must be temp, and must not be an input or "
+                   "have an 'in_dir' attribute:\n\n{}").format(ET.tostring(e))
+            raise civet_exceptions.ParseError(msg)
+
         if is_list and not ((pattern and in_dir) or is_parameter):
             msg = ("'filelist' requires 'in_dir' and 'pattern' or it must be "
                    "passed as a parameter\n\n{}".format(ET.tostring(e)))
@@ -576,7 +690,7 @@ class PipelineFile(object):
             is_string, based_on, pattern, replace, append,
             datestamp_prepend, datestamp_append, in_dir,
             is_parameter, is_list, from_file, create, default_output,
-            foreach_dep, description, paired)
+            foreach_dep, description, paired, stream)
 
 
 def sumarize_files(files, group):
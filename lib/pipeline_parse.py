@@ -31,9 +31,12 @@ from pipeline_file import *
 from step import *
 from tool import *
 
-from job_runner.torque import *
 from job_runner.batch_job import *
+import job_runner.batch_system
+import job_runner.local
 import job_runner.common
+import job_runner.dag
+import resource_history
 import utilities
 import civet_exceptions
 import config
@@ -107,7 +110,9 @@ class Pipeline(object):
                    error_email_address=None, walltime_multiplier=1,
                    write_pipeline_files=False,
                    tool_exec_mode=ToolExecModes.BATCH_STANDARD,
-                   error_email=True, job_name_prefix="CIVET__"):
+                   error_email=True, job_name_prefix="CIVET__",
+                   job_arrays=False, fuse_chains=False, resume_log_dir=None,
+                   autosize=False):
         try:
             pipe = ET.parse(xmlfile).getroot()
         except ET.ParseError as e:
@@ -171,6 +176,13 @@ class Pipeline(object):
         self._output_dir = None
         self._log_dir = None
         self._job_runner = None
+        # resuming an interrupted submission reuses its log directory, and
+        # the paths it generated for anonymous temp and datestamped files
+        self.resume = bool(resume_log_dir)
+        if resume_log_dir:
+            self._log_dir = os.path.abspath(resume_log_dir)
+            PipelineFile.replay_generated_paths(
+                os.path.join(self._log_dir, job_runner.common.GENERATED_PATHS))
         self.validation_file = os.path.splitext(xmlfile)[0] + '_validation.data'
         self.queue = queue
         self.submit_jobs = submit_jobs
@@ -178,6 +190,15 @@ class Pipeline(object):
         self.error_email = error_email
         self.keep_temp = keep_temp
         self.release_jobs = release_jobs
+        self.job_arrays = job_arrays
+        self.fuse_chains = fuse_chains
+        self.autosize = autosize
+        self._resource_history = None
+        self._input_size = None
+        # (job name, tool XML, tool name, input size bucket) for every tool
+        # job, and the resources of each job sized by autosize
+        self.tool_jobs = []
+        self.autosized_jobs = []
         self.force_conditional_steps = force_conditional_steps
         self.skip_validation = skip_validation
         self.delay = delay
@@ -261,6 +282,12 @@ class Pipeline(object):
             msg = "{}:  {}".format(os.path.basename(self.xmlfile), e)
             raise civet_exceptions.ParseError(msg)
 
+        # the log directory can be created now that the output directory is
+        # known
+        PipelineFile.record_generated_paths(
+            os.path.join(self.log_dir, job_runner.common.GENERATED_PATHS),
+            append=self.resume)
+
         if write_pipeline_files:
             sumarize_files(self._files, 'pipeline_files')
             with open(os.path.join(self.log_dir, "pipeline_files.json"), 'w') as f:
@@ -275,6 +302,54 @@ class Pipeline(object):
             elif t == 'foreach':
                 self._steps.append(ForEach(child, self._files))
 
+        # foreach steps aren't built until submission, so check now that
+        # every stream file connects exactly one pair of tools
+        self._check_streams(pending)
+
+    def _check_streams(self, pending):
+        """
+        A stream file must be written by exactly one tool and read by
+        exactly one tool, the next tool in the same step.  Step checks the
+        tools of one step, this checks the whole pipeline, including the
+        steps of foreach tags.
+        :param pending: the pipeline's <step> and <foreach> elements
+        """
+        steps = []
+        for child in pending:
+            if child.tag == 'step':
+                steps.append(child)
+            else:
+                steps.extend(c for c in child if c.tag == 'step')
+
+        writers = {}
+        readers = {}
+        for step in steps:
+            tools = [t for t in step if t.tag == 'tool']
+            for position, tool in enumerate(tools):
+                for att, users in (('output', writers), ('input', readers)):
+                    for fid in tool.attrib.get(att, '').split(','):
+                        fid = fid.strip()
+                        if fid in self._files and self._files[fid].stream:
+                            users.setdefault(fid, []).append(
+                                (step, position, tool.attrib.get('name')))
+
+        for fid in sorted(set(writers) | set(readers)):
+            names = ', '.join("'{}'".format(name) for step, position, name
+                              in writers.get(fid, []) + readers.get(fid, []))
+            if len(writers.get(fid, [])) != 1 or \
+                    len(readers.get(fid, [])) != 1:
+                raise civet_exceptions.ParseError(
+                    "{}: stream file '{}' must be written by one tool and "
+                    "read by one tool, it is used by {}".format(
+                        os.path.basename(self.xmlfile), fid, names))
+            w_step, w_position, w_name = writers[fid][0]
+            r_step, r_position, r_name = readers[fid][0]
+            if r_step is not w_step or r_position != w_position + 1:
+                raise civet_exceptions.ParseError(
+                    "{}: stream file '{}' written by tool '{}' must be read "
+                    "by the next tool in the same step, not '{}'".format(
+                        os.path.basename(self.xmlfile), fid, w_name, r_name))
+
     @property
     def user_search_path(self):
         return self._user_search_path
@@ -377,6 +452,16 @@ class Pipeline(object):
                   + "\n    ".join(missing), file=sys.stderr)
             sys.exit(1)
 
+        # (tool job ID placeholder, tool name) pairs reported once the jobs
+        # are actually submitted
+        self.submitted_tools = []
+
+        # Build the complete set of jobs before submitting any of them.
+        # job_runner.queue_job() hands out placeholder IDs until
+        # submit_deferred() is called, which lets the job runner submit all of
+        # the jobs that don't depend on each other concurrently.
+        self.job_runner.defer_submission()
+
         invocation = 0
         for step in self._steps:
             invocation += 1
@@ -386,15 +471,43 @@ class Pipeline(object):
             for j in job_id:
                 self.all_batch_jobs.append(j)
 
+        # Delete temp files as soon as the jobs that use them are done, rather
+        # than leaving them all for the final cleanup job
+        if not self.keep_temp:
+            deletions = self.temp_file_deletions(self._files)
+            for n, (paths, jobs) in enumerate(deletions, 1):
+                name = "{}{}_temp_file_cleanup{}".format(self.job_name_prefix,
+                                                         self.name, n)
+                self.all_batch_jobs.append(
+                    self.submit_temp_file_cleanup(name, paths, jobs))
+
         # Submit last cleanup / bookkeeping job
         self.submit_cleanup_job()
 
+        self.write_resource_logs(silent)
+
+        try:
+            self.job_runner.submit_deferred()
+        except Exception as e:
+            self.abort_submit(e, self.BATCH_ERROR)
+
+        self.all_batch_jobs = [self.job_runner.resolve_job_id(j)
+                               for j in self.all_batch_jobs]
+        for barrier in self.foreach_barriers:
+            self.foreach_barriers[barrier] = self.job_runner.resolve_job_id(
+                self.foreach_barriers[barrier])
+
+        for job_id, tool_name in self.submitted_tools:
+            print("{0}: {1}".format(self.job_runner.resolve_job_id(job_id),
+                                    tool_name))
+
 
         # We're done submitting all the jobs.  Release them (if necessary) and 
         # get on with it. This is the last action of the pipeline
         # submission process. WE'RE DONE!
         if self.release_jobs:
             self.job_runner.release_all()
+        self.job_runner.close()
 
         # Let the people know where they can see their logs.
         if not silent:
@@ -409,19 +522,37 @@ class Pipeline(object):
     def abort_submit(self, message, status=1, json_output=False):
         """
         Abort pipeline submission.  Deletes any jobs already queued, prints error
-        message, and exits.
+        message, and exits.  Jobs that were submitted with a user hold (or
+        depend on one that was) are kept instead, so that the submission can
+        be resumed with civet_run --resume.
 
         :param message: error string to be presented to user
         :param status: return value to use for program exit
         :return:
         """
-        if self.all_batch_jobs:
-            job_manager = JobManager()
-            job_manager.delete_all_jobs(self.all_batch_jobs)
+        # jobs queued for deferred submission are only placeholders until they
+        # are submitted, ask the job runner what it has actually submitted
+        held = []
+        if self._job_runner and self.job_runner.submit and \
+                self.job_runner.submitted_jobs:
+            if self.job_runner.submit_with_hold:
+                # nothing can run until the root jobs are released
+                held = self.job_runner.submitted_jobs
+            else:
+                job_manager = self.job_runner.get_job_manager()
+                job_manager.delete_all_jobs(self.job_runner.submitted_jobs)
 
         sys.stderr.write("Aborting pipeline submission:"
                          "  {0}\n".format(message))
 
+        if held:
+            sys.stderr.write(
+                "{0} jobs submitted before the error are being held. Run "
+                "civet_run again with the same arguments and\n"
+                "'--resume {1}' to submit the rest of the pipeline, or "
+                "'civet_cancel {1}' to delete them.\n".format(len(held),
+                                                              self.log_dir))
+
         if json_output:
             print(json.dumps({
                 'log_dir': self.log_dir,
@@ -441,7 +572,26 @@ class Pipeline(object):
             step_tasks = step.create_tasks(name_prefix, self.execution_mode)
             all_tasks.extend(step_tasks)
 
+        if not self.keep_temp and self.execution_mode in (
+                ToolExecModes.BATCH_MANAGED, ToolExecModes.LOCAL):
+            deletions = self.temp_file_deletions(self._files)
+            for n, (paths, tasks) in enumerate(deletions, 1):
+                name = "{}{}_temp_file_cleanup{}".format(self.job_name_prefix,
+                                                         self.name, n)
+                all_tasks.append(
+                    self.create_temp_file_cleanup_task(name, paths, tasks))
+
         all_tasks.append(self._create_cleanup_task(all_tasks))
+
+        # a task only needs to depend on the tasks that aren't already
+        # implied by its other dependencies (the log consolidation task only
+        # needs the last tasks of each branch of the pipeline)
+        reduced = job_runner.dag.transitive_reduction(
+            [t['name'] for t in all_tasks],
+            dict((t['name'], t['dependencies']) for t in all_tasks))
+        for task in all_tasks:
+            task['dependencies'] = reduced[task['name']]
+
         return all_tasks
 
     def prepare_managed_tasks(self):
@@ -454,6 +604,7 @@ class Pipeline(object):
         self._write_managed_flag()
 
         tasks = self.create_task_list()
+        self.write_resource_logs()
 
         # create the pipeline_batch_id_list.txt file (normally created when
         # submitting jobs -- this is needed by civet_status)
@@ -473,19 +624,193 @@ class Pipeline(object):
         open(os.path.join(self.log_dir, job_runner.common.MANAGED_MODE_FLAG),
              'w').close()
 
+    def run_local(self, max_cores=None, max_mem=None, silent=False):
+        """
+        Run a constructed pipeline on this host rather than submitting it to
+        the batch system.  Returns once the pipeline has finished.
+        :param max_cores: cores available to the pipeline, defaults to all
+        :param max_mem: memory (GB) available to the pipeline, defaults to all
+        :return: dictionary with the log directory, output directory, job IDs
+            and whether every job completed successfully
+        """
+        self.execution_mode = ToolExecModes.LOCAL
+
+        if not silent:
+            print('Running pipeline ' + self.name + ' locally')
+
+        self.write_command_info()
+        open(os.path.join(self.log_dir, job_runner.common.LOCAL_MODE_FLAG),
+             'w').close()
+
+        # Check that all files marked "input" exist.
+        missing = self.check_files_exist()
+        if missing:
+            print("The following required files are missing:\n    "
+                  + "\n    ".join(missing), file=sys.stderr)
+            sys.exit(1)
+
+        tasks = self.create_task_list()
+        self.write_resource_logs(silent)
+
+        with open(os.path.join(self.log_dir, job_runner.common.TASK_LOG), mode='w') as task_file:
+            for task in tasks:
+                task_file.write(task['name'] + '\t[' + ", ".join(task['dependencies']) + ']\n')
+
+        if not silent:
+            print('Log directory:  ' + self.log_dir)
+
+        executor = job_runner.local.LocalExecutor(self.log_dir, max_cores,
+                                                  max_mem)
+        complete = executor.run(tasks, silent)
+        self.job_runner.close()
+
+        return {
+            'log_dir': self.log_dir,
+            'output_dir': PipelineFile.get_output_dir(),
+            'job_ids': executor.job_ids,
+            'complete': complete
+        }
+
     @property
     def job_runner(self):
-        # The pipeline will use a single Torque job runner.
+        # The pipeline will use a single job runner, for the batch system
+        # selected in the config file.  Pipelines run on this host only need
+        # the local job runner to write their job scripts.
         if not self._job_runner:
-            self._job_runner = TorqueJobRunner(self.log_dir,
-                                               validate=(not self.skip_validation),
-                                               validation_file=self.validation_file,
-                                               pipeline_bin=os.path.abspath(os.path.join(self.master_XML_dir, "bin")),
-                                               queue=self.queue, submit=self.submit_jobs,
-                                               pipeline_path=self.path,
-                                               send_failure_email=self.error_email)
+            if self.execution_mode == ToolExecModes.LOCAL:
+                backend = job_runner.local
+            else:
+                backend = job_runner.batch_system.get_backend()
+            self._job_runner = backend.JobRunner(self.log_dir,
+                                                 validate=(not self.skip_validation),
+                                                 validation_file=self.validation_file,
+                                                 pipeline_bin=os.path.abspath(os.path.join(self.master_XML_dir, "bin")),
+                                                 queue=self.queue, submit=self.submit_jobs,
+                                                 pipeline_path=self.path,
+                                                 send_failure_email=self.error_email,
+                                                 submit_threads=config.submit_threads,
+                                                 job_arrays=self.job_arrays,
+                                                 array_slot_limit=config.job_array_slot_limit,
+                                                 fuse_chains=self.fuse_chains,
+                                                 max_dependencies=config.max_job_dependencies,
+                                                 critical_path_priority=config.critical_path_priority,
+                                                 resume=self.resume)
         return self._job_runner
 
+    def tool_resources(self, tool, job_name, threads, record=True):
+        """
+        Record a tool job for the resource history, and choose the walltime
+        and mem to request for it.  With autosize, these come from the
+        resource history if the tool has enough of it, otherwise they are the
+        tool's own.
+
+        :param tool: Tool
+        :param job_name: name of the tool's job
+        :param threads: threads the tool uses
+        :param record: add the job to the resource history, false if the job
+            runs other tools too
+        :return: (walltime, mem) to request
+        """
+        key = resource_history.ResourceHistory.key(
+            os.path.abspath(tool.xml_file), tool.name,
+            resource_history.size_bucket(self._tool_input_size(tool)))
+        if record:
+            self.tool_jobs.append((job_name,) + key)
+
+        if not self.autosize:
+            return tool.walltime, tool.mem
+
+        if self._resource_history is None:
+            self._resource_history = resource_history.ResourceHistory(
+                config.resource_history_file)
+        seconds, mem = self._resource_history.suggest(
+            key, config.autosize_percentile, config.autosize_margin,
+            config.autosize_min_samples)
+
+        walltime = tool.walltime
+        if seconds:
+            walltime = BatchJob.walltime_seconds_to_string(seconds)
+
+        # a tool that doesn't request memory gets the batch system's default,
+        # we don't know what that is so leave it alone
+        mem = str(mem) if mem and tool.mem else tool.mem
+
+        self.autosized_jobs.append((job_name, threads, tool.walltime,
+                                    walltime, tool.mem, mem))
+        return walltime, mem
+
+    def _tool_input_size(self, tool):
+        """
+        total size of a tool's input files. Most tools read files that are
+        written by other jobs of the pipeline, for those (and any other tool
+        with no input that exists yet) this is the size of the pipeline's
+        input files.
+        """
+        size = self._file_sizes(tool.pipeline_files[fid] for fid in tool.ins)
+        if not size:
+            if self._input_size is None:
+                self._input_size = self._file_sizes(
+                    f for f in self._files.values() if f.is_input)
+            size = self._input_size
+        return size
+
+    @staticmethod
+    def _file_sizes(files):
+        size = 0
+        for f in files:
+            if not f.path:
+                continue
+            for path in f.path.split(',') if f.is_list else [f.path]:
+                if os.path.isfile(path):
+                    size += os.path.getsize(path)
+        return size
+
+    def write_resource_logs(self, silent=False):
+        """
+        Write the tool job list used to add the pipeline to the resource
+        history and, if the pipeline was autosized, a report of what autosize
+        changed with a summary of the walltime and memory it saved.
+        """
+        with open(os.path.join(self.log_dir, job_runner.common.TOOL_JOB_LOG), 'w') as f:
+            for job in self.tool_jobs:
+                f.write('\t'.join(str(field) for field in job) + '\n')
+
+        if not self.autosize:
+            return
+
+        resized = 0
+        core_hours = [0.0, 0.0]
+        mem_hours = [0.0, 0.0]
+        with open(os.path.join(self.log_dir, 'autosize_report.txt'), 'w') as report:
+            report.write("# autosize: percentile {0}, margin {1}%, history {2}\n"
+                         "job\tthreads\twalltime\tautosized walltime\tmem (GB)"
+                         "\tautosized mem (GB)\n".format(
+                             config.autosize_percentile, config.autosize_margin,
+                             config.resource_history_file))
+            for job, threads, walltime, new_walltime, mem, new_mem in self.autosized_jobs:
+                report.write('\t'.join(str(x) for x in (job, threads, walltime, new_walltime, mem, new_mem)) + '\n')
+                if (walltime, mem) != (new_walltime, new_mem):
+                    resized += 1
+                hours = BatchJob.walltime_string_to_seconds(walltime) / 3600.0
+                new_hours = BatchJob.walltime_string_to_seconds(new_walltime) / 3600.0
+                core_hours[0] += hours * int(threads)
+                core_hours[1] += new_hours * int(threads)
+                if mem:
+                    mem_hours[0] += hours * int(mem)
+                    mem_hours[1] += new_hours * int(new_mem)
+
+            summary = "autosize: {0} of {1} tool jobs resized from the resource history".format(
+                resized, len(self.autosized_jobs))
+            for name, unit, (before, after) in (("walltime", "core hours", core_hours),
+                                                ("memory", "GB hours", mem_hours)):
+                if before:
+                    summary += ", {0} {1:.1f} -> {2:.1f} {3} ({4:.0f}% less)".format(
+                        name, before, after, unit, 100 * (before - after) / before)
+            report.write("# " + summary + "\n")
+
+        if not silent:
+            print(summary)
+
     def collect_files_to_validate(self):
         fns = []
         for step in self._steps:
@@ -536,6 +861,119 @@ class Pipeline(object):
                           "overwrites previous value of {}\n".format(prefix, opt, val, self.option_overrides[prefix][opt][0]), file=sys.stderr)
                 self.option_overrides[prefix][opt] = (val, source)
 
+    @staticmethod
+    def temp_file_deletions(files, file_ids=None):
+        """
+        Group temp files by the jobs that have to finish before they can be
+        deleted: every job that created or consumed the file or, for a
+        directory, any file in it (including the files of foreach iterations
+        that are no longer in files).  Temp files that no job uses are left
+        for the final cleanup job.
+
+        :param files: file dictionary
+        :param file_ids: ids of the temp files to delete, defaults to every
+            temp file in files
+        :return: list of (paths, jobs) tuples, the paths can be deleted once
+            all of the jobs (or task names) have succeeded
+        """
+        if file_ids is None:
+            file_ids = [fid for fid in files if files[fid].is_temp]
+
+        deletions = []
+        by_jobs = {}
+        for fid in sorted(file_ids):
+            f = files[fid]
+            if f.local_temp:
+                # a stream, deleted with its job's scratch directory
+                continue
+
+            users = [f]
+            if f.is_dir:
+                prefix = os.path.join(f.path, '')
+                users.extend(g for g in files.values() if not g.is_string and
+                             g.path.startswith(prefix))
+                contents = list(f.dir_files)
+                while contents:
+                    g = contents.pop()
+                    users.append(g)
+                    contents.extend(g.dir_files)
+
+            jobs = []
+            for g in users:
+                for j in g.creator_jobs + g.consumer_jobs:
+                    if j not in jobs:
+                        jobs.append(j)
+            if not jobs:
+                continue
+
+            key = tuple(sorted(jobs))
+            if key not in by_jobs:
+                by_jobs[key] = ([], jobs)
+                deletions.append(by_jobs[key])
+            by_jobs[key][0].append(f.path)
+
+        return deletions
+
+    def submit_temp_file_cleanup(self, name, paths, depends_on):
+        """
+        queue a job that deletes temp files
+        :param name: job name
+        :param paths: files and directories to delete
+        :param depends_on: jobs that use the files
+        :return: job ID
+        """
+        # rm -rf because a conditional command may not have created a file,
+        # and some temp files are directories
+        batch_job = BatchJob('rm -rf ' + ' '.join(paths),
+                             workdir=PipelineFile.get_output_dir(),
+                             depends_on=depends_on, name=name,
+                             walltime="00:30:00",
+                             email_list=self.error_email_address)
+        try:
+            return self.job_runner.queue_job(batch_job)
+        except Exception as e:
+            self.abort_submit(e, self.BATCH_ERROR)
+
+    def create_temp_file_cleanup_task(self, name, paths, dependencies):
+        """
+        create a task that deletes temp files, for BATCH_MANAGED and LOCAL
+        execution
+        :param name: task name
+        :param paths: files and directories to delete
+        :param dependencies: names of the tasks that use the files
+        :return: task dictionary
+        """
+        task = {}
+        task['name'] = name
+        task['command'] = 'rm -rf ' + ' '.join(paths)
+        task['mem'] = "1"
+        task['walltime'] = "00:30:00"
+        task['threads'] = 1
+        task['dependencies'] = dependencies
+
+        # need to make a BatchJob object so we can generate a job script
+        batch_job = BatchJob(task['command'],
+                             workdir=PipelineFile.get_output_dir(),
+                             ppn=task['threads'], walltime=task['walltime'],
+                             name=name, mem=task['mem'],
+                             email_list=self.error_email_address,
+                             stdout_path=os.path.join(self.log_dir, name + ".o"),
+                             stderr_path=os.path.join(self.log_dir, name + ".e"))
+
+        task['script_path'] = self.job_runner.write_script(batch_job)
+        task['stdout_path'] = batch_job.stdout_path
+        task['stderr_path'] = batch_job.stderr_path
+        task['epilogue_path'] = self.job_runner.epilogue_filename
+        task['batch_env'] = self.job_runner.generate_env(
+            PipelineFile.get_output_dir())
+        task['email_list'] = self.error_email_address
+        task['mail_options'] = batch_job.mail_option
+        task['module_files'] = []
+        task['log_dir'] = self.job_runner.execution_log_dir
+        task['queue'] = self.job_runner.queue
+
+        return task
+
     def _create_cleanup_cmd(self):
         cmd = []
         # 1. deletes all the temp files.
@@ -549,7 +987,8 @@ class Pipeline(object):
             # completes before an earlier submitted job.
             for fid in self._files:
                 f = self._files[fid]
-                if f.is_temp:
+                # streams only exist in the scratch directory of their job
+                if f.is_temp and not f.local_temp:
                     tmps.append(f.path)
             if len(tmps):
                 # Use rm -f because if a command is executed conditionally
@@ -561,7 +1000,7 @@ class Pipeline(object):
                 cmd.append('rm -rf ' + ' '.join(tmps))
 
         # 2. Consolidate all the log files.
-        consolidate_script_path = os.path.join(common.CIVET_HOME,
+        consolidate_script_path = os.path.join(job_runner.common.CIVET_HOME,
                                                'bin/consolidate_logs.py')
         cmd.append('{} {} {}'.format(config.civet_python,
                                      consolidate_script_path,
@@ -591,8 +1030,10 @@ class Pipeline(object):
                              mail_option='a',
                              email_list=self.error_email_address,
                              walltime="00:10:00")
+        # the log consolidation has to run in its own job, after every other
+        # job (including its own batch job's log files) has finished
         try:
-            self.job_runner.queue_job(batch_job)
+            self.job_runner.queue_job(batch_job, allow_fusion=False)
         except Exception as e:
                 sys.stderr.write(str(e) + '\n')
                 sys.exit(self.BATCH_ERROR)
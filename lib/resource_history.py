@@ -0,0 +1,212 @@
+# Copyright 2016 The Jackson Laboratory
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+resource_history.py
+
+a record of the walltime and memory used by past runs of each tool, so that
+civet_run --autosize can request what a tool actually needs rather than the
+padded walltime and mem from its XML.
+
+civet_run writes a line for each tool job to the common.TOOL_JOB_LOG file in
+the log directory:
+
+    <job name>\t<tool XML>\t<tool name>\t<input size bucket>
+
+and each job's -status.txt file has the walltime it used, plus the memory it
+used when the batch system reports it to the epilogue (Torque does).
+ResourceHistory.add_log_dir() adds the jobs of a finished pipeline to the
+history, which is kept per (tool XML, tool name, input size bucket).
+civet_resource_history maintains the history file and reports on it.
+"""
+
+from __future__ import print_function
+
+import errno
+import json
+import math
+import os
+
+from job_runner import common
+from job_runner.batch_job import BatchJob
+
+# samples kept per tool, the oldest are dropped first
+MAX_SAMPLES = 200
+
+_MEM_UNITS = {'b': 1.0 / 1024, 'kb': 1, 'mb': 1024, 'gb': 1024 ** 2,
+              'tb': 1024 ** 3}
+
+
+def size_bucket(size):
+    """
+    group input sizes by powers of two, bucket n holds sizes from 2^(n-1) to
+    2^n - 1 bytes (bucket 0 is an empty input)
+    :param size: total size of a tool's input files in bytes
+    """
+    return int(size).bit_length()
+
+
+def mem_to_kb(mem):
+    """
+    convert a Torque memory size (e.g. 1024kb, 4gb) to kilobytes
+    :return: size in kb, None if mem isn't a valid size
+    """
+    mem = mem.strip().lower()
+    digits = mem.rstrip('kmgtb')
+    unit = mem[len(digits):] or 'b'
+    if not digits.isdigit() or unit not in _MEM_UNITS:
+        return None
+    return int(digits) * _MEM_UNITS[unit]
+
+
+def percentile(values, pct):
+    """
+    :return: the nearest-rank percentile pct (0 - 100) of a list of numbers
+    """
+    ordered = sorted(values)
+    rank = int(math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[max(rank - 1, 0)]
+
+
+class ResourceHistory(object):
+    """
+    the walltime (in seconds) and memory (in kb) used by each tool, with
+    the most recent walltime and mem it requested.
+
+    tools: dictionary of (tool XML, tool name, size bucket) -> dictionary
+        with 'walltime' and 'mem' sample lists and 'requested_walltime' and
+        'requested_mem'
+    log_dirs: log directories that have been added
+    """
+
+    def __init__(self, path):
+        """
+        :param path: history file, loaded if it exists
+        """
+        self.path = os.path.expanduser(path)
+        self.tools = {}
+        self.log_dirs = set()
+
+        try:
+            with open(self.path) as history_file:
+                history = json.load(history_file)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        else:
+            self.log_dirs = set(history['log_dirs'])
+            for key, usage in history['tools'].items():
+                self.tools[tuple(key.split('\t'))] = usage
+
+    @staticmethod
+    def key(tool_xml, tool_name, bucket):
+        return tool_xml, tool_name, str(bucket)
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # write a new file and rename it so that a concurrent civet_run never
+        # reads a partial history
+        tmp = self.path + ".{0}.tmp".format(os.getpid())
+        with open(tmp, 'w') as history_file:
+            json.dump({'log_dirs': sorted(self.log_dirs),
+                       'tools': dict(('\t'.join(k), v)
+                                     for k, v in self.tools.items())},
+                      history_file, indent=1, sort_keys=True)
+        os.rename(tmp, self.path)
+
+    def add_log_dir(self, log_dir):
+        """
+        add the successful jobs of a finished pipeline to the history
+        :param log_dir: pipeline log directory
+        :return: number of jobs added, None if the log directory was already
+            added, has no tool job list, or the pipeline hasn't finished
+        """
+        log_dir = os.path.abspath(log_dir)
+        tool_jobs = os.path.join(log_dir, common.TOOL_JOB_LOG)
+        if log_dir in self.log_dirs or not os.path.exists(tool_jobs):
+            return None
+
+        samples = []
+        with open(tool_jobs) as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) != 4:
+                    continue
+                status = common.get_status_from_file(log_dir, fields[0])
+                if status is None:
+                    # an unfinished job, or one that never ran because the
+                    # pipeline failed or was canceled
+                    if not self._pipeline_stopped(log_dir):
+                        return None
+                    continue
+                if status.get('exit_status') != '0' or \
+                        'exit_if_exists' in status or 'walltime' not in status:
+                    continue
+                samples.append((self.key(*fields[1:]), status))
+
+        for key, status in samples:
+            usage = self.tools.setdefault(key, {'walltime': [], 'mem': [],
+                                                'requested_walltime': None,
+                                                'requested_mem': None})
+            usage['walltime'].append(
+                BatchJob.walltime_string_to_seconds(status['walltime']))
+            if status.get('requested_walltime'):
+                usage['requested_walltime'] = BatchJob.walltime_string_to_seconds(
+                    status['requested_walltime'])
+            mem = mem_to_kb(status.get('mem_used', ''))
+            if mem is not None:
+                usage['mem'].append(mem)
+                usage['requested_mem'] = mem_to_kb(status.get('requested_mem', ''))
+            del usage['walltime'][:-MAX_SAMPLES]
+            del usage['mem'][:-MAX_SAMPLES]
+
+        self.log_dirs.add(log_dir)
+        return len(samples)
+
+    @staticmethod
+    def _pipeline_stopped(log_dir):
+        # a job that failed leaves an -abort.log
+        return os.path.exists(os.path.join(log_dir, common.CANCEL_LOG_FILENAME)) or \
+            any(f.endswith('-abort.log') for f in os.listdir(log_dir))
+
+    def suggest(self, key, pct, margin, min_samples):
+        """
+        the resources to request for a tool, pct percentile of what it has
+        used plus margin percent
+        :param key: key() of the tool
+        :param pct: percentile of the samples
+        :param margin: safety margin, in percent
+        :param min_samples: don't suggest anything with fewer samples
+        :return: (walltime in seconds, mem in GB), either is None if there
+            isn't enough history for it
+        """
+        usage = self.tools.get(key)
+        if not usage:
+            return None, None
+        factor = 1 + margin / 100.0
+
+        walltime = None
+        if len(usage['walltime']) >= min_samples:
+            # round up to a whole minute, and ask for at least one
+            walltime = percentile(usage['walltime'], pct) * factor
+            walltime = max(int(math.ceil(walltime / 60.0)) * 60, 60)
+
+        mem = None
+        if len(usage['mem']) >= min_samples:
+            mem = percentile(usage['mem'], pct) * factor
+            mem = max(int(math.ceil(mem / 1024.0 ** 2)), 1)
+
+        return walltime, mem
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+# Copyright 2016 The Jackson Laboratory
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+slurm_stubs/check_slurm.py
+
+drive the SLURM job runner and job manager through the stub SLURM commands
+in this directory: submission (held, dependent and array jobs), release,
+squeue and sacct status parsing, scancel error handling, the retrying of
+commands that fail with a transient error and the environment passed to
+jobs.
+
+usage:  python lib/slurm_stubs/check_slurm.py
+
+prints OK, or fails with an AssertionError.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+STUB_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(STUB_DIR))
+
+from job_runner import retry
+from job_runner import slurm
+from job_runner.batch_job import BatchJob
+
+
+def ctl(*args):
+    subprocess.check_call([os.path.join(STUB_DIR, "slurm_stub_ctl")] +
+                          [str(a) for a in args])
+
+
+def policy(command):
+    # don't wait seconds between retries of the commands we make fail
+    command_policy = retry.get_policy(command, slurm._is_transient)
+    command_policy.base_delay = command_policy.max_delay = 0.01
+    return command_policy
+
+
+def check(work_dir):
+    for command in ("sbatch", "squeue", "scancel"):
+        policy(command)
+
+    runner = slurm.SlurmJobRunner(log_dir=os.path.join(work_dir, "log"))
+    manager = runner.get_job_manager()
+
+    first = BatchJob("true", workdir=work_dir, name="first", mem="1")
+    first_id = runner.queue_job(first)
+    assert runner.held_jobs == [first_id]
+    assert manager.query_job(first_id).state == 'H'
+
+    second = BatchJob("true", workdir=work_dir, name="second",
+                      depends_on=[first_id])
+    second_id = runner.queue_job(second)
+    assert second_id not in runner.held_jobs
+    assert manager.query_job(second_id).state == 'H'
+
+    # release through the job manager, the held job is queued
+    runner.release_all()
+    assert runner.held_jobs == []
+    assert manager.query_job(first_id).state == 'Q'
+    assert manager.queued_job_count() == 1
+
+    ctl("start", first_id)
+    status = manager.query_job(first_id)
+    assert status.state == 'R' and status.exit_status is None
+    ctl("finish", first_id, 0)
+    ctl("start", second_id)
+    ctl("finish", second_id, 3)
+    statuses = manager.query_jobs([first_id, second_id])
+    assert statuses[first_id].state == 'C'
+    assert statuses[first_id].exit_status == '0'
+    assert statuses[second_id].exit_status == '3'
+
+    # array jobs are queried element by element
+    array = BatchJob("true", workdir=work_dir, name="array")
+    runner._prepare_job(array)
+    array_id = runner._submit_job(array, runner.write_script(array),
+                                  array_size=3)
+    elements = [runner.array_element_id(array_id, i) for i in range(1, 4)]
+    statuses = manager.query_jobs(elements)
+    assert all(statuses[e].state == 'H' for e in elements)
+    assert manager.release_jobs([array_id]) == {}
+    ctl("timeout", elements[0])
+    statuses = manager.query_jobs(elements)
+    assert statuses[elements[0]].exit_status == \
+        str(manager.WALLTIME_LIMIT_EXIT_STATUS)
+    assert statuses[elements[1]].state == 'Q'
+
+    # unknown or finished jobs aren't reported as errors by delete_jobs,
+    # but are by delete_job
+    assert manager.delete_jobs([elements[1], first_id, "999999"]) == {}
+    assert manager.delete_job("999999") == manager.E_UNKNOWN
+    assert manager.delete_job(first_id) == manager.E_STATE
+    status = manager.query_job(elements[1])
+    assert status.state == 'C' and status.exit_status is None
+    assert manager.query_job("999999") is None
+
+    # transient failures are retried, other failures are not
+    sbatch = policy("sbatch")
+    retries = sbatch.retries
+    ctl("fail", "sbatch", 2)
+    retried = BatchJob("true", workdir=work_dir, name="retried")
+    assert runner.queue_job(retried)
+    assert sbatch.retries == retries + 2
+
+    ctl("fail", "sbatch", sbatch.max_retries + 1)
+    try:
+        runner.queue_job(BatchJob("true", workdir=work_dir, name="failed"))
+    except Exception as e:
+        assert "Socket timed out" in str(e)
+    else:
+        raise AssertionError("sbatch failure was not reported")
+
+    # scancel is not retried, the job may have been cancelled before the
+    # request timed out
+    scancel = policy("scancel")
+    retries = scancel.retries
+    ctl("fail", "scancel", 1)
+    assert manager.delete_job(elements[2]) == 1
+    assert scancel.retries == retries
+    assert manager.delete_job(elements[2]) == 0
+
+    ctl("fail", "squeue", 1)
+    assert manager.query_job(second_id).exit_status == '3'
+
+    # the job's variables reach it intact, even with a comma in a path
+    comma_dir = os.path.join(work_dir, "a,b=c")
+    os.mkdir(comma_dir)
+    env_id = runner.queue_job(BatchJob("true", workdir=comma_dir, name="env"))
+    with open(os.environ['SLURM_STUB_STATE']) as f:
+        env = json.load(f)['jobs'][env_id]['env']
+    assert env['PBS_O_WORKDIR'] == comma_dir
+    assert env['PBS_JOBNAME'] == "env"
+
+
+def main():
+    work_dir = tempfile.mkdtemp()
+    os.environ['PATH'] = STUB_DIR + os.pathsep + os.environ['PATH']
+    os.environ['SLURM_STUB_STATE'] = os.path.join(work_dir, "slurm_state.json")
+    try:
+        check(work_dir)
+    finally:
+        shutil.rmtree(work_dir)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
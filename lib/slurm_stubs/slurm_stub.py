@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+
+# Copyright 2016 The Jackson Laboratory
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+slurm_stubs/slurm_stub.py
+
+stand-ins for the SLURM commands used by job_runner/slurm.py (sbatch,
+squeue, sacct, scancel and scontrol), so that the SLURM backend can be
+exercised without a SLURM cluster.  The commands in this directory are
+links to this program, which acts as the command it is called as.  Putting
+this directory at the front of PATH makes SlurmJobRunner and JobManager use
+the stubs.
+
+Jobs are recorded in a JSON state file, SLURM_STUB_STATE in the
+environment, and are never run.  A job array is recorded as its elements
+(<array id>_<index>), along with the civet variables (PBS_*) sbatch
+--export=ALL would pass to it from the submitting environment.  Submitted
+jobs are PENDING until the test changes
+them with slurm_stub_ctl:
+
+  slurm_stub_ctl start JOB_ID...        the jobs are RUNNING
+  slurm_stub_ctl finish JOB_ID STATUS   the job COMPLETED (status 0) or
+                                        FAILED
+  slurm_stub_ctl timeout JOB_ID         the job reached its time limit
+  slurm_stub_ctl fail COMMAND COUNT     the next COUNT calls of COMMAND fail
+                                        with a transient error
+
+Job IDs given to scancel and scontrol may be array IDs, which apply to
+every element of the array.
+"""
+
+from __future__ import print_function
+
+import fcntl
+import json
+import os
+import sys
+
+
+_FIRST_JOB_ID = 1000
+
+_FINISHED_STATES = ('COMPLETED', 'FAILED', 'CANCELLED', 'TIMEOUT')
+
+_TRANSIENT_ERROR = ("{0}: error: Socket timed out on send/recv operation")
+
+
+class StubError(Exception):
+    pass
+
+
+class State(object):
+    """
+        the state file, locked while it is in use so that concurrent
+        commands see each other's changes
+    """
+    def __enter__(self):
+        path = os.environ.get('SLURM_STUB_STATE')
+        if not path:
+            raise StubError("SLURM_STUB_STATE is not set")
+        self._file = open(path, 'a+')
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        self._file.seek(0)
+        content = self._file.read()
+        self.data = json.loads(content) if content else {
+            'next_id': _FIRST_JOB_ID, 'jobs': {}, 'order': [], 'fail': {}}
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # like the real commands, a request that fails for some jobs still
+        # takes effect for the others
+        if exc_type is None or issubclass(exc_type, StubError):
+            self._file.seek(0)
+            self._file.truncate()
+            json.dump(self.data, self._file)
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+
+    @property
+    def jobs(self):
+        return self.data['jobs']
+
+    def lookup(self, job_id):
+        """
+            :return: list of the IDs of a job, or of the elements of an array
+        """
+        if job_id in self.jobs:
+            return [job_id]
+        return [j for j in self.data['order']
+                if self.jobs[j].get('array_id') == job_id]
+
+    def injected_failure(self, command):
+        remaining = self.data['fail'].get(command, 0)
+        if remaining:
+            self.data['fail'][command] = remaining - 1
+            return True
+        return False
+
+
+def _options(args):
+    """
+        split command line arguments into a dictionary of --name=value and
+        -x value options (None for flags), and the remaining arguments
+    """
+    flags = ('--parsable', '--hold', '--noheader', '--array', '--parsable2',
+             '--allocations', '-h', '-r')
+    options = {}
+    positional = []
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg.startswith('--') and '=' in arg:
+            name, value = arg.split('=', 1)
+            options[name] = value
+        elif arg in flags:
+            options[arg] = None
+        elif arg.startswith('-'):
+            options[arg] = args.pop(0) if args else None
+        else:
+            positional.append(arg)
+    return options, positional
+
+
+def sbatch(state, args):
+    options, positional = _options(args)
+    if len(positional) != 1 or not os.path.isfile(positional[0]):
+        raise StubError("sbatch: error: Unable to open file {0}".format(
+            ' '.join(positional)))
+
+    job_id = str(state.data['next_id'])
+    state.data['next_id'] += 1
+
+    if '--dependency' in options:
+        reason = 'Dependency'
+    elif '--hold' in options:
+        reason = 'JobHeldUser'
+    elif '--begin' in options:
+        reason = 'BeginTime'
+    else:
+        reason = 'None'
+
+    job = {'name': options.get('--job-name', os.path.basename(positional[0])),
+           'state': 'PENDING', 'reason': reason,
+           'limit': options.get('--time', 'UNLIMITED'),
+           'exit_code': '0:0', 'options': options}
+    if options.get('--export') == 'ALL':
+        job['env'] = dict((name, value) for name, value in os.environ.items()
+                          if name.startswith('PBS_'))
+
+    if '--array' in options:
+        count = int(options['--array'].split('%')[0].split('-')[1])
+        for index in range(1, count + 1):
+            element = dict(job, array_id=job_id)
+            state.jobs["{0}_{1}".format(job_id, index)] = element
+            state.data['order'].append("{0}_{1}".format(job_id, index))
+    else:
+        state.jobs[job_id] = job
+        state.data['order'].append(job_id)
+
+    if '--parsable' in options:
+        print(job_id)
+    else:
+        print("Submitted batch job {0}".format(job_id))
+
+
+def squeue(state, args):
+    options, positional = _options(args)
+    fmt = options.get('--format', options.get('-o', '%i %j %T %r'))
+    states = options.get('-t')
+    user = options.get('--user')
+    for job_id in state.data['order']:
+        job = state.jobs[job_id]
+        if job['state'] in _FINISHED_STATES:
+            continue
+        if states and job['state'] not in states.split(','):
+            continue
+        if user and user != os.environ.get('USER', user):
+            continue
+        line = fmt
+        for field, value in (('%i', job_id), ('%j', job['name']),
+                             ('%T', job['state']), ('%r', job['reason']),
+                             ('%M', '0:00'), ('%l', job['limit'])):
+            line = line.replace(field, value)
+        print(line)
+
+
+def sacct(state, args):
+    options, positional = _options(args)
+    for requested in options.get('--jobs', '').split(','):
+        for job_id in state.lookup(requested):
+            job = state.jobs[job_id]
+            print('|'.join([job_id, job['name'], job['state'],
+                            job['exit_code'], '00:00:00', job['limit']]))
+
+
+def scancel(state, args):
+    errors = []
+    for requested in args:
+        job_ids = state.lookup(requested)
+        if not job_ids:
+            errors.append("scancel: error: Kill job error on job id {0}: "
+                          "Invalid job id specified".format(requested))
+        for job_id in job_ids:
+            job = state.jobs[job_id]
+            if job['state'] in _FINISHED_STATES:
+                errors.append("scancel: error: Kill job error on job id {0}: "
+                              "Job/step already completing or "
+                              "completed".format(job_id))
+            else:
+                job['state'] = 'CANCELLED'
+                job['exit_code'] = '0:15'
+    if errors:
+        raise StubError('\n'.join(errors))
+
+
+def scontrol(state, args):
+    if not args or args[0] != 'release':
+        raise StubError("scontrol: error: unsupported request {0}".format(
+            ' '.join(args)))
+    errors = []
+    for requested in ','.join(args[1:]).split(','):
+        job_ids = state.lookup(requested)
+        if not job_ids:
+            errors.append("Invalid job id specified for job {0}".format(
+                requested))
+        for job_id in job_ids:
+            if state.jobs[job_id]['reason'] == 'JobHeldUser':
+                state.jobs[job_id]['reason'] = 'None'
+    if errors:
+        raise StubError('\n'.join(errors))
+
+
+def slurm_stub_ctl(state, args):
+    if not args:
+        raise StubError("usage: slurm_stub_ctl start|finish|timeout|fail ...")
+    request = args[0]
+    if request == 'fail':
+        state.data['fail'][args[1]] = int(args[2])
+        return
+
+    requested = args[1:] if request == 'start' else args[1:2]
+    job_ids = [j for r in requested for j in state.lookup(r)]
+    if not job_ids:
+        raise StubError("unknown job {0}".format(' '.join(args[1:])))
+
+    for job_id in job_ids:
+        job = state.jobs[job_id]
+        if request == 'start':
+            job['state'] = 'RUNNING'
+            job['reason'] = 'None'
+        elif request == 'finish':
+            status = int(args[2])
+            job['state'] = 'COMPLETED' if status == 0 else 'FAILED'
+            job['exit_code'] = "{0}:0".format(status)
+        elif request == 'timeout':
+            job['state'] = 'TIMEOUT'
+            job['exit_code'] = '0:15'
+        else:
+            raise StubError("unknown request {0}".format(request))
+
+
+_COMMANDS = {
+    'sbatch': sbatch,
+    'squeue': squeue,
+    'sacct': sacct,
+    'scancel': scancel,
+    'scontrol': scontrol,
+    'slurm_stub_ctl': slurm_stub_ctl,
+}
+
+
+def main():
+    command = os.path.basename(sys.argv[0])
+    if command not in _COMMANDS:
+        print("slurm_stub: run as one of {0}".format(
+            ', '.join(sorted(_COMMANDS))), file=sys.stderr)
+        return 1
+    try:
+        with State() as state:
+            if state.injected_failure(command):
+                print(_TRANSIENT_ERROR.format(command), file=sys.stderr)
+                return 1
+            _COMMANDS[command](state, sys.argv[1:])
+    except StubError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -22,7 +22,7 @@ import json
 import time
 
 import config
-import job_runner.torque as batch_system
+import job_runner.batch_system as batch_system
 import job_runner.common
 from exec_modes import ToolExecModes
 
@@ -46,8 +46,12 @@ class ManagedJobStatus(object):
     about a submitted job is if it is "Submitted" (queued but not complete),
     "Failed" (complete, with non-zero exit status), "Complete" (complete, zero
     exit status), and "Deleted" (no record of submitted job).
+
+    job_statuses is an optional dictionary of batch id -> job status, from
+    job_manager.query_jobs(), used instead of querying jobs one at a time.
     """
-    def __init__(self, log_dir, name, batch_id, job_manager):
+    def __init__(self, log_dir, name, batch_id, job_manager,
+                 job_statuses=None):
 
         # it's possible for there be an empty or incomplete -status.txt
         # file if the compute node crashed with the job running
@@ -67,7 +71,10 @@ class ManagedJobStatus(object):
                 status = job_runner.common.get_status_from_file(log_dir, name)
 
         if not status:
-            status = job_manager.query_job(str(batch_id))
+            if job_statuses is not None and str(batch_id) in job_statuses:
+                status = job_statuses[str(batch_id)]
+            else:
+                status = job_manager.query_job(str(batch_id))
 
             if status:
                 if status.state == 'C':
@@ -88,7 +95,7 @@ class ManagedJobStatus(object):
 class Status(object):
 
     def __init__(self, log_dir, name, id, deps, job_manager, running_at_cancel,
-                 excution_mode):
+                 excution_mode, job_statuses=None):
 
         self.state = None
         self.exit_status = None
@@ -106,8 +113,9 @@ class Status(object):
             # status.txt file exists for this job.
             # if we're configured to do io_sync_sleep, then don't trust the
             # file unless it hasn't been modified for at least
-            # config.io_sync_sleep seconds
-            if not config.io_sync_sleep or time.time() - os.path.getmtime(status_filename) >= config.io_sync_sleep:
+            # config.io_sync_sleep seconds. Local jobs don't sleep, they all
+            # run on the same host.
+            if not config.io_sync_sleep or excution_mode == ToolExecModes.LOCAL or time.time() - os.path.getmtime(status_filename) >= config.io_sync_sleep:
                 status = job_runner.common.get_status_from_file(log_dir, name)
 
         if status:
@@ -144,13 +152,17 @@ class Status(object):
             if 'requested_walltime' in status:
                 self.walltime_requested = status['requested_walltime']
 
-        elif self.excution_mode == ToolExecModes.BATCH_MANAGED:
-            # if the pipeline is being run in managed mode, there will be no
-            # status information for unfinished jobs
+        elif self.excution_mode in (ToolExecModes.BATCH_MANAGED,
+                                    ToolExecModes.LOCAL):
+            # if the pipeline is being run in managed mode or on the local
+            # host, there will be no status information for unfinished jobs
             self.state = "MANAGED"
 
         else:
-            status = job_manager.query_job(id)
+            if job_statuses is not None and id in job_statuses:
+                status = job_statuses[id]
+            else:
+                status = job_manager.query_job(id)
 
             if status:
                 if status.state == 'C':
@@ -195,7 +207,7 @@ class Status(object):
 
 class PipelineStatus(object):
 
-    def __init__(self, log_dir, job_manager=batch_system.JobManager()):
+    def __init__(self, log_dir, job_manager=None):
         self.log_dir = log_dir
         self.jobs = []
         self.aborted = False
@@ -226,10 +238,13 @@ class PipelineStatus(object):
         if os.path.exists(os.path.join(log_dir,
                                        job_runner.common.MANAGED_MODE_FLAG)):
             self.execution_mode = ToolExecModes.BATCH_MANAGED
+        elif os.path.exists(os.path.join(log_dir,
+                                         job_runner.common.LOCAL_MODE_FLAG)):
+            self.execution_mode = ToolExecModes.LOCAL
         else:
             self.execution_mode = ToolExecModes.BATCH_STANDARD
 
-        jm = job_manager
+        jm = job_manager if job_manager else self.get_job_manager()
 
         self.status = "UNKNOWN"
 
@@ -254,6 +269,14 @@ class PipelineStatus(object):
                 self.cancel_message = "PIPELINE WAS CANCELED by user.\n"
             self.jobs_running_at_cancel = cancel_info.get('RUNNING_JOBS', [])
 
+        # query the batch system for all of the jobs that haven't written a
+        # -status.txt file with one request, rather than one request per job
+        job_statuses = None
+        if self.execution_mode == ToolExecModes.BATCH_STANDARD:
+            job_statuses = jm.query_jobs(
+                [job[0] for job in batch_jobs if not os.path.exists(
+                    os.path.join(log_dir, job[1] + job_runner.common.JOB_STATUS_SUFFIX))])
+
         for job in batch_jobs:
 
             deps = []
@@ -261,7 +284,8 @@ class PipelineStatus(object):
                 deps = job[2]
 
             job_status = Status(log_dir, job[1], job[0], deps, jm,
-                                self.jobs_running_at_cancel, self.execution_mode)
+                                self.jobs_running_at_cancel, self.execution_mode,
+                                job_statuses)
             self.jobs.append(job_status)
 
             if job_status.state == "RUNNING":
@@ -313,7 +337,8 @@ class PipelineStatus(object):
         return str(self.__dict__)
 
     def to_json_serializable(self):
-        if self.execution_mode == ToolExecModes.BATCH_MANAGED:
+        if self.execution_mode in (ToolExecModes.BATCH_MANAGED,
+                                   ToolExecModes.LOCAL):
             pending_jobs = self.managed_unknown
         else:
             pending_jobs = self.held_jobs + self.delayed_jobs + self.queued_jobs
@@ -334,7 +359,7 @@ class PipelineStatus(object):
 
     @staticmethod
     def get_job_manager():
-        return batch_system.JobManager()
+        return batch_system.get_backend().JobManager()
 
 
 def main():
@@ -41,23 +41,76 @@ class Step(object):
                 raise ParseError(msg)
             self.tools.append(PipelineTool(child, files, e.attrib['name']))
 
+        self.groups = self._stream_groups(files)
+
+    def _stream_groups(self, files):
+        """
+        Group the tools connected by stream files, which run in the same job.
+        A stream must be written by one tool and read by the next tool in
+        the step.  Pipeline._check_streams checks that no other tool in the
+        pipeline uses it.
+        :return: list of lists of (invocation, PipelineTool), one per job
+        """
+        groups = []
+        for invocation, tool in enumerate(self.tools, 1):
+            t = tool.tool
+            stream_ins = [fid for fid in t.ins if files[fid].stream]
+            if stream_ins:
+                previous = groups[-1][-1][1].tool if groups else None
+                for fid in stream_ins:
+                    if previous is None or fid not in previous.outs:
+                        raise ParseError("step '{}', tool '{}': stream file '{}' must be "
+                                         "written by the previous tool in the "
+                                         "step".format(self.name, tool.name, fid))
+                groups[-1].append((invocation, tool))
+            else:
+                groups.append([(invocation, tool)])
+
+            for fid in t.outs:
+                if not files[fid].stream:
+                    continue
+                if invocation == len(self.tools) or fid not in self.tools[invocation].tool.ins:
+                    raise ParseError("step '{}', tool '{}': stream file '{}' must be "
+                                     "read by the next tool in the "
+                                     "step".format(self.name, tool.name, fid))
+
+        for group in groups:
+            if len(group) > 1:
+                for invocation, tool in group:
+                    if tool.tool.exit_if_exists:
+                        raise ParseError("step '{}', tool '{}': tools connected by a "
+                                         "stream file can't use "
+                                         "exit_if_exists".format(self.name, tool.name))
+        return groups
+
+    def _group_name(self, name_prefix, group):
+        # a group is named after the invocation of its first tool
+        return self.generate_name(name_prefix, group[0][0],
+                                  '_'.join(tool.tool.name_from_pipeline
+                                           for invocation, tool in group))
+
     def submit(self, name_prefix, silent=False):
-        invocation = 0
         job_ids = []
-        for tool in self.tools:
-            invocation += 1
-            name = self.generate_name(name_prefix, invocation, tool.tool.name_from_pipeline)
-            job_id = tool.submit(name, silent)
+        for group in self.groups:
+            name = self._group_name(name_prefix, group)
+            if len(group) == 1:
+                job_id = group[0][1].submit(name, silent)
+            else:
+                job_id = Tool.submit_streamed([tool.tool for invocation, tool in group],
+                                              name, silent)
             job_ids.append(job_id)
         return job_ids
 
     def create_tasks(self, name_prefix, execution_mode):
-        invocation = 0
         tasks = []
-        for tool in self.tools:
-            invocation += 1
-            name = self.generate_name(name_prefix, invocation, tool.tool.name_from_pipeline)
-            tasks.append(tool.create_task(name, execution_mode))
+        for group in self.groups:
+            name = self._group_name(name_prefix, group)
+            if len(group) == 1:
+                tasks.append(group[0][1].create_task(name, execution_mode))
+            else:
+                tasks.append(Tool.create_streamed_task(
+                    [tool.tool for invocation, tool in group], name,
+                    execution_mode))
         return tasks
 
     def collect_files_to_validate(self):
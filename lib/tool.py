@@ -16,6 +16,7 @@ from __future__ import print_function
 
 import sys
 import os
+import pipes
 import re
 import tempfile
 import xml.etree.ElementTree as ET
@@ -63,6 +64,7 @@ class Tool(object):
         'exit_if_exists',
         'exit_test_logic',
         'path',
+        'local_temp',
         ]
 
     def __init__(self, xml_file, ins, outs, pipeline_files, name,
@@ -234,6 +236,16 @@ class Tool(object):
         else:
             self.path = None
 
+        # put the tool's temp files in a node-local scratch directory? The
+        # tool XML overrides the config file. Cloud tasks don't run the job
+        # script that creates the scratch directory.
+        if 'local_temp' in atts:
+            self.local_temp = atts['local_temp'].upper() == 'TRUE'
+        else:
+            self.local_temp = config.local_temp
+        if PL.execution_mode == ToolExecModes.CLOUD_GCP:
+            self.local_temp = False
+
         # We can't process any non-file tags until all our files
         # are processed and fixed up.  Rather than force an order
         # in the user's file, we simply stash the other tags in
@@ -345,10 +357,15 @@ class Tool(object):
 
         PipelineFile.parse_xml(e, self.tool_files)
 
+        if self.tool_files[fid].stream:
+            raise civet_exceptions.ParseError("{}: only pipeline files can be "
+                                              "streams: {}".format(os.path.basename(self.xml_file), fid))
+
         # Track all the tool temporary files, so that we can
         # delete them at the end of the tool's execution.
         if self.tool_files[fid].is_temp:
             self.tempfile_ids.append(fid)
+            self.tool_files[fid].local_temp = self.local_temp
 
     def collect_files_to_validate(self):
         v = self.verify_files
@@ -371,23 +388,36 @@ class Tool(object):
 
         multi_command_list = [c.real_command for c in self.commands]
 
-        # Tack on a final command to delete our temp files.
-        if rm_tmp and self.tempfile_ids:
-            # Convert from file ids to paths.
-            for n in range(len(self.tempfile_ids)):
-                self.tempfile_ids[n] = (
-                    self.tool_files[self.tempfile_ids[n]].path)
+        temp_files = [self.tool_files[fid] for fid in self.tempfile_ids]
 
+        # temp directories in the node-local scratch directory can't be
+        # created until the job is running
+        local_dirs = [f.path for f in temp_files if f.local_temp and f.is_dir]
+        if local_dirs:
+            multi_command_list.insert(0, 'mkdir -p ' + ' '.join(local_dirs))
+
+        # Tack on a final command to delete our temp files.  Files in the
+        # scratch directory are deleted with it when the job finishes.
+        rm_paths = [f.path for f in temp_files if not f.local_temp]
+        if rm_tmp and rm_paths:
             # Use rm -f because if a command is executed conditionally
             # due to if_exists and if_not_exists, a temp file may not
             # exist.  Without -f the rm command would fail, causing
             # the entire pipeline to fail. We also need -r to take care of
             # <dir> tags declared temp
-            rm_cmd = 'rm -rf ' + ' '.join(self.tempfile_ids)
+            rm_cmd = 'rm -rf ' + ' '.join(rm_paths)
             multi_command_list.append(rm_cmd)
 
         return '  && \\\n'.join(multi_command_list)
 
+    def uses_local_temp(self):
+        """
+        :return: True if any of the tool's temp files are in the node-local
+            scratch directory
+        """
+        return any(self.tool_files[fid].local_temp
+                   for fid in self.tempfile_ids)
+
     def _build_veryify_file_list(self):
         verify_file_list = None
 
@@ -445,6 +475,7 @@ class Tool(object):
         # Do the actual batch job submission
         submit_threads = self.thread_option_max if self.thread_option_max else self.default_threads
         verify_file_list = self._build_veryify_file_list()
+        walltime, mem = PL.tool_resources(self, job_name, submit_threads)
 
         if PL.delay:
             date_time = PL.delay_timestamp
@@ -454,17 +485,18 @@ class Tool(object):
         batch_job = BatchJob(multi_command,
                              workdir=PipelineFile.get_output_dir(),
                              files_to_validate=verify_file_list,
-                             ppn=submit_threads, walltime=self.walltime,
+                             ppn=submit_threads, walltime=walltime,
                              modules=self.modules, depends_on=depends_on,
                              name=job_name, error_strings=self.error_strings,
                              version_cmds=self.collect_version_commands(),
                              files_to_test=self.exit_if_exists,
-                             file_test_logic=self.exit_test_logic, mem=self.mem,
+                             file_test_logic=self.exit_test_logic, mem=mem,
                              date_time=date_time,
                              email_list=PL.error_email_address,
                              info=("Tool Definition File: " +
                                    os.path.abspath(self.xml_file)),
-                             tool_path=self.path)
+                             tool_path=self.path,
+                             local_temp=self.uses_local_temp())
     
         try:
             job_id = PL.job_runner.queue_job(batch_job)
@@ -486,7 +518,9 @@ class Tool(object):
             f.add_consumer_job(job_id)
 
         if not silent:
-            print("{0}: {1}".format(job_id, self.name_from_pipeline))
+            # the job may not have actually been submitted yet, the pipeline
+            # prints the ID once it has been
+            PL.submitted_tools.append((job_id, self.name_from_pipeline))
         return job_id
 
     def check_files_exist(self):
@@ -517,9 +551,9 @@ class Tool(object):
 
         task['name'] = task_name
         task['command'] = multi_command
-        task['mem'] = self.mem
-        task['walltime'] = self.walltime
         task['threads'] = self.thread_option_max if self.thread_option_max else self.default_threads
+        task['walltime'], task['mem'] = PL.tool_resources(self, task_name,
+                                                          task['threads'])
 
         if execution_mode == ToolExecModes.CLOUD_GCP:
             task['docker_image'] = self.docker_image
@@ -529,6 +563,7 @@ class Tool(object):
             task['dependencies'] = []
             for input_name in self.ins:
                 inf = self.pipeline_files[input_name]
+                inf.add_consumer_job(task_name)
                 if inf.creator_job and inf.creator_job not in task['dependencies']:
                     task['dependencies'].append(inf.creator_job)
 
@@ -548,7 +583,8 @@ class Tool(object):
                 task['output_files'].append({'id': output_name, 'local': outf.path,
                                              'cloud': outf.cloud_path})
 
-        elif execution_mode == ToolExecModes.BATCH_MANAGED:
+        elif execution_mode in (ToolExecModes.BATCH_MANAGED,
+                                ToolExecModes.LOCAL):
 
             # Do the actual batch job submission
             submit_threads = task['threads']
@@ -557,6 +593,7 @@ class Tool(object):
             task['dependencies'] = []
             for input_name in self.ins:
                 inf = self.pipeline_files[input_name]
+                inf.add_consumer_job(task_name)
                 if inf.creator_job and inf.creator_job not in task['dependencies']:
                     task['dependencies'].append(inf.creator_job)
                 if inf.is_list:
@@ -573,16 +610,17 @@ class Tool(object):
             batch_job = BatchJob(multi_command,
                              workdir=PipelineFile.get_output_dir(),
                              files_to_validate=verify_file_list,
-                             ppn=submit_threads, walltime=self.walltime,
+                             ppn=submit_threads, walltime=task['walltime'],
                              modules=self.modules,
                              name=task_name, error_strings=self.error_strings,
                              version_cmds=self.collect_version_commands(),
                              files_to_test=self.exit_if_exists,
-                             file_test_logic=self.exit_test_logic, mem=self.mem,
+                             file_test_logic=self.exit_test_logic, mem=task['mem'],
                              email_list=PL.error_email_address,
                              info=("Tool Definition File: " +
                                    os.path.abspath(self.xml_file)),
                              tool_path=self.path,
+                             local_temp=self.uses_local_temp(),
                              stdout_path = os.path.join(PL.log_dir, task_name + ".o"),
                              stderr_path = os.path.join(PL.log_dir, task_name + ".e"))
 
@@ -607,6 +645,177 @@ class Tool(object):
         return task
 
 
+    @staticmethod
+    def _streamed_job(tools, job_name, tasks=False, **kwargs):
+        """
+        Build the batch job that runs tools connected by streams, named pipes
+        written by one tool and read by the next.  The tools run at the same
+        time (see civet_stream in civet_job.sh), so the job requests the sum
+        of their threads and memory and the longest of their walltimes.
+
+        :param tools: the connected Tools, in pipeline order
+        :param job_name: job (or task) name
+        :param tasks: if true, dependencies are task names
+        :param kwargs: passed to BatchJob
+        :return: BatchJob
+        """
+        import pipeline_parse as PL
+
+        # files written by the group don't make it depend on itself
+        internal = set(fid for t in tools for fid in t.outs)
+        streams = []
+        commands = []
+        depends_on = []
+        verify_files = []
+        modules = []
+        error_strings = []
+        version_cmds = []
+        tool_paths = []
+        walltime = 0
+        mem = None
+        threads = 0
+
+        for t in tools:
+            for c in t.commands:
+                c.fixupOptionsFiles()
+                if c.program and c.program not in t.verify_files:
+                    t.verify_files.append(c.program)
+            commands.append(t._build_multi_command())
+
+            for fid in t.outs:
+                f = t.pipeline_files[fid]
+                if f.stream and f.path not in streams:
+                    streams.append(f.path)
+
+            for fid in t.ins:
+                if fid in internal:
+                    continue
+                f = t.pipeline_files[fid]
+                if f.creator_job and f.creator_job not in depends_on:
+                    depends_on.append(f.creator_job)
+                if f.is_list and f.foreach_dep:
+                    if tasks:
+                        depends_on.extend(PL.foreach_tasks[f.foreach_dep])
+                    else:
+                        depends_on.append(PL.foreach_barriers[f.foreach_dep])
+
+            tool_threads = t.thread_option_max if t.thread_option_max else t.default_threads
+            threads += tool_threads
+            # the job's usage isn't any one tool's, so it isn't added to the
+            # resource history
+            tool_walltime, tool_mem = PL.tool_resources(t, job_name,
+                                                        tool_threads,
+                                                        record=False)
+            walltime = max(walltime,
+                           BatchJob.walltime_string_to_seconds(tool_walltime))
+            if tool_mem:
+                mem = (mem or 0) + int(tool_mem)
+
+            if not t.skip_validation:
+                verify_files.extend(f for f in t._build_veryify_file_list()
+                                    if f not in verify_files)
+            modules.extend(m for m in t.modules if m not in modules)
+            error_strings.extend(e for e in t.error_strings or []
+                                 if e not in error_strings)
+            version_cmds.extend(v for v in t.collect_version_commands()
+                                if v not in version_cmds)
+            if t.path:
+                tool_paths.append(t.path)
+
+        # the pipes are created in the job's scratch directory
+        cmd = 'civet_stream {0} -- {1}'.format(
+            ' '.join(streams), ' '.join(pipes.quote(c) for c in commands))
+
+        return BatchJob(cmd, workdir=PipelineFile.get_output_dir(),
+                        files_to_validate=verify_files or None,
+                        ppn=threads,
+                        walltime=BatchJob.walltime_seconds_to_string(walltime),
+                        modules=modules, depends_on=depends_on, name=job_name,
+                        error_strings=error_strings or None,
+                        version_cmds=version_cmds,
+                        mem=str(mem) if mem else None,
+                        email_list=PL.error_email_address,
+                        info='\n'.join("Tool Definition File: " +
+                                       os.path.abspath(t.xml_file)
+                                       for t in tools),
+                        tool_path=':'.join(tool_paths) or None,
+                        local_temp=True, **kwargs)
+
+    @staticmethod
+    def submit_streamed(tools, job_name, silent):
+        """
+        Submit tools connected by streams as a single cluster job.
+
+        :param tools: the connected Tools, in pipeline order
+        :param job_name: a unique (to the pipeline) job name.
+        :param silent: if true, don't print job ID after it's submitted
+        :return: job_id
+        """
+        import pipeline_parse as PL
+
+        date_time = PL.delay_timestamp if PL.delay else None
+        batch_job = Tool._streamed_job(tools, job_name, date_time=date_time)
+
+        try:
+            job_id = PL.job_runner.queue_job(batch_job)
+        except Exception as e:
+            PL.abort_submit(e, PL.BATCH_ERROR)
+
+        for t in tools:
+            for fid in t.outs:
+                t.pipeline_files[fid].set_creator_job(job_id)
+            for fid in t.ins:
+                t.pipeline_files[fid].add_consumer_job(job_id)
+            if not silent:
+                PL.submitted_tools.append((job_id, t.name_from_pipeline))
+        return job_id
+
+    @staticmethod
+    def create_streamed_task(tools, task_name, execution_mode):
+        """
+        create the task that runs tools connected by streams, see
+        create_task()
+        """
+        import pipeline_parse as PL
+
+        if execution_mode not in (ToolExecModes.BATCH_MANAGED,
+                                  ToolExecModes.LOCAL):
+            raise ValueError("stream files are not supported in execution "
+                             "mode {}".format(ToolExecModes.to_str(execution_mode)))
+
+        batch_job = Tool._streamed_job(
+            tools, task_name, tasks=True,
+            stdout_path=os.path.join(PL.log_dir, task_name + ".o"),
+            stderr_path=os.path.join(PL.log_dir, task_name + ".e"))
+
+        for t in tools:
+            for fid in t.outs:
+                t.pipeline_files[fid].set_creator_job(task_name)
+            for fid in t.ins:
+                t.pipeline_files[fid].add_consumer_job(task_name)
+
+        task = {}
+        task['name'] = task_name
+        task['command'] = batch_job.cmd
+        task['threads'] = batch_job.ppn
+        task['walltime'] = batch_job.walltime
+        # BatchJob adds the units to mem, tasks expect the number of GB
+        task['mem'] = batch_job.mem[:-2] if batch_job.mem else None
+        task['dependencies'] = batch_job.depends_on
+        task['script_path'] = PL.job_runner.write_script(batch_job)
+        task['stdout_path'] = batch_job.stdout_path
+        task['stderr_path'] = batch_job.stderr_path
+        task['epilogue_path'] = PL.job_runner.epilogue_filename
+        task['batch_env'] = PL.job_runner.generate_env(PipelineFile.get_output_dir())
+        task['email_list'] = PL.error_email_address
+        task['mail_options'] = batch_job.mail_option
+        task['module_files'] = batch_job.modules
+        task['log_dir'] = PL.job_runner.execution_log_dir
+        task['queue'] = PL.job_runner.queue
+
+        return task
+
+
 class Option(object):
     def __init__(self, e, tool):
 
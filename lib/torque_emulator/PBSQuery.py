@@ -0,0 +1,71 @@
+# Copyright 2016 The Jackson Laboratory
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+torque_emulator/PBSQuery.py
+
+the subset of the pbs_python PBSQuery module used by civet, implemented on
+top of the in-process emulated pbs_server in emulator.py
+"""
+
+import emulator
+
+
+class PBSError(Exception):
+    def __init__(self, msg=''):
+        super(PBSError, self).__init__(msg)
+        self.message = msg
+
+
+class job(dict):
+    """
+        status of a job, values are lists like those returned by PBSQuery
+    """
+
+    def get_value(self, key):
+        return self.get(key)
+
+
+class server(job):
+    """
+        pbs_server attributes
+    """
+
+
+class PBSQuery(object):
+
+    def __init__(self, server=None):
+        self.server = emulator.get_server(server)
+
+    def getjob(self, name, attrib_list=None):
+        status = self.server.job_status(name)
+        if status is None:
+            return {}
+        return job(self._filter(status, attrib_list))
+
+    def getjobs(self, attrib_list=None, job_list=None):
+        jobs = {}
+        for job_id, status in self.server.all_job_status().items():
+            if job_list is None or job_id in job_list:
+                jobs[job_id] = job(self._filter(status, attrib_list))
+        return jobs
+
+    def get_serverinfo(self, attrib_list=None):
+        info = {'state_count': [self.server.state_count()]}
+        return {self.server.name: server(self._filter(info, attrib_list))}
+
+    @staticmethod
+    def _filter(status, attrib_list):
+        if not attrib_list:
+            return status
+        return dict((k, v) for k, v in status.items() if k in attrib_list)
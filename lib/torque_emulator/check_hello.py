@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+# Copyright 2016 The Jackson Laboratory
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+torque_emulator/check_hello.py
+
+smoke check of the emulator: run examples/hello/hello_pipe.xml with
+civet_run against the emulator, the way the emulator's documentation
+describes, and check that civet_run waits for the pipeline to run to
+completion and that every job succeeded.
+
+usage:  python lib/torque_emulator/check_hello.py
+
+prints OK, or fails with an AssertionError.  Each job's epilogue sleeps
+io_sync_sleep seconds (see conf/config.json), so this takes a couple of
+minutes with the default configuration.
+"""
+
+from __future__ import print_function
+
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+EMULATOR_DIR = os.path.dirname(os.path.abspath(__file__))
+CIVET_HOME = os.path.dirname(os.path.dirname(EMULATOR_DIR))
+
+# longest we wait for civet_run, in seconds
+TIMEOUT = 600
+
+
+def check(work_dir):
+    env = dict(os.environ)
+    env['TORQUE_EMULATOR_WAIT'] = "1"
+    env['PYTHONPATH'] = os.pathsep.join(
+        [EMULATOR_DIR] + [p for p in [env.get('PYTHONPATH')] if p])
+
+    cmd = ["timeout", str(TIMEOUT), sys.executable,
+           os.path.join(CIVET_HOME, "bin", "civet_run"),
+           os.path.join(CIVET_HOME, "examples", "hello", "hello_pipe.xml")]
+    rval = subprocess.call(cmd, cwd=work_dir, env=env)
+    assert rval == 0, "civet_run exited with status {0}".format(rval)
+
+    log_dirs = glob.glob(os.path.join(work_dir, "logs", "*"))
+    assert len(log_dirs) == 1, "expected one log directory"
+    log_dir = log_dirs[0]
+
+    with open(os.path.join(log_dir, "pipeline_batch_id_list.txt")) as f:
+        jobs = [line.split('\t')[1] for line in f if line.strip()]
+    assert jobs, "no jobs were submitted"
+
+    # civet_run only exits once the emulator has run every job
+    for job in jobs:
+        status_file = os.path.join(log_dir, job + "-status.txt")
+        assert os.path.exists(status_file), "{0} did not finish".format(job)
+        with open(status_file) as f:
+            status = dict(line.strip().split('=', 1) for line in f
+                          if '=' in line)
+        assert status.get('exit_status') == '0', \
+            "{0} exit status {1}".format(job, status.get('exit_status'))
+
+
+def main():
+    work_dir = tempfile.mkdtemp()
+    try:
+        check(work_dir)
+    finally:
+        shutil.rmtree(work_dir)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+# Copyright 2016 The Jackson Laboratory
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+torque_emulator/check_submit_overlap.py
+
+check that TorqueJobRunner's submission threads make their pbs_server
+requests concurrently: submit a level of independent jobs to an emulated
+server whose requests each take REQUEST_DELAY seconds, and check that
+several requests were in progress at once and that the level took a
+fraction of the time of submitting the jobs one at a time.
+
+usage:  python lib/torque_emulator/check_submit_overlap.py
+
+prints OK, or fails with an AssertionError.
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+EMULATOR_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, EMULATOR_DIR)
+sys.path.insert(1, os.path.dirname(EMULATOR_DIR))
+
+import emulator
+from job_runner import torque
+from job_runner.batch_job import BatchJob
+
+REQUEST_DELAY = 0.2
+JOBS = 16
+THREADS = 8
+
+
+def check(work_dir):
+    emulator.configure(run_jobs=False, request_delay=REQUEST_DELAY)
+    server = emulator.get_server()
+
+    runner = torque.TorqueJobRunner(log_dir=os.path.join(work_dir, "log"),
+                                    submit_threads=THREADS)
+    runner.defer_submission()
+    for i in range(JOBS):
+        runner.queue_job(BatchJob("true", workdir=work_dir,
+                                  name="job{0}".format(i)))
+
+    start = time.time()
+    runner.submit_deferred()
+    elapsed = time.time() - start
+    runner.close()
+
+    assert len(runner.submitted_jobs) == JOBS
+    assert server.max_concurrent_requests > 1, \
+        "submission requests were made one at a time"
+    serial = JOBS * REQUEST_DELAY
+    assert elapsed < serial / 2, \
+        "{0} submissions took {1:.1f}s, {2:.1f}s one at a time".format(
+            JOBS, elapsed, serial)
+    print("{0} submissions in {1:.1f}s ({2:.1f}s one at a time), up to {3} "
+          "requests at once".format(JOBS, elapsed, serial,
+                                    server.max_concurrent_requests))
+
+
+def main():
+    work_dir = tempfile.mkdtemp()
+    try:
+        check(work_dir)
+    finally:
+        shutil.rmtree(work_dir)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,712 @@
+# Copyright 2016 The Jackson Laboratory
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+torque_emulator/emulator.py
+
+an in-process emulation of a Torque pbs_server, used by the pbs and PBSQuery
+modules in this directory.  Putting this directory at the front of
+PYTHONPATH lets TorqueJobRunner, JobManager, PipelineStatus and the managed
+batch master run without a real pbs_server, for example to measure
+submission and status throughput or to run pipelines end to end on a
+workstation or CI host.
+
+The server keeps its jobs in memory, so everything that talks to it must
+run in the same Python process.  It supports:
+
+  - job submission, including job arrays (with slot limits), user holds,
+    delayed start times, priorities and afterok/afterokarray dependencies
+  - releasing holds and deleting queued or running jobs
+  - the Torque job states (Q, H, W, R, E, C)
+  - running the job scripts as local subprocesses, enforcing their
+    walltime, and running the job epilogue with Torque's arguments
+
+A job whose afterok dependency fails is deleted, as pbs_server does.  Jobs
+can call qdel, a small script in the server's spool directory (added to
+the front of the jobs' PATH) queues the request for the server.
+
+Options, either passed to configure() or set in the environment before the
+first server is created:
+
+  run_jobs (TORQUE_EMULATOR_RUN_JOBS): if false, jobs are queued but never
+      run, useful for measuring submission and status throughput.
+      Default true
+  max_running (TORQUE_EMULATOR_MAX_RUNNING): maximum number of jobs running
+      at once.  Default is the number of cores
+  keep_completed (TORQUE_EMULATOR_KEEP_COMPLETED): seconds that completed
+      jobs are listed, like the pbs_server keep_completed parameter.
+      Default is to keep them until the process exits
+  wait_at_exit (TORQUE_EMULATOR_WAIT): if true, the process waits for all
+      of the jobs to finish before it exits, so that programs that exit
+      after submitting a pipeline (civet_run) run it to completion.
+      Default false
+  request_delay (TORQUE_EMULATOR_REQUEST_DELAY): seconds each submit,
+      release or delete request takes, like the round trip to a remote
+      pbs_server.  Requests on different connections overlap, the most that
+      were in progress at once is the server's max_concurrent_requests.
+      Default 0
+
+For example, to run a pipeline against the emulator:
+
+  TORQUE_EMULATOR_WAIT=1 PYTHONPATH=$CIVET_HOME/lib/torque_emulator \\
+      civet_run pipeline.xml ...
+
+check_hello.py in this directory runs examples/hello/hello_pipe.xml this way.
+
+The epilogue waits io_sync_sleep seconds after each job, set it to 0 in
+the config file (or in the harness, config.io_sync_sleep = 0) when
+measuring throughput.
+"""
+
+from __future__ import print_function
+
+import atexit
+import contextlib
+import getpass
+import grp
+import multiprocessing
+import os
+import re
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+
+
+DEFAULT_SERVER = "emulator"
+
+# Torque error codes for requests the server rejects
+PBSE_UNKJOBID = 15001
+PBSE_PROTOCOL = 15031
+PBSE_BADATVAL = 15016
+PBSE_BADSTATE = 15018
+PBSE_BADDEPEND = 15056
+
+# exit status recorded by Torque for a job killed by a signal is 256 + the
+# signal number, and -11 for a job that exceeded its walltime
+_SIGNAL_EXIT_BASE = 256
+_WALLTIME_EXIT_STATUS = -11
+
+_QDEL_SCRIPT = """#!/bin/bash
+# queue delete requests for the Torque emulator
+for ID in "$@"; do
+    echo "$ID" >> {0}
+done
+"""
+
+_options = {
+    'run_jobs': os.environ.get('TORQUE_EMULATOR_RUN_JOBS', '1') not in ('0', 'false'),
+    'max_running': int(os.environ.get('TORQUE_EMULATOR_MAX_RUNNING', 0)) or None,
+    'keep_completed': (int(os.environ['TORQUE_EMULATOR_KEEP_COMPLETED'])
+                       if 'TORQUE_EMULATOR_KEEP_COMPLETED' in os.environ
+                       else None),
+    'wait_at_exit': os.environ.get('TORQUE_EMULATOR_WAIT', '0') not in ('0', 'false'),
+    'request_delay': float(os.environ.get('TORQUE_EMULATOR_REQUEST_DELAY', 0)),
+}
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+class EmulatorError(Exception):
+    """
+        raised for a request the server rejects, code is the Torque error code
+    """
+    def __init__(self, code, message):
+        super(EmulatorError, self).__init__(message)
+        self.code = code
+
+
+def configure(**options):
+    """
+        set emulator options (see the module documentation), they apply to
+        servers created afterwards
+    """
+    for name, value in options.items():
+        if name not in _options:
+            raise ValueError("Unknown emulator option: '{0}'".format(name))
+        _options[name] = value
+
+
+def get_server(name=None):
+    """
+        return the emulated pbs_server with this name, creating it on first
+        use
+    """
+    if not name:
+        name = DEFAULT_SERVER
+    with _servers_lock:
+        if name not in _servers:
+            _servers[name] = Server(name, **_options)
+        return _servers[name]
+
+
+def _format_walltime(seconds):
+    seconds = int(seconds)
+    return "{0:02d}:{1:02d}:{2:02d}".format(seconds // 3600,
+                                            seconds % 3600 // 60,
+                                            seconds % 60)
+
+
+def _walltime_seconds(walltime):
+    seconds = 0
+    for field in walltime.split(':'):
+        seconds = seconds * 60 + int(field)
+    return seconds
+
+
+def _local_path(path):
+    # Torque paths may be prefixed with the host name
+    return re.sub(r'^[^/:]*:', '', path)
+
+
+class Job(object):
+    """
+        a job (or an element of a job array) on the emulated server
+
+        job_id: Torque job ID
+        attributes: dictionary of job attribute name -> value
+        resources: dictionary of Resource_List resource -> value
+        script: path of the job script
+        seq: submission order, used to break priority ties
+        array: JobArray this job is an element of, if any
+        index: index of the element within the array
+        depends: list of (dependency type, job ID) pairs the job waits on
+        state: Torque job state
+        exit_status: exit status once complete, None if deleted before it ran
+    """
+
+    def __init__(self, job_id, attributes, resources, script, seq,
+                 array=None, index=None):
+        self.job_id = job_id
+        self.attributes = attributes
+        self.resources = resources
+        self.script = script
+        self.seq = seq
+        self.array = array
+        self.index = index
+        self.name = attributes.get('Job_Name', os.path.basename(script))
+        if index is not None:
+            self.name = "{0}-{1}".format(self.name, index)
+        self.hold = 'u' in attributes.get('Hold_Types', '')
+        self.priority = int(attributes.get('Priority', 0))
+        self.execution_time = (float(attributes['Execution_Time'])
+                               if 'Execution_Time' in attributes else None)
+        self.depends = self._parse_depends(attributes.get('depend', ''))
+        self.state = 'Q'
+        self.exit_status = None
+        self.process = None
+        self.start_time = None
+        self.end_time = None
+        self.walltime_exceeded = False
+
+    @staticmethod
+    def _parse_depends(depend):
+        depends = []
+        for dependency in depend.split(','):
+            if not dependency:
+                continue
+            fields = dependency.split(':')
+            for job_id in fields[1:]:
+                depends.append((fields[0], job_id))
+        return depends
+
+    @property
+    def walltime(self):
+        return self.resources.get('walltime')
+
+    def output_path(self, attribute):
+        path = _local_path(self.attributes.get(attribute, '/dev/null'))
+        if self.index is not None and path != '/dev/null':
+            path = "{0}-{1}".format(path, self.index)
+        return path
+
+    def status(self, server_name):
+        """
+            :return: the job's status, in the form returned by PBSQuery
+        """
+        status = {
+            'Job_Name': [self.name],
+            'job_state': [self.state],
+            'queue': [self.attributes.get('queue', 'batch')],
+            'server': [server_name],
+            'Hold_Types': ['u' if self.hold else 'n'],
+            'Priority': [str(self.priority)],
+            'Output_Path': [self.attributes.get('Output_Path', '')],
+            'Error_Path': [self.attributes.get('Error_Path', '')],
+            'Resource_List': dict((k, [v]) for k, v in self.resources.items()),
+        }
+        if 'depend' in self.attributes:
+            status['depend'] = [self.attributes['depend']]
+        if self.start_time is not None:
+            end = self.end_time if self.end_time is not None else time.time()
+            status['resources_used'] = {
+                'walltime': [_format_walltime(end - self.start_time)]
+            }
+        if self.state == 'C' and self.exit_status is not None:
+            status['exit_status'] = [str(self.exit_status)]
+        return status
+
+
+class JobArray(object):
+    """
+        a job array, the elements are Jobs
+
+        job_id: ID of the array (e.g. 12[].server)
+        slot_limit: maximum number of elements running at once, or None
+    """
+
+    def __init__(self, job_id, slot_limit):
+        self.job_id = job_id
+        self.slot_limit = slot_limit
+        self.elements = []
+
+    @property
+    def state(self):
+        states = set(e.state for e in self.elements)
+        for state in ('R', 'E', 'Q', 'W', 'H'):
+            if state in states:
+                return state
+        return 'C'
+
+    def status(self, server_name):
+        status = self.elements[0].status(server_name)
+        status['Job_Name'] = [self.elements[0].attributes.get('Job_Name', '')]
+        status['job_state'] = [self.state]
+        status['job_array_request'] = ["1-{0}".format(len(self.elements))]
+        status.pop('exit_status', None)
+        return status
+
+
+class Server(object):
+    """
+        an emulated pbs_server
+
+        name: server name, used as the suffix of job IDs
+        see the module documentation for the other options
+    """
+
+    def __init__(self, name, run_jobs=True, max_running=None,
+                 keep_completed=None, wait_at_exit=False, request_delay=0,
+                 poll_interval=0.05):
+        self.name = name
+        self.request_delay = request_delay
+        self.run_jobs = run_jobs
+        self.max_running = max_running if max_running else multiprocessing.cpu_count()
+        self.keep_completed = keep_completed
+        self.poll_interval = poll_interval
+
+        self._lock = threading.RLock()
+        self._jobs = {}
+        self._arrays = {}
+        self._completed = {}
+        self._seq = 0
+        self._running = 0
+        self._epilogues = []
+        self._thread = None
+        self._shutdown = False
+        self._requests = 0
+        self.max_concurrent_requests = 0
+
+        self.spool_dir = tempfile.mkdtemp(prefix="torque_emulator.")
+        self._qdel_requests = os.path.join(self.spool_dir, "qdel_requests")
+        self._qdel_offset = 0
+        qdel = os.path.join(self.spool_dir, "qdel")
+        with open(qdel, 'w') as f:
+            f.write(_QDEL_SCRIPT.format(self._qdel_requests))
+        os.chmod(qdel, 0o755)
+
+        # atexit calls its functions last registered first, so wait() is
+        # registered after shutdown() to let the jobs finish before they are
+        # killed
+        atexit.register(self.shutdown)
+        if wait_at_exit:
+            atexit.register(self.wait)
+
+    # requests, these are made by the pbs and PBSQuery modules
+
+    @contextlib.contextmanager
+    def round_trip(self):
+        """
+            context for a request made by a client, waits request_delay
+            seconds before the request is handled and counts the requests in
+            progress
+        """
+        with self._lock:
+            self._requests += 1
+            self.max_concurrent_requests = max(self.max_concurrent_requests,
+                                               self._requests)
+        try:
+            if self.request_delay:
+                time.sleep(self.request_delay)
+            yield
+        finally:
+            with self._lock:
+                self._requests -= 1
+
+    def submit(self, attributes, resources, script, queue=None):
+        """
+            queue a job
+            :param attributes: dictionary of job attribute -> value
+            :param resources: dictionary of Resource_List resource -> value
+            :param script: path of the job script
+            :param queue: destination queue
+            :return: job ID
+        """
+        if not os.path.exists(script):
+            raise EmulatorError(PBSE_BADATVAL,
+                                "script {0} does not exist".format(script))
+        if queue:
+            attributes['queue'] = queue
+
+        with self._lock:
+            for dep_type, dep_id in Job._parse_depends(attributes.get('depend', '')):
+                if dep_type not in ('afterok', 'afterokarray'):
+                    raise EmulatorError(PBSE_BADDEPEND, "Unsupported "
+                                        "dependency type {0}".format(dep_type))
+                if not self._known(dep_id):
+                    raise EmulatorError(PBSE_BADDEPEND,
+                                        "Unknown dependency {0}".format(dep_id))
+
+            self._seq += 1
+            array_request = attributes.get('job_array_request')
+            if array_request:
+                match = re.match(r'^1-(\d+)(?:%(\d+))?$', array_request)
+                if not match:
+                    raise EmulatorError(PBSE_BADATVAL, "Unsupported array "
+                                        "request {0}".format(array_request))
+                job_id = "{0}[].{1}".format(self._seq, self.name)
+                array = JobArray(job_id, int(match.group(2)) if match.group(2)
+                                 else None)
+                for index in range(1, int(match.group(1)) + 1):
+                    element = Job("{0}[{1}].{2}".format(self._seq, index,
+                                                        self.name),
+                                  attributes, resources, script, self._seq,
+                                  array, index)
+                    array.elements.append(element)
+                    self._jobs[element.job_id] = element
+                self._arrays[job_id] = array
+            else:
+                job_id = "{0}.{1}".format(self._seq, self.name)
+                self._jobs[job_id] = Job(job_id, attributes, resources,
+                                         script, self._seq)
+
+            self._start_thread()
+        return job_id
+
+    def delete(self, job_id):
+        """
+            delete a job or job array, a running job is killed with SIGTERM
+            :return: 0 or a Torque error code
+        """
+        with self._lock:
+            jobs = self._lookup(job_id)
+            if jobs is None:
+                return PBSE_UNKJOBID
+            if all(job.state == 'C' for job in jobs):
+                return PBSE_BADSTATE
+            for job in jobs:
+                self._delete(job)
+        return 0
+
+    def release(self, job_id, hold_type='u'):
+        """
+            release the hold on a job or job array
+            :return: 0 or a Torque error code
+        """
+        with self._lock:
+            jobs = self._lookup(job_id)
+            if jobs is None:
+                return PBSE_UNKJOBID
+            if 'u' in hold_type:
+                for job in jobs:
+                    job.hold = False
+        return 0
+
+    def job_status(self, job_id):
+        """
+            :return: status of a job or job array, or None if the job is not
+                known
+        """
+        with self._lock:
+            if job_id in self._arrays:
+                return self._arrays[job_id].status(self.name)
+            if job_id in self._jobs:
+                return self._jobs[job_id].status(self.name)
+        return None
+
+    def all_job_status(self):
+        """
+            :return: dictionary of job ID -> status for every job the server
+                knows. Like pbs_server, arrays are listed rather than their
+                elements.
+        """
+        statuses = {}
+        with self._lock:
+            for job_id, job in self._jobs.items():
+                if job.array is None:
+                    statuses[job_id] = job.status(self.name)
+            for job_id, array in self._arrays.items():
+                statuses[job_id] = array.status(self.name)
+        return statuses
+
+    def state_count(self):
+        """
+            :return: the number of jobs in each state, formatted like the
+                pbs_server state_count attribute
+        """
+        names = [('Transit', None), ('Queued', 'Q'), ('Held', 'H'),
+                 ('Waiting', 'W'), ('Running', 'R'), ('Exiting', 'E'),
+                 ('Complete', 'C')]
+        with self._lock:
+            states = [job.state for job in self._jobs.values()]
+        return " ".join("{0}:{1}".format(name, states.count(state))
+                        for name, state in names) + " "
+
+    # control of the emulator itself
+
+    def wait(self, timeout=None):
+        """
+            wait for every job to complete
+            :param timeout: seconds to wait, None to wait forever
+            :return: True if all of the jobs completed
+        """
+        if not self.run_jobs:
+            return False
+        start = time.time()
+        while True:
+            with self._lock:
+                if all(job.state == 'C' for job in self._jobs.values()):
+                    return True
+            if timeout is not None and time.time() - start > timeout:
+                return False
+            time.sleep(self.poll_interval)
+
+    def shutdown(self):
+        """
+            stop the scheduler and kill any running jobs
+        """
+        with self._lock:
+            self._shutdown = True
+            for job in self._jobs.values():
+                if job.process is not None and job.process.poll() is None:
+                    self._kill(job)
+        if self._thread is not None:
+            self._thread.join()
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+    # scheduler
+
+    def _start_thread(self):
+        if self.run_jobs and self._thread is None:
+            self._thread = threading.Thread(target=self._scheduler,
+                                            name="torque_emulator")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _scheduler(self):
+        while True:
+            with self._lock:
+                if self._shutdown:
+                    return
+                self._read_qdel_requests()
+                self._check_running()
+                self._check_dependencies()
+                self._start_jobs()
+                self._purge_completed()
+            time.sleep(self.poll_interval)
+
+    def _read_qdel_requests(self):
+        if not os.path.exists(self._qdel_requests):
+            return
+        with open(self._qdel_requests) as f:
+            f.seek(self._qdel_offset)
+            lines = f.readlines()
+            # only consume complete lines
+            if lines and not lines[-1].endswith('\n'):
+                lines.pop()
+            self._qdel_offset += sum(len(line) for line in lines)
+        for line in lines:
+            self.delete(line.strip())
+
+    def _check_running(self):
+        now = time.time()
+        for job in self._jobs.values():
+            if job.state == 'R':
+                if job.walltime and not job.walltime_exceeded and \
+                        now - job.start_time > _walltime_seconds(job.walltime):
+                    job.walltime_exceeded = True
+                    self._kill(job)
+                returncode = job.process.poll()
+                if returncode is None:
+                    continue
+                job.end_time = now
+                if job.walltime_exceeded:
+                    job.exit_status = _WALLTIME_EXIT_STATUS
+                elif returncode < 0:
+                    job.exit_status = _SIGNAL_EXIT_BASE - returncode
+                else:
+                    job.exit_status = returncode
+                self._running -= 1
+                self._start_epilogue(job)
+            elif job.state == 'E':
+                if job.process is None or job.process.poll() is not None:
+                    job.process = None
+                    job.state = 'C'
+
+    def _check_dependencies(self):
+        for job in self._jobs.values():
+            if job.state in ('Q', 'H', 'W') and self._dependency_failed(job):
+                self._delete(job)
+
+    def _start_jobs(self):
+        now = time.time()
+        eligible = []
+        for job in self._jobs.values():
+            if job.state not in ('Q', 'H', 'W'):
+                continue
+            if job.hold or not self._dependencies_met(job):
+                job.state = 'H'
+            elif job.execution_time is not None and job.execution_time > now:
+                job.state = 'W'
+            else:
+                job.state = 'Q'
+                eligible.append(job)
+
+        eligible.sort(key=lambda j: (-j.priority, j.seq, j.index))
+        for job in eligible:
+            if self._running >= self.max_running:
+                break
+            array = job.array
+            if array is not None and array.slot_limit is not None and \
+                    sum(1 for e in array.elements if e.state == 'R') >= array.slot_limit:
+                continue
+            self._start(job)
+
+    def _purge_completed(self):
+        if self.keep_completed is None:
+            return
+        now = time.time()
+        for job in list(self._jobs.values()):
+            if job.state != 'C' or now - (job.end_time or now) < self.keep_completed:
+                continue
+            if job.array is not None and job.array.state != 'C':
+                continue
+            self._completed[job.job_id] = job.exit_status
+            del self._jobs[job.job_id]
+            if job.array is not None and job.array.job_id in self._arrays:
+                self._completed[job.array.job_id] = (
+                    0 if all(e.exit_status == 0 for e in job.array.elements)
+                    else 1)
+                del self._arrays[job.array.job_id]
+
+    # helpers, called with the lock held
+
+    def _known(self, job_id):
+        return (job_id in self._jobs or job_id in self._arrays or
+                job_id in self._completed)
+
+    def _lookup(self, job_id):
+        if job_id in self._arrays:
+            return self._arrays[job_id].elements
+        if job_id in self._jobs:
+            return [self._jobs[job_id]]
+        return None
+
+    def _dependency_exit_statuses(self, job):
+        for dep_type, dep_id in job.depends:
+            if dep_id in self._completed:
+                yield 'C', self._completed[dep_id]
+                continue
+            for dep in self._lookup(dep_id) or []:
+                yield dep.state, dep.exit_status
+
+    def _dependencies_met(self, job):
+        return all(state == 'C' and exit_status == 0 for state, exit_status
+                   in self._dependency_exit_statuses(job))
+
+    def _dependency_failed(self, job):
+        return any(state == 'C' and exit_status != 0 for state, exit_status
+                   in self._dependency_exit_statuses(job))
+
+    def _environment(self, job):
+        env = dict(os.environ)
+        for item in job.attributes.get('Variable_List', '').split(','):
+            if '=' in item:
+                name, value = item.split('=', 1)
+                env[name] = value
+        env['PBS_JOBID'] = job.job_id
+        env['PBS_JOBNAME'] = job.name
+        env['PBS_QUEUE'] = job.attributes.get('queue', 'batch')
+        env['PBS_ENVIRONMENT'] = 'PBS_BATCH'
+        env['PBS_SERVER'] = self.name
+        if job.index is not None:
+            env['PBS_ARRAYID'] = str(job.index)
+        env['PATH'] = self.spool_dir + ':' + env.get('PATH', '')
+        return env
+
+    def _start(self, job):
+        with open(job.output_path('Output_Path'), 'w') as stdout, \
+                open(job.output_path('Error_Path'), 'w') as stderr:
+            job.process = subprocess.Popen(['/bin/bash', job.script],
+                                           stdout=stdout, stderr=stderr,
+                                           cwd=os.path.expanduser('~'),
+                                           env=self._environment(job),
+                                           preexec_fn=os.setsid)
+        job.state = 'R'
+        job.start_time = time.time()
+        self._running += 1
+
+    def _start_epilogue(self, job):
+        job.state = 'E'
+        job.process = None
+        epilogue = job.resources.get('epilogue')
+        if not epilogue:
+            return
+
+        resource_list = ','.join("{0}={1}".format(k, v) for k, v
+                                 in sorted(job.resources.items())
+                                 if k != 'epilogue')
+        resources_used = "cput=00:00:00,mem=0kb,vmem=0kb,walltime={0}".format(
+            _format_walltime(job.end_time - job.start_time))
+        args = ['/bin/bash', epilogue, job.job_id, getpass.getuser(),
+                grp.getgrgid(os.getgid()).gr_name, job.name,
+                str(os.getpid()), resource_list, resources_used,
+                job.attributes.get('queue', 'batch'), '',
+                str(job.exit_status)]
+
+        # like Torque, the epilogue's output goes to the job's output files
+        with open(job.output_path('Output_Path'), 'a') as stdout, \
+                open(job.output_path('Error_Path'), 'a') as stderr:
+            job.process = subprocess.Popen(args, stdout=stdout, stderr=stderr,
+                                           cwd=os.path.expanduser('~'),
+                                           env=self._environment(job),
+                                           preexec_fn=os.setsid)
+
+    def _delete(self, job):
+        if job.state == 'R':
+            # the job's exit status and epilogue are handled once it exits
+            self._kill(job)
+        elif job.state in ('Q', 'H', 'W'):
+            job.state = 'C'
+            job.end_time = time.time()
+
+    @staticmethod
+    def _kill(job):
+        try:
+            os.killpg(job.process.pid, signal.SIGTERM)
+        except OSError:
+            # already exited
+            pass
@@ -0,0 +1,130 @@
+# Copyright 2016 The Jackson Laboratory
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+torque_emulator/pbs.py
+
+the subset of the pbs_python pbs module used by civet, implemented on top
+of the in-process emulated pbs_server in emulator.py
+"""
+
+import threading
+
+import emulator
+
+
+ATTR_l = 'Resource_List'
+ATTR_v = 'Variable_List'
+ATTR_N = 'Job_Name'
+ATTR_o = 'Output_Path'
+ATTR_e = 'Error_Path'
+ATTR_depend = 'depend'
+ATTR_h = 'Hold_Types'
+ATTR_m = 'Mail_Points'
+ATTR_M = 'Mail_Users'
+ATTR_a = 'Execution_Time'
+ATTR_p = 'Priority'
+ATTR_t = 'job_array_request'
+
+_connections = {}
+_connection_seq = [0]
+_lock = threading.Lock()
+_error = threading.local()
+
+
+class attropl(object):
+    def __init__(self):
+        self.name = None
+        self.resource = None
+        self.value = None
+        self.op = None
+
+
+def new_attropl(n):
+    return [attropl() for _ in range(n)]
+
+
+def _set_error(code, message=''):
+    _error.value = (code, message)
+
+
+def error():
+    """
+        :return: (error code, error message) for the last failed request made
+            by this thread
+    """
+    return getattr(_error, 'value', (0, ''))
+
+
+def pbs_default():
+    return emulator.DEFAULT_SERVER
+
+
+def pbs_connect(server):
+    with _lock:
+        _connection_seq[0] += 1
+        _connections[_connection_seq[0]] = emulator.get_server(server)
+        return _connection_seq[0]
+
+
+def pbs_disconnect(connection):
+    with _lock:
+        _connections.pop(connection, None)
+    return 0
+
+
+def _server(connection):
+    with _lock:
+        return _connections.get(connection)
+
+
+def pbs_submit(connection, attrs, script, queue, extend):
+    server = _server(connection)
+    if server is None:
+        _set_error(emulator.PBSE_PROTOCOL, "not connected")
+        return None
+
+    attributes = {}
+    resources = {}
+    for attr in attrs:
+        if attr.name == ATTR_l:
+            resources[attr.resource] = attr.value
+        else:
+            attributes[attr.name] = attr.value
+
+    try:
+        with server.round_trip():
+            return server.submit(attributes, resources, script, queue)
+    except emulator.EmulatorError as e:
+        _set_error(e.code, str(e))
+        return None
+
+
+def _request(connection, request, *args):
+    server = _server(connection)
+    if server is None:
+        _set_error(emulator.PBSE_PROTOCOL, "not connected")
+        return emulator.PBSE_PROTOCOL
+    with server.round_trip():
+        rval = request(server, *args)
+    if rval:
+        _set_error(rval)
+    return rval
+
+
+def pbs_deljob(connection, job_id, extend):
+    return _request(connection, emulator.Server.delete, job_id)
+
+
+def pbs_rlsjob(connection, job_id, hold_type, extend):
+    return _request(connection, emulator.Server.release, job_id, hold_type)
@@ -18,6 +18,7 @@ from __future__ import print_function
 import os
 import errno
 import sys
+import threading
 import unicodedata
 
 # in a couple cases we need to differentiate between a string and some other
@@ -29,6 +30,11 @@ if sys.version_info[0] == 3:
 else:
     string_types = basestring,
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
 
 def make_sure_path_exists(path, mode=None):
     try:
@@ -83,3 +89,40 @@ def cleanup_command_line():
 def eval_boolean_string(s):
     upper_string = s.upper()
     return upper_string in ['TRUE', 'T', '1', 'Y', 'YES']
+
+
+def run_in_threads(func, items, max_workers):
+    """
+    call func(item) for every item, using up to max_workers threads. Returns
+    once every call has finished.  func is responsible for handling its own
+    exceptions; an exception escaping func ends that worker thread.
+
+    :param func: function taking a single item
+    :param items: list of items
+    :param max_workers: maximum number of concurrent calls
+    """
+    if max_workers <= 1 or len(items) <= 1:
+        for item in items:
+            func(item)
+        return
+
+    work = queue.Queue()
+    for item in items:
+        work.put(item)
+
+    def worker():
+        while True:
+            try:
+                item = work.get_nowait()
+            except queue.Empty:
+                return
+            func(item)
+
+    threads = []
+    for i in range(min(max_workers, len(items))):
+        t = threading.Thread(target=worker)
+        t.daemon = True
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()